@@ -0,0 +1,147 @@
+"""
+Handles the NDJSON archives of the feeds (e.g. farerskie_kadry.ndjson)
+
+The archive keeps the entities ordered from the newest to the oldest one, one JSON-encoded entity per line.
+It allows the incremental sync mode - only the posts that are newer than the ones already archived are fetched
+from the API and then merged into the archive.
+"""
+import io
+import json
+import logging
+import shutil
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import chain
+from os import path, replace
+from typing import Iterable, Iterator, Optional, Type
+
+from graph_api import ResponseEntity
+from metrics import timed
+from ndjson import encode_line
+from partitioned_archive import PartitionedArchive, is_partitioned
+
+# the newest entities (as many as the feeds show) are listed again on each update to refresh their image URLs,
+# the signed ones expire (see the oe= parameter)
+REFRESH_ITEMS = 30
+
+
+@dataclass
+class ArchiveState:
+    """
+    What do we already have in the archive
+    """
+    newest_created_time: Optional[datetime] = None
+    permalinks: set[str] = field(default_factory=set)
+
+
+def read_archive_state(archive_path: str) -> ArchiveState:
+    """
+    Returns the newest created_time and the set of permalinks stored in a given archive
+    """
+    state = ArchiveState()
+
+    if is_partitioned(archive_path):
+        archive = PartitionedArchive(archive_path)
+        return ArchiveState(newest_created_time=archive.newest_created_time(), permalinks=archive.permalinks())
+
+    if not path.exists(archive_path):
+        logging.info(f'No {archive_path} archive found, a full sync will be performed')
+        return state
+
+    with open(archive_path, 'rt') as fp:
+        for line in fp:
+            row = json.loads(line)
+            state.permalinks.add(row['permalink_url'])
+
+            created_time = datetime.fromisoformat(row['created_time'])
+            if state.newest_created_time is None or created_time > state.newest_created_time:
+                state.newest_created_time = created_time
+
+    logging.info(f'Read {len(state.permalinks)} entities from {archive_path} '
+                 f'(the newest one from {state.newest_created_time})')
+    return state
+
+
+def read_archive(archive_path: str, entity_class: Type[ResponseEntity]) -> Iterator[ResponseEntity]:
+    """
+    Yields the entities stored in a given archive, from the newest to the oldest one
+    """
+    if is_partitioned(archive_path):
+        for row in PartitionedArchive(archive_path).rows():
+            yield entity_class.from_dict(row)
+        return
+
+    with open(archive_path, 'rt') as fp:
+        for line in fp:
+            yield entity_class.from_dict(json.loads(line))
+
+
+def split_new(entities: Iterable[ResponseEntity], permalinks: set[str]) -> tuple[list, list]:
+    """
+    Splits the fetched entities into the new ones and the already archived ones (e.g. listed again by refresh=)
+    """
+    new, known = [], []
+
+    for entity in entities:
+        (known if entity.permalink_url in permalinks else new).append(entity)
+
+    return new, known
+
+
+@timed('file_write')
+def merge_into_archive(archive_path: str, entities: Iterable[ResponseEntity],
+                       refreshed: Iterable[ResponseEntity] = ()) -> int:
+    """
+    Puts new entities (ordered from the newest one) on top of the archive.
+
+    Lines that are already in the archive are copied as they are, without decoding them - apart from the lines
+    of the refreshed entities (e.g. with the new signed image URLs) that are replaced with their current version.
+    These are the newest ones, so only the top lines of the archive are decoded.
+
+    The archive file is replaced atomically (it is left untouched when nothing has changed).
+    Returns the number of entities added.
+
+    The partitioned archives (directories) are appended to instead, see partitioned_archive.py.
+    """
+    if is_partitioned(archive_path):
+        # the refreshed entities supersede the stored records
+        return PartitionedArchive(archive_path).append(chain(entities, refreshed))
+
+    entities = iter(entities)
+    first = next(entities, None)
+
+    pending = {entity.permalink_url: encode_line(entity.dict()) for entity in refreshed}
+    head = []
+    changed = 0
+
+    with open(archive_path, 'rt') if path.exists(archive_path) else io.StringIO() as fp:
+        # replace the lines of the refreshed entities
+        while pending:
+            line = fp.readline()
+            if not line:
+                break
+
+            updated = pending.pop(json.loads(line)['permalink_url'], line)
+            changed += updated != line
+            head.append(updated)
+
+        # nothing new, do not copy the whole archive
+        if first is None and not changed and path.exists(archive_path):
+            logging.info(f'No new entities for {archive_path}')
+            return 0
+
+        tmp_path = archive_path + '.tmp'
+        items_counter = 0
+
+        with open(tmp_path, 'wt') as out:
+            for entity in (chain([first], entities) if first is not None else entities):
+                items_counter += 1
+                out.write(encode_line(entity.dict()))
+
+            out.writelines(head)
+            shutil.copyfileobj(fp, out)
+
+    replace(tmp_path, archive_path)
+
+    logging.info(f'Added {items_counter} new entities to {archive_path} (refreshed {changed})')
+    return items_counter
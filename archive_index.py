@@ -0,0 +1,245 @@
+"""
+Sidecar index for the NDJSON archives (e.g. farerskie_kadry_2017.ndjson -> farerskie_kadry_2017.ndjson.idx)
+
+NDJSON stays the interchange format, the index keeps:
+
+* byte offsets of the lines sorted by created_time
+* permalink_url -> offset map
+* hashtag -> offsets inverted index (hashtags are lowercased)
+
+Readers mmap the archive and seek straight to the lines of a given date range or hashtag,
+iterating forward (chronologically) or backward without decoding the whole file.
+
+The index is updated incrementally - only the lines added to the archive since the last indexing are parsed,
+both when they were appended to the end of the file and when they were put on top of it (see archive.py).
+"""
+import bisect
+import hashlib
+import json
+import logging
+import mmap
+import os
+from typing import Iterator, Optional
+
+from utils import get_hashtags
+
+INDEX_VERSION = 1
+
+
+def line_digest(line: bytes) -> str:
+    return hashlib.sha1(line).hexdigest()
+
+
+class ArchiveIndex:
+    """
+    The index of a single NDJSON archive, kept in the sidecar JSON file
+    """
+    def __init__(self, archive_path: str):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.archive_path = archive_path
+        self.index_path = archive_path + '.idx'
+
+        self.size = 0  # how many bytes of the archive are indexed
+        self.head = None  # digest of the first line
+        self.tail = None  # digest of the last line
+        self.entries: list[tuple[str, int]] = []  # (created_time, offset), sorted
+        self.permalinks: dict[str, int] = {}
+        self.hashtags: dict[str, list[int]] = {}
+
+    def load(self) -> bool:
+        if not os.path.exists(self.index_path):
+            return False
+
+        with open(self.index_path, 'rt') as fp:
+            data = json.load(fp)
+
+        if data.get('version') != INDEX_VERSION:
+            return False
+
+        self.size, self.head, self.tail = data['size'], data['head'], data['tail']
+        self.entries = [tuple(entry) for entry in data['entries']]
+        self.permalinks = data['permalinks']
+        self.hashtags = data['hashtags']
+        return True
+
+    def save(self):
+        tmp_path = self.index_path + '.tmp'
+
+        with open(tmp_path, 'wt') as fp:
+            json.dump({
+                'version': INDEX_VERSION,
+                'size': self.size,
+                'head': self.head,
+                'tail': self.tail,
+                'entries': self.entries,
+                'permalinks': self.permalinks,
+                'hashtags': self.hashtags,
+            }, fp, ensure_ascii=False)
+
+        os.replace(tmp_path, self.index_path)
+
+    def _add_lines(self, data: mmap.mmap, start: int, end: int):
+        """
+        Indexes the lines in the [start, end) range of the archive
+        """
+        offset = start
+
+        while offset < end:
+            line_end = data.find(b'\n', offset, end)
+            line_end = end if line_end < 0 else line_end
+
+            row = json.loads(data[offset:line_end])
+            self.entries.append((row['created_time'], offset))
+            self.permalinks[row['permalink_url']] = offset
+
+            for hashtag in set(get_hashtags(row.get('message') or '')):
+                self.hashtags.setdefault(hashtag.lower(), []).append(offset)
+
+            offset = line_end + 1
+
+    def _shift(self, delta: int):
+        """
+        Moves all the offsets by delta bytes (when new lines were put on top of the archive)
+        """
+        self.entries = [(created_time, offset + delta) for created_time, offset in self.entries]
+        self.permalinks = {permalink: offset + delta for permalink, offset in self.permalinks.items()}
+        self.hashtags = {hashtag: [offset + delta for offset in offsets] for hashtag, offsets in self.hashtags.items()}
+
+    @staticmethod
+    def _first_line(data: mmap.mmap, start: int) -> bytes:
+        end = data.find(b'\n', start)
+        return data[start:end if end >= 0 else len(data)]
+
+    @staticmethod
+    def _last_line(data: mmap.mmap, end: int) -> bytes:
+        # skip the trailing new line
+        start = data.rfind(b'\n', 0, end - 1) + 1
+        return data[start:end].rstrip(b'\n')
+
+    def is_current(self, data: mmap.mmap) -> bool:
+        """
+        Is the index up to date with the archive
+        """
+        return self.size == len(data) and bool(self.entries) and self.head == line_digest(self._first_line(data, 0))
+
+    def update(self, data: mmap.mmap) -> int:
+        """
+        Brings the index up to date with the archive. Returns the number of lines indexed.
+        """
+        lines_before = len(self.entries)
+        size = len(data)
+
+        if size >= self.size > 0 and self.head == line_digest(self._first_line(data, 0)) \
+                and self.tail == line_digest(self._last_line(data, self.size)):
+            # new lines were appended to the archive
+            self._add_lines(data, self.size, size)
+
+        elif size >= self.size > 0 and self.head == line_digest(self._first_line(data, size - self.size)) \
+                and self.tail == line_digest(self._last_line(data, size)):
+            # new lines were put on top of the archive
+            delta = size - self.size
+            self._shift(delta)
+            self._add_lines(data, 0, delta)
+
+        else:
+            self.logger.info(f'Building the {self.index_path} index from scratch')
+            lines_before = 0
+            self.entries, self.permalinks, self.hashtags = [], {}, {}
+            self._add_lines(data, 0, size)
+
+        self.entries.sort()
+
+        created_time_by_offset = {offset: created_time for created_time, offset in self.entries}
+        for offsets in self.hashtags.values():
+            offsets.sort(key=created_time_by_offset.__getitem__)
+
+        self.size = size
+        self.head = line_digest(self._first_line(data, 0)) if size else None
+        self.tail = line_digest(self._last_line(data, size)) if size else None
+
+        return len(self.entries) - lines_before
+
+
+class IndexedArchive:
+    """
+    Provides the indexed, read-only access to the NDJSON archive. Use it as a context manager.
+    """
+    def __init__(self, archive_path: str):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.archive_path = archive_path
+
+        self.index = ArchiveIndex(archive_path)
+        self._fp = None
+        self._data: Optional[mmap.mmap] = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        """
+        Maps the archive into the memory and updates its index when needed
+
+        Raises ValueError for the year-partitioned archives (directories, see partitioned_archive.py).
+        """
+        if os.path.isdir(self.archive_path) or self.archive_path.endswith(('/', os.sep)):
+            raise ValueError(f'{self.archive_path} is a partitioned archive, export it to a single NDJSON file first '
+                             f'(python partitioned_archive.py export {self.archive_path} <file>)')
+
+        self._fp = open(self.archive_path, 'rb')
+        size = os.fstat(self._fp.fileno()).st_size
+
+        # an empty file can not be mapped
+        self._data = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+        self.index.load()
+
+        if size and not self.index.is_current(self._data):
+            added = self.index.update(self._data)
+            self.index.save()
+            self.logger.info(f'Indexed {added} new lines of {self.archive_path}')
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        if self._fp:
+            self._fp.close()
+
+    def row_at(self, offset: int) -> dict:
+        end = self._data.find(b'\n', offset)
+        return json.loads(self._data[offset:end if end >= 0 else len(self._data)])
+
+    def __len__(self) -> int:
+        return len(self.index.entries)
+
+    def rows(self, since: Optional[str] = None, until: Optional[str] = None, reverse: bool = False) -> Iterator[dict]:
+        """
+        Yields the rows with created_time within the [since, until) range (e.g. '2017-04-01'),
+        the oldest first (or the newest first when reverse=True)
+        """
+        entries = self.index.entries
+
+        start = bisect.bisect_left(entries, (since,)) if since else 0
+        end = bisect.bisect_left(entries, (until,)) if until else len(entries)
+
+        indices = range(end - 1, start - 1, -1) if reverse else range(start, end)
+
+        for idx in indices:
+            yield self.row_at(entries[idx][1])
+
+    def by_hashtag(self, hashtag: str, reverse: bool = False) -> Iterator[dict]:
+        """
+        Yields the rows with a given hashtag (with or without the leading #), the oldest first
+        """
+        offsets = self.index.hashtags.get(hashtag.lstrip('#').lower(), [])
+
+        for offset in (reversed(offsets) if reverse else offsets):
+            yield self.row_at(offset)
+
+    def get(self, permalink_url: str) -> Optional[dict]:
+        offset = self.index.permalinks.get(permalink_url)
+        return self.row_at(offset) if offset is not None else None
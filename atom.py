@@ -0,0 +1,96 @@
+"""
+Renders the Atom feed for a given list of items from Facebook or Instagram
+
+https://www.rfc-editor.org/rfc/rfc4287
+https://validator.w3.org/feed/docs/atom.html
+"""
+import io
+import logging
+from datetime import datetime, timezone
+from typing import Iterable, Optional, TextIO
+from xml.sax.saxutils import escape as escape_xml, quoteattr
+
+from rss import RssFeedItem, replace_if_changed, RSS_GENERATOR
+
+
+def to_rfc3339(published: datetime) -> str:
+    # naive datetimes are treated the same way as in RssFeedWriter.add_item()
+    return datetime.fromtimestamp(published.timestamp(), tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class AtomFeedWriter:
+    """
+    Class responsible for writing Atom feeds to a given text stream (can be a file)
+
+    The feed's <updated> element is the date of its newest entry, hence the entries are written when the writer is closed.
+    """
+    def __init__(self, out: TextIO, title: str, link: str, description: Optional[str], path: Optional[str] = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.out = out
+        self.title = title
+        self.link = link
+        self.description = description
+
+        self.path = path
+        self.changed: Optional[bool] = None
+
+        self.items: list[RssFeedItem] = []
+
+    @classmethod
+    def for_file(cls, path: str, title: str, link: str, description: Optional[str]) -> 'AtomFeedWriter':
+        """
+        Renders the feed to the memory buffer, the file is replaced on close only when its content has changed
+        """
+        return cls(out=io.StringIO(), title=title, link=link, description=description, path=path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.write()
+
+        if self.path and exc_type is None:
+            self.changed = replace_if_changed(self.path, self.out.getvalue())
+            self.logger.info(f'{self.path} ' + ('written' if self.changed else 'is up to date, not rewriting it'))
+
+    def add_item(self, item: RssFeedItem) -> None:
+        self.items.append(item)
+
+    def add_items(self, items: Iterable[RssFeedItem]) -> int:
+        count = len(self.items)
+        self.items.extend(items)
+        return len(self.items) - count
+
+    def write(self):
+        dates = [item.published for item in self.items if item.published]
+        updated = to_rfc3339(max(dates)) if dates else None
+
+        lines = [
+            '<?xml version="1.0" encoding="UTF-8" ?>',
+            '<feed xmlns="http://www.w3.org/2005/Atom">',
+            f' <title>{escape_xml(self.title)}</title>',
+            f' <link href={quoteattr(self.link)} />',
+            f' <id>{escape_xml(self.link)}</id>',
+            f' <subtitle>{escape_xml(self.description)}</subtitle>' if self.description else '',
+            f' <updated>{updated}</updated>' if updated else '',
+            f' <generator>{escape_xml(RSS_GENERATOR)}</generator>',
+        ]
+
+        for item in self.items:
+            published = to_rfc3339(item.published) if item.published else updated
+
+            lines += [
+                ' <entry>',
+                f'  <title>{escape_xml(item.title)}</title>',
+                f'  <link href={quoteattr(item.link)} />',
+                f'  <id>{escape_xml(item.link)}</id>',
+                f'  <published>{published}</published>' if published else '',
+                f'  <updated>{published}</updated>' if published else '',
+                f'  <content type="html">{escape_xml(item.description)}</content>',
+                ' </entry>',
+            ]
+
+        lines.append('</feed>')
+
+        self.out.writelines([line + "\n" for line in lines])
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Saves all posts from a given year of the Facebook page to the NDJSON file (e.g. farerskie_kadry_2017.ndjson)
+#
+# The crawl can be resumed - the paging cursor is saved in the *.checkpoint file after each page.
+#
+# Usage: python backfill.py 2017
+#
+# Multiple years can be crawled concurrently (one worker per year) into a single file:
+#
+# Usage: python backfill.py 2015 2018
+import logging
+import sys
+from datetime import datetime
+from os import getenv, path
+
+from dotenv import load_dotenv
+
+from checkpoint import Checkpoint
+from facebook import get_facebook_feed, get_facebook_feed_sharded
+from pipeline import fan_out, NdjsonSink
+
+
+def backfill_year(feed_name: str, access_token: str, year: int, output_path: str):
+    checkpoint_path = output_path + '.checkpoint'
+
+    # keep what has already been saved when resuming the crawl, the checkpoint truncates the file
+    # to its saved offset (or to zero when it was saved for a different crawl)
+    with open(output_path, 'at' if path.exists(checkpoint_path) else 'wt') as fp:
+        fan_out(
+            get_facebook_feed(feed_name, access_token, year=year, checkpoint=Checkpoint(checkpoint_path, output=fp)),
+            sinks=[NdjsonSink(fp)]
+        )
+
+
+def backfill_years(feed_name: str, access_token: str, since_year: int, until_year: int, output_path: str):
+    with open(output_path, 'wt') as fp:
+        fan_out(
+            get_facebook_feed_sharded(
+                feed_name, access_token, since=datetime(since_year, 1, 1), until=datetime(until_year + 1, 1, 1)
+            ),
+            sinks=[NdjsonSink(fp)]
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()  # take environment variables from .env.
+
+    token = getenv('FB_TOKEN', default='')
+    years = [int(arg) for arg in sys.argv[1:3]]
+
+    if len(years) == 1:
+        backfill_year(
+            feed_name='FarerskieKadry', access_token=token, year=years[0],
+            output_path=f'farerskie_kadry_{years[0]}.ndjson'
+        )
+    else:
+        backfill_years(
+            feed_name='FarerskieKadry', access_token=token, since_year=years[0], until_year=years[1],
+            output_path=f'farerskie_kadry_{years[0]}_{years[1]}.ndjson'
+        )
+
+    logging.info('Done')
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the entities: per-item cost and memory of 100k synthetic Facebook posts
+
+Compares the slotted, lazily-decoded FacebookPost with the previous dataclass-based implementation for:
+
+* from_api - creating the entities out of the API entries
+* dict - serialising them to the NDJSON dicts
+* from_dict - reading them back from the NDJSON archive rows
+* rfc822_date - formatting the RSS pubDate (twice, as the RSS and the digest of the feed need it)
+* memory - tracemalloc'ed size of the list of the entities read from the archive
+
+Usage: python benchmark_entities.py --count 100000
+"""
+import argparse
+import dataclasses
+import json
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from email.utils import formatdate
+from time import strptime
+from typing import Callable, Optional
+
+from facebook import FacebookPost
+from graph_api import DATE_FORMAT
+
+
+@dataclasses.dataclass
+class LegacyPost:
+    """
+    The dataclass-based entity (as it was implemented before)
+    """
+    message: str
+    permalink_url: str
+    full_picture: str
+    created_time: datetime
+    link: Optional[str]
+
+    def dict(self) -> dict:
+        return {
+            k: str(v) if v is not None else None
+            for k, v in dataclasses.asdict(self).items()
+        }
+
+    @classmethod
+    def from_api_entry(cls, post: dict):
+        return cls(
+            message=post.get('message', ''),
+            permalink_url=post.get('permalink_url'),
+            full_picture=post.get('full_picture'),
+            created_time=datetime(*(strptime(post.get('created_time'), DATE_FORMAT)[0:6])),
+            link=None
+        )
+
+    @classmethod
+    def from_dict(cls, row: dict):
+        values = {field.name: row.get(field.name) for field in dataclasses.fields(cls)}
+        values['created_time'] = datetime.fromisoformat(values['created_time'])
+
+        return cls(**values)
+
+    @property
+    def rfc822_date(self) -> str:
+        return formatdate(float(self.created_time.strftime('%s')))
+
+
+def api_entries(count: int) -> list[dict]:
+    newest = datetime(2026, 8, 17, 11, 16, 50)
+
+    return [
+        {
+            'id': f'756683176461261_{idx}',
+            'message': f'#FarerskiDziennikZPodróży Post number {idx}\n\nWith the second paragraph',
+            'permalink_url': f'https://www.facebook.com/756683176461261/posts/{idx}',
+            'full_picture': f'https://scontent.xx.fbcdn.net/v/t39.30808-6/{idx}_n.jpg?stp=dst-jpg_s960x960_tt6',
+            'created_time': (newest - timedelta(minutes=idx)).strftime(DATE_FORMAT),
+        }
+        for idx in range(count)
+    ]
+
+
+def measure(func: Callable[[], object], count: int) -> float:
+    """
+    Returns the per-item cost (in microseconds) of a given function
+    """
+    started = time.perf_counter()
+    func()
+    return round((time.perf_counter() - started) / count * 1e6, 3)
+
+
+def memory_kb(func: Callable[[], object]) -> float:
+    tracemalloc.start()
+    result = func()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del result
+    return round(size / 1024, 1)
+
+
+def run_benchmark(entity_class, entries: list[dict]) -> dict:
+    count = len(entries)
+
+    entities = [entity_class.from_api_entry(entry) for entry in entries]
+    rows = [json.loads(json.dumps(entity.dict())) for entity in entities]
+
+    return {
+        'entity': entity_class.__name__,
+        'count': count,
+        'from_api_us': measure(lambda: [entity_class.from_api_entry(entry) for entry in entries], count),
+        'dict_us': measure(lambda: [entity.dict() for entity in entities], count),
+        'from_dict_us': measure(lambda: [entity_class.from_dict(row) for row in rows], count),
+        'rfc822_date_us': measure(lambda: [(entity.rfc822_date, entity.rfc822_date) for entity in entities], count),
+        'memory_kb': memory_kb(lambda: [entity_class.from_dict(row) for row in rows]),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks the entities')
+    parser.add_argument('--count', type=int, default=100_000)
+    args = parser.parse_args()
+
+    synthetic_entries = api_entries(args.count)
+
+    for entity in (LegacyPost, FacebookPost):
+        print(json.dumps(run_benchmark(entity, synthetic_entries)))
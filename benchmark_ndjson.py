@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark of the NDJSON archive encoding and decoding
+
+Writes and then reads back the synthetic Facebook posts with:
+
+* json_dump - json.dump(..., sort_keys=True) and a separate write of the new line for each entity (as before)
+* plain - ndjson.NdjsonWriter with the buffered bulk writes
+* gzip / zstd - the compressed frames (zstd is skipped when the zstandard package is not installed)
+
+and reports MB/s (of the uncompressed NDJSON) and the size of the file.
+
+Usage: python benchmark_ndjson.py --count 300000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Callable
+
+import ndjson
+from benchmark_entities import api_entries
+from facebook import FacebookPost
+
+
+def json_dump(entities: list, path: str):
+    with open(path, 'wt') as out:
+        for entity in entities:
+            json.dump(entity.dict(), sort_keys=True, fp=out)
+            out.write("\n")
+
+
+def json_load(path: str) -> int:
+    with open(path, 'rt') as fp:
+        return sum(1 for line in fp if json.loads(line))
+
+
+def ndjson_writer(compression):
+    def write(entities: list, path: str):
+        with ndjson.NdjsonWriter.open(path, compression=compression) as writer:
+            writer.write_entities(entities)
+
+    return write
+
+
+def ndjson_reader(compression):
+    def read(path: str) -> int:
+        return sum(1 for _ in ndjson.read_rows(path, compression=compression))
+
+    return read
+
+
+def timed(func: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def run_benchmark(count: int) -> list[dict]:
+    entities = [FacebookPost.from_api_entry(entry) for entry in api_entries(count)]
+
+    modes = {
+        'json_dump': (json_dump, json_load),
+        'plain': (ndjson_writer(None), ndjson_reader(None)),
+        'gzip': (ndjson_writer('gzip'), ndjson_reader('gzip')),
+    }
+
+    if ndjson.zstandard is not None:
+        modes['zstd'] = (ndjson_writer('zstd'), ndjson_reader('zstd'))
+
+    results = []
+    raw_size = None
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for mode, (write, read) in modes.items():
+            path = os.path.join(work_dir, f'{mode}.ndjson')
+
+            write_time = timed(lambda: write(entities, path))
+            read_time = timed(lambda: read(path))
+
+            file_size = os.path.getsize(path)
+            raw_size = raw_size or file_size  # the json_dump output is not compressed
+
+            results.append({
+                'mode': mode,
+                'count': count,
+                'write_mb_per_sec': round(raw_size / write_time / 1e6, 1),
+                'read_mb_per_sec': round(raw_size / read_time / 1e6, 1),
+                'file_size_kb': round(file_size / 1024, 1),
+            })
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks the NDJSON encoding')
+    parser.add_argument('--count', type=int, default=300_000)
+    args = parser.parse_args()
+
+    for result in run_benchmark(args.count):
+        print(json.dumps(result))
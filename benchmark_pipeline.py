@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the feeds update pipeline run against the local fake Graph API
+
+Reports the wall time, the number of API requests, items per second and the peak of the memory allocated
+by the scenario (traced with tracemalloc, the fake API server threads included) for:
+
+* serial - main.py and instagram.py equivalents run one after another (a full sync)
+* concurrent - update_feeds.py equivalent (both feeds fetched concurrently, a full sync)
+* incremental - update_feeds.py equivalent run once the archives are already there
+
+Usage: python benchmark_pipeline.py --pages 10 --latency 0.1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+import graph_api
+import instagram
+import main
+import update_feeds
+from fake_graph_api import FakeGraphApi, FakeGraphApiConfig
+from rate_limiter import RateLimiter
+
+
+def count_lines(file_path: str) -> int:
+    with open(file_path, 'rt') as fp:
+        return sum(1 for _ in fp)
+
+
+def run_scenario(name: str, fake_api: FakeGraphApi, work_dir: str, scenario: Callable[[], None]) -> dict:
+    """
+    Runs a given scenario in the work directory and returns its stats
+    """
+    # each scenario starts with the fresh rate limiter state
+    graph_api.rate_limiter = RateLimiter()
+
+    requests_before = fake_api.requests_count
+    items_before = sum(count_lines(path) for path in ('farerskie_kadry.ndjson', 'farerskie_kadry_ig.ndjson')
+                       if os.path.exists(os.path.join(work_dir, path)))
+
+    # the process-wide peak RSS would include the previous scenarios
+    tracemalloc.reset_peak()
+
+    started = time.perf_counter()
+    scenario()
+    wall_time = time.perf_counter() - started
+
+    _, peak_alloc = tracemalloc.get_traced_memory()
+
+    items = sum(count_lines(path) for path in ('farerskie_kadry.ndjson', 'farerskie_kadry_ig.ndjson')) - items_before
+
+    return {
+        'scenario': name,
+        'wall_time': round(wall_time, 3),
+        'requests': fake_api.requests_count - requests_before,
+        'items': items,
+        'items_per_sec': round(items / wall_time, 1),
+        'peak_alloc_kb': peak_alloc // 1024,
+    }
+
+
+def serial_update():
+    main.update_feed(feed_name='FarerskieKadry', access_token='fake',
+                     archive_path='farerskie_kadry.ndjson', rss_path='docs/facebook.xml')
+
+    instagram.update_feed(
+        ig_account=instagram.ig_account_id_for_fb_page(fb_page='FarerskieKadry', access_token='fake'),
+        access_token='fake', archive_path='farerskie_kadry_ig.ndjson', rss_path='docs/instagram.xml'
+    )
+
+
+def concurrent_update():
+    asyncio.run(update_feeds.update_all_feeds(access_token='fake'))
+
+
+def clean_up():
+    for file_path in ('farerskie_kadry.ndjson', 'farerskie_kadry_ig.ndjson'):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def run_benchmark(config: FakeGraphApiConfig) -> list[dict]:
+    results = []
+
+    with FakeGraphApi(config) as fake_api, tempfile.TemporaryDirectory() as work_dir:
+        graph_api.GRAPH_API_URL = fake_api.url
+
+        os.chdir(work_dir)
+        os.mkdir('docs')
+
+        tracemalloc.start()
+
+        try:
+            results.append(run_scenario('serial', fake_api, work_dir, serial_update))
+            clean_up()
+
+            results.append(run_scenario('concurrent', fake_api, work_dir, concurrent_update))
+            results.append(run_scenario('incremental', fake_api, work_dir, concurrent_update))
+        finally:
+            tracemalloc.stop()
+
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+
+    parser = argparse.ArgumentParser(description='Benchmarks the feeds update pipeline')
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--fb-archive', help='NDJSON archive to serve as the Facebook feed')
+    parser.add_argument('--ig-archive', help='NDJSON archive to serve as the Instagram feed')
+    args = parser.parse_args()
+
+    for result in run_benchmark(FakeGraphApiConfig(
+        pages=args.pages, latency=args.latency,
+        fb_archive=os.path.abspath(args.fb_archive) if args.fb_archive else None,
+        ig_archive=os.path.abspath(args.ig_archive) if args.ig_archive else None,
+    )):
+        print(json.dumps(result))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark of the RSS rendering
+
+Renders the synthetic Facebook posts to the RSS feed (in the memory) with:
+
+* per_item - utils.response_entity_to_rss_item() and RssFeedWriter.add_item() called for each entity (as before)
+* batch - utils.response_entities_to_rss_items() and RssFeedWriter.add_items()
+
+checks that both outputs are byte-for-byte identical and reports items/sec.
+
+Usage: python benchmark_rss.py --count 100000
+"""
+import argparse
+import io
+import json
+import logging
+import time
+
+from benchmark_entities import api_entries
+from facebook import FacebookPost
+from rss import RssFeedWriter
+from utils import response_entities_to_rss_items, response_entity_to_rss_item
+
+
+def per_item(entities: list, feed: RssFeedWriter):
+    for entity in entities:
+        feed.add_item(response_entity_to_rss_item(entity))
+
+
+def batch(entities: list, feed: RssFeedWriter):
+    feed.add_items(response_entities_to_rss_items(entities))
+
+
+def run_benchmark(count: int) -> list[dict]:
+    results = []
+    outputs = []
+
+    for mode, render in (('per_item', per_item), ('batch', batch)):
+        # fresh entities, the RFC-822 dates are cached on them
+        entities = [FacebookPost.from_api_entry(entry) for entry in api_entries(count)]
+        feed = RssFeedWriter(out=io.StringIO(), title='Farerskie Kadry', link='https://farerskiekadry.pl/',
+                             description='Benchmark', path='benchmark.xml')
+
+        started = time.perf_counter()
+
+        with feed:
+            render(entities, feed)
+
+            # do not write the file
+            feed.path = None
+
+        elapsed = time.perf_counter() - started
+        outputs.append(feed.out.getvalue())
+
+        results.append({
+            'mode': mode,
+            'count': count,
+            'wall_time': round(elapsed, 3),
+            'items_per_sec': round(count / elapsed, 1),
+        })
+
+    assert outputs[0] == outputs[1], 'the batch rendering output differs'
+    return results
+
+
+if __name__ == "__main__":
+    # the per-item path logs each item at INFO level, keep it as in the production runs
+    logging.basicConfig(level=logging.INFO, filename='/dev/null')
+
+    parser = argparse.ArgumentParser(description='Benchmarks the RSS rendering')
+    parser.add_argument('--count', type=int, default=100_000)
+    args = parser.parse_args()
+
+    for result in run_benchmark(args.count):
+        print(json.dumps(result))
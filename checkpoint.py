@@ -0,0 +1,113 @@
+"""
+Persists the paging cursor of iterate_api_responses() so that long crawls can be resumed
+
+The checkpoint is saved after each page of the API response has been consumed. It stores the endpoint,
+the hash of the request parameters, the "after" cursor, the number of items emitted so far and the offset of
+the output stream. The output is flushed to the disk before the checkpoint is saved, so that after a failure
+the output can be truncated back to the state that matches the saved cursor.
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import IO, Optional
+
+# these parameters do not change what is being crawled
+IGNORED_PARAMS = {'access_token', 'after', 'limit', 'fields'}
+
+
+def params_hash(endpoint: str, req_params: dict) -> str:
+    """
+    Returns the hash of the endpoint and its parameters (the access token and the paging ones are skipped)
+    """
+    params = {
+        key: str(value)
+        for key, value in req_params.items()
+        if key not in IGNORED_PARAMS
+    }
+
+    return hashlib.sha1(json.dumps([endpoint, params], sort_keys=True).encode()).hexdigest()
+
+
+class Checkpoint:
+    """
+    The checkpoint of a single crawl stored in a JSON file
+    """
+    def __init__(self, path: str, output: Optional[IO] = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.path = path
+        self.output = output
+
+    def load(self) -> Optional[dict]:
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, 'rt') as fp:
+            return json.load(fp)
+
+    def resume(self, endpoint: str, req_params: dict) -> int:
+        """
+        Sets the saved "after" cursor in the request parameters and truncates the output stream
+        to the saved offset. Returns the number of items already emitted (zero when starting from scratch).
+
+        The output stream is truncated to zero when the checkpoint was saved for a different crawl.
+        """
+        state = self.load()
+
+        if state is None:
+            return 0
+
+        if state['endpoint'] != endpoint or state['params_hash'] != params_hash(endpoint, req_params):
+            self.logger.warning(f'{self.path} was saved for a different crawl ({state["endpoint"]}), ignoring it')
+
+            # the output belongs to that crawl, start from scratch
+            if self.output is not None:
+                self.output.seek(0)
+                self.output.truncate()
+
+            return 0
+
+        req_params['after'] = state['after']
+
+        if self.output is not None:
+            self.output.seek(state['output_offset'])
+            self.output.truncate()
+
+        self.logger.info(f'Resuming {endpoint} crawl after {state["items_emitted"]} items '
+                         f'(cursor: {state["after"]})')
+        return state['items_emitted']
+
+    def commit(self, endpoint: str, req_params: dict, items_emitted: int):
+        """
+        Flushes the output to the disk and then atomically saves the checkpoint
+        """
+        output_offset = None
+
+        if self.output is not None:
+            self.output.flush()
+            os.fsync(self.output.fileno())
+            output_offset = self.output.tell()
+
+        state = {
+            'endpoint': endpoint,
+            'params_hash': params_hash(endpoint, req_params),
+            'after': req_params.get('after'),
+            'items_emitted': items_emitted,
+            'output_offset': output_offset,
+        }
+
+        tmp_path = self.path + '.tmp'
+
+        with open(tmp_path, 'wt') as fp:
+            json.dump(state, fp)
+
+        os.replace(tmp_path, self.path)
+        self.logger.debug(f'Checkpoint saved: {state}')
+
+    def clear(self):
+        """
+        Removes the checkpoint once the crawl is completed
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,41 @@
+from datetime import datetime
+from functools import partial
+from typing import Optional, Type
+
+import pytest
+
+import graph_api
+from facebook import FacebookPost
+from graph_api import ResponseEntity
+from instagram import InstagramMedia
+from rate_limiter import RateLimiter
+
+PERMALINKS = {
+    FacebookPost: 'https://www.facebook.com/FarerskieKadry/posts/{:%Y%m%d%H%M%S}',
+    InstagramMedia: 'https://www.instagram.com/p/{:%Y%m%d%H%M%S}/',
+}
+
+
+def make_entity(entity_class: Type[ResponseEntity], created_time: datetime, message: str = 'Foo',
+                permalink_url: Optional[str] = None, full_picture: Optional[str] = None, **kwargs) -> ResponseEntity:
+    """
+    Returns the entity created at a given time, its permalink_url is derived from created_time unless it is given
+    """
+    return entity_class(message=message, permalink_url=permalink_url or PERMALINKS[entity_class].format(created_time),
+                        full_picture=full_picture, created_time=created_time, **kwargs)
+
+
+@pytest.fixture
+def make_post():
+    return partial(make_entity, FacebookPost, link=None)
+
+
+@pytest.fixture
+def make_media():
+    return partial(make_entity, InstagramMedia, like_count=None)
+
+
+@pytest.fixture
+def no_waiting(monkeypatch):
+    monkeypatch.setattr(graph_api, 'rate_limiter', RateLimiter(sleep_func=lambda _: None))
+    monkeypatch.setattr(graph_api, 'sleep', lambda _: None)
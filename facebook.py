@@ -2,22 +2,38 @@
 #
 # https://developers.facebook.com/docs/graph-api/reference/v2.0/post
 import logging
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Optional, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+from typing import AsyncIterator, Optional, Iterable, Union
 from urllib.parse import urlparse, parse_qs
 
-from graph_api import iterate_api_responses, created_time_field_to_datetime, ResponseEntity
+from checkpoint import Checkpoint
+from graph_api import iterate_api_responses, iterate_in_thread, lookup_ids, stop_at_known, ResponseEntity, \
+    MAX_IDS_PER_LOOKUP
+from metrics import metrics
+
+# enough to tell which posts are already archived
+LIGHT_FIELDS = ['created_time', 'permalink_url']
+
+# can be fetched for the new posts only (see hydrate=)
+HEAVY_FIELDS = ['full_picture', 'message', 'attachments{url}']
 
 
-@dataclass
 class FacebookPost(ResponseEntity):
-    link: Optional[str]
+    __slots__ = ('link',)
+
+    FIELDS = ResponseEntity.FIELDS + ('link',)
+
+    def __init__(self, message: str, permalink_url: str, full_picture: Optional[str],
+                 created_time: Union[datetime, str, None], link: Optional[str] = None):
+        super().__init__(message, permalink_url, full_picture, created_time)
+        self.link = link
 
     @staticmethod
     def from_api_entry(post: dict[str, str]):
         """
-        Creates a dataclass instance out of Facebook API response
+        Creates an instance out of Facebook API response (created_time is parsed lazily)
 
         https://developers.facebook.com/docs/graph-api/reference/v2.0/post#fields
         """
@@ -25,16 +41,71 @@ class FacebookPost(ResponseEntity):
             message=post.get('message', ''),  # can be empty if just re-sharing a post
             permalink_url=post.get('permalink_url'),
             full_picture=post.get('full_picture'),
-            created_time=created_time_field_to_datetime(post.get('created_time')),
+            created_time=post.get('created_time'),
             link=None
         )
 
 
-def get_facebook_feed(feed_name: str, token: str, items_limit = None, year: int = None) -> Iterable[FacebookPost]:
+def get_link(entry: dict) -> Optional[str]:
+    """
+    Returns the outgoing link of the post (the one with the l.facebook.com redirect)
+    """
+    try:
+        # 'attachments': {'data': [{'url': 'https://l.facebook.com/l.php?u=https%3A%2F%2Ffare ...
+        link = entry.get('attachments').get('data')[0].get('url')
+
+        if '//l.facebook.com' not in link:
+            raise KeyError
+
+        # parse the outgoing link
+        parsed = urlparse(link)
+        return parse_qs(parsed.query)['u'][0]
+
+    except (KeyError, AttributeError):
+        return None
+
+
+def hydrate_entries(entries: Iterable[dict], token: str, batch_size: int = MAX_IDS_PER_LOOKUP) -> Iterable[dict]:
+    """
+    Fetches the heavy fields of the listed posts (a batch of ids at a time) and yields the complete entries
+    """
+    entries = iter(entries)
+
+    while batch := list(islice(entries, batch_size)):
+        heavy = {
+            entry['id']: entry
+            for entry in lookup_ids(
+                (entry['id'] for entry in batch),
+                req_params={'fields': ','.join(HEAVY_FIELDS), 'access_token': token},
+                batch_size=batch_size
+            )
+        }
+
+        for entry in batch:
+            if entry['id'] in heavy:
+                yield {**entry, **heavy[entry['id']]}
+
+
+def get_facebook_feed(feed_name: str, token: str, items_limit = None, year: int = None,
+                      since: Optional[datetime] = None, known_permalinks: Optional[set[str]] = None,
+                      until: Optional[datetime] = None, checkpoint: Optional[Checkpoint] = None,
+                      hydrate: bool = False, refresh: int = 0) -> Iterable[FacebookPost]:
     """
     Returns all posts from a given Facebook feed.
 
     Pass year= to restrict to a single calendar year.
+
+    Pass since= (the newest created_time that is already archived) and known_permalinks=
+    to only fetch the posts that are not in the archive yet (incremental sync).
+    Pass refresh= to get that many newest posts even when they are archived already - the signed image URLs
+    (see the oe= parameter of full_picture) expire, so the archived ones need to be refreshed.
+    Pass until= to get only the posts published before a given time (since= and until= are in UTC).
+
+    Pass checkpoint= to make the crawl resumable (e.g. for the year= backfills).
+
+    Pass hydrate=True to list the posts with the light fields first (ids, created_time and permalinks)
+    and then fetch the heavy fields of the listed posts only (the new ones and the refreshed ones),
+    with the multi-id lookup (see graph_api.lookup_ids).
     """
     logger = logging.getLogger('get_facebook_feed')
     logger.info(f'Getting the "{feed_name}" FB feed (year={year or "all"}) ...')
@@ -45,40 +116,101 @@ def get_facebook_feed(feed_name: str, token: str, items_limit = None, year: int
     #  * You can only read a maximum of 100 feed posts with the limit field.
     #    If you try to read more than that you will get an error message to not exceed 100.
     params = {
-        'fields': ','.join(
-            ['full_picture', 'message', 'created_time', 'shares', 'permalink_url', 'attachments{url}']
-        ),
+        'fields': ','.join(LIGHT_FIELDS if hydrate else LIGHT_FIELDS + HEAVY_FIELDS),
         'limit': 100,
         'access_token': token,
     }
     if year:
         params['since'] = int(datetime(year, 1, 1).timestamp())
         params['until'] = int(datetime(year + 1, 1, 1).timestamp())
+    else:
+        # created_time values are in UTC
+        if since:
+            params['since'] = int(since.replace(tzinfo=timezone.utc).timestamp())
+        if until:
+            params['until'] = int(until.replace(tzinfo=timezone.utc).timestamp())
 
     feed = iterate_api_responses(
         endpoint=f"/v25.0/{feed_name}/feed",
         req_params=params,
         items_limit=items_limit,
+        stop_at=stop_at_known(known_permalinks, 'permalink_url', refresh=refresh),
+        # can be skipped when the API asks us to reduce the amount of data
+        heavy_fields=None if hydrate else ['attachments{url}'],
+        checkpoint=checkpoint,
     )
 
+    if hydrate:
+        feed = hydrate_entries(feed, token)
+
     for entry in feed:
         logger.debug(f'Post: {entry}')
 
-        try:
-            # 'attachments': {'data': [{'url': 'https://l.facebook.com/l.php?u=https%3A%2F%2Ffare ...
-            link = entry.get('attachments').get('data')[0].get('url')
+        post = FacebookPost.from_api_entry(entry)
+        post.link = get_link(entry)
 
-            if '//l.facebook.com' not in link:
-                raise KeyError
+        metrics.count('items.facebook')
+        yield post
 
-            # parse the outgoing link
-            parsed = urlparse(link)
-            link = parse_qs(parsed.query)['u'][0]
 
-        except (KeyError, AttributeError):
-            link = None
+def get_facebook_feed_async(*args, **kwargs) -> AsyncIterator[FacebookPost]:
+    """
+    asyncio variant of get_facebook_feed(), takes the same arguments
+    """
+    return iterate_in_thread(get_facebook_feed(*args, **kwargs))
 
-        post = FacebookPost.from_api_entry(entry)
-        post.link = link
 
-        yield post
+def time_windows(since: datetime, until: datetime, granularity: str = 'year') -> list[tuple[datetime, datetime]]:
+    """
+    Splits the [since, until) range into the yearly (or monthly) windows, the newest window comes first
+    """
+    windows = []
+    start = since
+
+    while start < until:
+        if granularity == 'month':
+            end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+        elif granularity == 'year':
+            end = datetime(start.year + 1, 1, 1)
+        else:
+            raise ValueError(f'Unsupported granularity: {granularity}')
+
+        windows.append((start, min(end, until)))
+        start = end
+
+    return list(reversed(windows))
+
+
+def get_facebook_feed_sharded(feed_name: str, token: str, since: datetime, until: datetime,
+                              granularity: str = 'year', workers: int = 4) -> Iterable[FacebookPost]:
+    """
+    Returns all posts from a given Facebook feed published within the [since, until) range.
+
+    The range is split into yearly (or monthly) windows that are crawled concurrently
+    (the HTTP session and the rate limiter are shared). Posts are yielded from the newest one,
+    duplicates (e.g. on the windows boundaries) are removed.
+    """
+    logger = logging.getLogger('get_facebook_feed_sharded')
+    windows = time_windows(since, until, granularity)
+
+    logger.info(f'Getting the "{feed_name}" FB feed from {since} to {until} '
+                f'({len(windows)} {granularity} windows, {workers} workers) ...')
+
+    def crawl_window(window: tuple[datetime, datetime]) -> list[FacebookPost]:
+        posts = list(get_facebook_feed(feed_name, token, since=window[0], until=window[1]))
+        logger.info(f'Got {len(posts)} posts from {window[0]} - {window[1]}')
+
+        # the feed is ranked, make sure the posts are ordered by the created_time (the newest first)
+        return sorted(posts, key=lambda post: post.created_time, reverse=True)
+
+    seen_permalinks = set()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # windows do not overlap, so yielding them one by one (the newest first) keeps the posts ordered
+        for posts in executor.map(crawl_window, windows):
+            for post in posts:
+                if post.permalink_url in seen_permalinks:
+                    continue
+
+                seen_permalinks.add(post.permalink_url)
+                yield post
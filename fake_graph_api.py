@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the https://graph.facebook.com API
+
+Serves the paged Facebook page feed, Instagram media and the page lookup used by ig_account_id_for_fb_page()
+with synthetic (or recorded, i.e. taken from the NDJSON archives) payloads. The number of pages, latency,
+usage headers and errors returned for given requests can be configured.
+
+Usage: python fake_graph_api.py --port 8080 --pages 10 --latency 0.2
+
+Then point graph_api.GRAPH_API_URL to http://127.0.0.1:8080
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlparse, parse_qs, quote
+
+from graph_api import DATE_FORMAT
+from retry import split_fields
+
+FB_PAGE_ID = '756683176461261'
+IG_ACCOUNT_ID = '17841407952879412'
+
+
+@dataclass
+class FakeGraphApiConfig:
+    """
+    How the fake API behaves
+    """
+    pages: int = 3  # how many pages of the default size are available
+    page_size: int = 25  # the default page size (when no limit is provided)
+    latency: float = 0.0  # seconds
+    usage: dict = field(default_factory=lambda: {'call_count': 5, 'total_time': 5, 'total_cputime': 5})
+    # maps the request number (starting from 1) to the Graph API error code to be returned
+    errors: dict[int, int] = field(default_factory=dict)
+    # recorded payloads taken from the NDJSON archives (synthetic ones are generated when not provided)
+    fb_archive: Optional[str] = None
+    ig_archive: Optional[str] = None
+
+
+def synthetic_posts(count: int, prefix: str) -> list[dict]:
+    """
+    Generates the entities in the format of the NDJSON archive, from the newest one
+    """
+    newest = datetime(2026, 8, 17, 11, 16, 50)
+
+    return [
+        {
+            'message': f'#{prefix}{idx} Synthetic post number {idx}\n\nWith the second paragraph & some <markup>',
+            'permalink_url': f'https://www.example.com/{prefix}/{idx}',
+            'full_picture': f'https://scontent.example.com/v/t39.30808-6/{idx}_{idx * 7}_{idx * 13}_n.jpg'
+                            f'?stp=dst-jpg_s960x960_tt6&_nc_cat=110&oh=00_AQ{idx}&oe=6A8F4EC4',
+            'created_time': str(newest - timedelta(hours=12 * idx)),
+            'link': None,
+            'like_count': str(idx % 50),
+        }
+        for idx in range(count)
+    ]
+
+
+def read_archive_rows(archive_path: str) -> list[dict]:
+    with open(archive_path, 'rt') as fp:
+        return [json.loads(line) for line in fp]
+
+
+def to_api_time(created_time: str) -> str:
+    return datetime.fromisoformat(created_time).strftime(DATE_FORMAT)
+
+
+def to_fb_entry(row: dict) -> dict:
+    entry = {
+        # e.g. 756683176461261_1698295875633315
+        'id': f"{FB_PAGE_ID}_{row['permalink_url'].rstrip('/').split('/')[-1]}",
+        'message': row['message'],
+        'permalink_url': row['permalink_url'],
+        'full_picture': row['full_picture'],
+        'created_time': to_api_time(row['created_time']),
+    }
+
+    if row.get('link'):
+        entry['attachments'] = {'data': [{'url': f'https://l.facebook.com/l.php?u={quote(row["link"], safe="")}'}]}
+
+    return entry
+
+
+def to_ig_entry(row: dict) -> dict:
+    return {
+        'id': row['permalink_url'].rstrip('/').split('/')[-1],
+        'caption': row['message'],
+        'permalink': row['permalink_url'],
+        'media_url': row['full_picture'],
+        'timestamp': to_api_time(row['created_time']),
+        'like_count': int(row.get('like_count') or 0),
+    }
+
+
+class FakeGraphApi:
+    """
+    Runs the fake API in a background thread, use it as a context manager
+    """
+    def __init__(self, config: Optional[FakeGraphApiConfig] = None, port: int = 0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.config = config or FakeGraphApiConfig()
+
+        items_count = self.config.pages * self.config.page_size
+        fb_rows = read_archive_rows(self.config.fb_archive) if self.config.fb_archive \
+            else synthetic_posts(items_count, 'fb')
+        ig_rows = read_archive_rows(self.config.ig_archive) if self.config.ig_archive \
+            else synthetic_posts(items_count, 'ig')
+
+        self.fb_entries = [to_fb_entry(row) for row in fb_rows]
+        self.ig_entries = [to_ig_entry(row) for row in ig_rows]
+
+        self._lock = threading.Lock()
+        self.requests_count = 0
+        self.bytes_sent = 0
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _next_request(self) -> int:
+        with self._lock:
+            self.requests_count += 1
+            return self.requests_count
+
+    def _page(self, entries: list[dict], params: dict, time_field: str) -> dict:
+        if 'since' in params or 'until' in params:
+            since = int(params.get('since', 0))
+            until = int(params.get('until', 2 ** 40))
+
+            entries = [
+                entry for entry in entries
+                if since <= datetime.strptime(entry[time_field], DATE_FORMAT).replace(tzinfo=timezone.utc).timestamp() <= until
+            ]
+
+        offset = int(params.get('after', 0))
+        limit = int(params.get('limit', self.config.page_size))
+        page = entries[offset:offset + limit]
+
+        resp = {'data': self._select_fields(page, params.get('fields'))}
+
+        if offset + limit < len(entries):
+            resp['paging'] = {'cursors': {'before': str(offset), 'after': str(offset + limit)}}
+
+        return resp
+
+    @staticmethod
+    def _select_fields(entries: list[dict], fields: Optional[str]) -> list[dict]:
+        if not fields:
+            return entries
+
+        # e.g. attachments{url} -> attachments
+        names = {name.split('{')[0] for name in split_fields(fields)} | {'id'}
+        return [{key: value for key, value in entry.items() if key in names} for entry in entries]
+
+    def handle(self, path: str, params: dict) -> tuple[int, dict]:
+        """
+        Returns the HTTP status code and the JSON response for a given request
+        """
+        error_code = self.config.errors.get(self._next_request())
+
+        if error_code is not None:
+            return (500 if error_code in (1, 2) else 400), {'error': {
+                'code': error_code, 'message': f'Injected error #{error_code}'
+            }}
+
+        parts = path.strip('/').split('/')[1:]  # skip the API version
+
+        if len(parts) == 2 and parts[1] == 'feed':
+            return 200, self._page(self.fb_entries, params, 'created_time')
+
+        if len(parts) == 2 and parts[1] == 'media':
+            return 200, self._page(self.ig_entries, params, 'timestamp')
+
+        if len(parts) == 1 and parts[0]:
+            return 200, {
+                'id': FB_PAGE_ID,
+                'name': parts[0],
+                'connected_instagram_account': {'id': IG_ACCOUNT_ID},
+            }
+
+        if not parts and 'ids' in params:
+            entries = {entry['id']: entry for entry in self.fb_entries + self.ig_entries}
+            return 200, {
+                entry_id: self._select_fields([entries[entry_id]], params.get('fields'))[0]
+                for entry_id in params['ids'].split(',') if entry_id in entries
+            }
+
+        return 404, {'error': {'code': 803, 'message': f'Unknown path: {path}'}}
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep the connections alive
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+                if api.config.latency:
+                    time.sleep(api.config.latency)
+
+                status, resp = api.handle(url.path, params)
+                body = json.dumps(resp).encode()
+
+                with api._lock:
+                    api.bytes_sent += len(body)
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=UTF-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('X-App-Usage', json.dumps(api.config.usage))
+                self.send_header('X-Page-Usage', json.dumps(api.config.usage))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, msg_format, *args):
+                api.logger.debug(msg_format, *args)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
+
+    parser = argparse.ArgumentParser(description='Local stand-in for the Graph API')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--pages', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--fb-archive', help='NDJSON archive to serve as the Facebook feed')
+    parser.add_argument('--ig-archive', help='NDJSON archive to serve as the Instagram feed')
+    args = parser.parse_args()
+
+    fake_api = FakeGraphApi(FakeGraphApiConfig(
+        pages=args.pages, latency=args.latency, fb_archive=args.fb_archive, ig_archive=args.ig_archive
+    ), port=args.port)
+
+    logging.info(f'Fake Graph API is listening on {fake_api.url}')
+    fake_api.server.serve_forever()
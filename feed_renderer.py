@@ -0,0 +1,324 @@
+"""
+Renders several feeds (RSS 2.0, Atom, JSON Feed) in a single pass over the entities stream
+
+Each output has its own items limit and filter. On top of that, feeds for the hashtags
+(see utils.get_first_hashtag, e.g. #FarerskiDziennikZPodróży) are derived from the same pass.
+Each entity is converted to the feed item only once, no matter how many feeds it ends up in.
+The images of these entities only are mirrored (see media_mirror.py).
+
+render_feeds() renders the feeds of a given archive, write_index() then generates docs/index.html
+listing all the feeds.
+"""
+import json
+import logging
+import os
+import unicodedata
+import xml.etree.ElementTree as ElementTree
+from dataclasses import dataclass
+from functools import partial
+from itertools import chain
+from typing import Callable, Iterable, Iterator, Optional, Type
+from xml.sax.saxutils import escape as escape_xml, quoteattr
+
+from archive import read_archive
+from atom import AtomFeedWriter
+from graph_api import ResponseEntity
+from json_feed import JsonFeedWriter
+from media_mirror import MediaMirror
+from partitioned_archive import is_partitioned
+from pipeline import Sink, fan_out
+from rss import RssFeedItem, RssFeedWriter, replace_if_changed
+from search_index import default_search_index
+from utils import get_first_hashtag, response_entity_to_rss_item
+
+WRITERS = {
+    'rss': RssFeedWriter,
+    'atom': AtomFeedWriter,
+    'json': JsonFeedWriter,
+}
+
+EXTENSIONS = {
+    'rss': '.xml',
+    'atom': '.atom',
+    'json': '.json',
+}
+
+FORMAT_NAMES = {
+    'rss': 'RSS',
+    'atom': 'Atom',
+    'json': 'JSON Feed',
+}
+
+
+@dataclass
+class FeedOutput:
+    """
+    A single feed to be rendered
+    """
+    path: str
+    title: str
+    link: str
+    description: Optional[str] = None
+    format: str = 'rss'
+    items_limit: int = 30
+    # the entities the skip callback returns True for still count towards the items limit
+    skip: Optional[Callable[[ResponseEntity], bool]] = None
+
+
+@dataclass
+class HashtagFeeds:
+    """
+    Per-hashtag feeds, written to the {directory}/{prefix}-{hashtag}.xml files
+
+    Only the hashtags that at least min_items entities start with get their feed.
+    """
+    directory: str
+    prefix: str
+    title: str
+    link: str
+    description: Optional[str] = None
+    format: str = 'rss'
+    items_limit: int = 30
+    min_items: int = 5
+    skip: Optional[Callable[[ResponseEntity], bool]] = None
+    # yields the entities with hashtags (the newest first) to derive the feeds from instead of the rendered ones,
+    # e.g. looked up via the search index, the main feeds then stop reading the archive after their last item
+    entities: Optional[Callable[[], Iterable[ResponseEntity]]] = None
+
+
+def feed_outputs(rss_path: str, title: str, link: str, description: Optional[str], items_limit: int = 30,
+                 skip: Optional[Callable[[ResponseEntity], bool]] = None) -> list[FeedOutput]:
+    """
+    Returns the RSS, Atom and JSON Feed outputs, e.g. docs/facebook.xml, docs/facebook.atom and docs/facebook.json
+    """
+    base_path, _ = os.path.splitext(rss_path)
+
+    return [
+        FeedOutput(path=rss_path if feed_format == 'rss' else base_path + extension, title=title, link=link,
+                   description=description, format=feed_format, items_limit=items_limit, skip=skip)
+        for feed_format, extension in EXTENSIONS.items()
+    ]
+
+
+def hashtag_slug(hashtag: str) -> str:
+    """
+    FarerskiDziennikZPodróży -> farerskidziennikzpodrozy (the slug is empty for e.g. the emoji-only hashtags)
+    """
+    folded = unicodedata.normalize('NFKD', hashtag.lower().replace('ł', 'l'))
+    return ''.join(char for char in folded if char.isascii() and (char.isalnum() or char in '-_'))
+
+
+class FeedRenderer(Sink):
+    """
+    Passes each entity to all the feeds it belongs to. Use it as a context manager, the feeds are written on exit.
+
+    Pass media_mirror= to point the images of the entities that end up in the feeds to their mirrored copies.
+    """
+    def __init__(self, outputs: list[FeedOutput], hashtag_feeds: Optional[HashtagFeeds] = None,
+                 media_mirror: Optional[MediaMirror] = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.outputs = outputs
+        self.hashtag_feeds = hashtag_feeds
+        self.media_mirror = media_mirror
+
+        self.writers = []
+        self.counters = [0] * len(outputs)
+
+        # the entities that end up in each output
+        self.selected: list[list[ResponseEntity]] = [[] for _ in outputs]
+
+        # hashtag slug -> (the hashtag as first seen, entities count, the entities that end up in the feed)
+        self.hashtags: dict[str, tuple[str, int, list[ResponseEntity]]] = {}
+
+        self.written: list[str] = []
+
+    def __enter__(self):
+        self.writers = [
+            WRITERS[output.format].for_file(
+                path=output.path, title=output.title, link=output.link, description=output.description
+            ).__enter__()
+            for output in self.outputs
+        ]
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        items = {}
+
+        if exc_type is None:
+            if self.hashtag_feeds and self.hashtag_feeds.entities:
+                for entity in self.hashtag_feeds.entities():
+                    self._add_to_hashtag_feed(entity)
+
+            items = self._render_items()
+
+            for writer, selected in zip(self.writers, self.selected):
+                writer.add_items(items[id(entity)] for entity in selected)
+
+        for writer in self.writers:
+            writer.__exit__(exc_type, exc_val, exc_tb)
+
+        self.written = [output.path for output in self.outputs]
+
+        if self.hashtag_feeds and exc_type is None:
+            self._write_hashtag_feeds(items)
+
+    def add(self, entity: ResponseEntity) -> None:
+        for idx, output in enumerate(self.outputs):
+            if self.counters[idx] >= output.items_limit:
+                continue
+
+            self.counters[idx] += 1
+
+            if output.skip and output.skip(entity):
+                continue
+
+            self.selected[idx].append(entity)
+
+        if self.hashtag_feeds and not self.hashtag_feeds.entities:
+            self._add_to_hashtag_feed(entity)
+
+    def _add_to_hashtag_feed(self, entity: ResponseEntity):
+        hashtag = get_first_hashtag(entity.message or '')
+
+        # e.g. #Tórshavn and #Torshavn end up in the same feed, the emoji-only hashtags get none
+        slug = hashtag_slug(hashtag) if hashtag else None
+        if not slug:
+            return
+
+        name, count, selected = self.hashtags.get(slug, (hashtag, 0, []))
+
+        if count < self.hashtag_feeds.items_limit and \
+                not (self.hashtag_feeds.skip and self.hashtag_feeds.skip(entity)):
+            selected.append(entity)
+
+        self.hashtags[slug] = (name, count + 1, selected)
+
+    def _selected_entities(self) -> Iterator[ResponseEntity]:
+        hashtag_entities = (selected for _, _, selected in self.hashtags.values())
+        return chain.from_iterable(chain(self.selected, hashtag_entities))
+
+    def _render_items(self) -> dict[int, RssFeedItem]:
+        """
+        Converts each selected entity to the feed item (once), returns them by the entity id()
+        """
+        entities = {id(entity): entity for entity in self._selected_entities()}
+
+        # the images are downloaded concurrently (a batch at a time)
+        mirrored = self.media_mirror.mirror_entities(entities.values()) if self.media_mirror else entities.values()
+
+        return {key: response_entity_to_rss_item(entity) for key, entity in zip(entities, mirrored)}
+
+    @property
+    def is_full(self) -> bool:
+        # the hashtag feeds need to see all the entities (unless they get them on their own)
+        return (self.hashtag_feeds is None or self.hashtag_feeds.entities is not None) and all(
+            counter >= output.items_limit for counter, output in zip(self.counters, self.outputs)
+        )
+
+    def _write_hashtag_feeds(self, items: dict[int, RssFeedItem]):
+        config = self.hashtag_feeds
+        os.makedirs(config.directory, exist_ok=True)
+
+        for slug, (name, count, selected) in self.hashtags.items():
+            if count < config.min_items:
+                continue
+
+            path = os.path.join(config.directory, f'{config.prefix}-{slug}{EXTENSIONS[config.format]}')
+
+            with WRITERS[config.format].for_file(
+                    path=path, title=f'{config.title}: #{name}', link=config.link, description=config.description
+            ) as writer:
+                writer.add_items(items[id(entity)] for entity in selected)
+
+            self.written.append(path)
+
+        self.logger.info(f'Rendered {len(self.written)} feeds')
+
+
+def render_feeds(archive_path: str, rss_path: str, entity_class: Type[ResponseEntity], channel: dict,
+                 skip: Optional[Callable[[ResponseEntity], bool]] = None, items_limit: int = 30):
+    """
+    Renders the RSS, Atom and JSON feeds (e.g. docs/facebook.xml) and the per-hashtag ones (in docs/tags)
+    out of a given archive, in a single pass. docs/index.html is updated then.
+
+    The images are mirrored when MEDIA_MIRROR_DIR is set. The per-hashtag feeds read the entities with hashtags
+    via the search index when SEARCH_INDEX_PATH is set (otherwise the whole archive is read).
+    """
+    search_index = default_search_index()
+    hashtag_entities = None
+
+    if search_index and not is_partitioned(archive_path):
+        search_index.update([archive_path])
+        hashtag_entities = partial(search_index.hashtag_entities, archive_path, entity_class)
+
+    with FeedRenderer(
+            outputs=feed_outputs(rss_path, items_limit=items_limit, skip=skip, **channel),
+            hashtag_feeds=HashtagFeeds(directory=os.path.join(os.path.dirname(rss_path), 'tags'),
+                                       prefix=os.path.splitext(os.path.basename(rss_path))[0],
+                                       skip=skip, entities=hashtag_entities, **channel),
+            media_mirror=MediaMirror.from_env()
+    ) as renderer:
+        fan_out(read_archive(archive_path, entity_class), sinks=[renderer])
+
+    write_index(os.path.dirname(rss_path))
+
+
+def read_feed_title(path: str) -> Optional[str]:
+    """
+    Returns the title of a given RSS, Atom or JSON feed file
+    """
+    try:
+        if path.endswith('.json'):
+            with open(path, 'rt') as fp:
+                return json.load(fp).get('title')
+
+        root = ElementTree.parse(path).getroot()
+        return root.findtext('channel/title') or root.findtext('{http://www.w3.org/2005/Atom}title')
+    except (OSError, ValueError, ElementTree.ParseError):
+        return None
+
+
+def write_index(docs_dir: str) -> bool:
+    """
+    Generates the index.html file listing all the feeds found in a given directory (and its subdirectories)
+    """
+    # the feed path without the extension -> (title, {format: path})
+    feeds: dict[str, tuple[str, dict[str, str]]] = {}
+
+    for directory, _, files in sorted(os.walk(docs_dir)):
+        for file_name in sorted(files):
+            path = os.path.join(directory, file_name)
+            feed_format = next((name for name, ext in EXTENSIONS.items() if file_name.endswith(ext)), None)
+            title = read_feed_title(path) if feed_format else None
+
+            if title:
+                base_path = os.path.splitext(os.path.relpath(path, docs_dir))[0]
+                feeds.setdefault(base_path, (title, {}))[1][feed_format] = path
+
+    items = []
+
+    for title, paths in feeds.values():
+        links = [
+            f'<a href={quoteattr("./" + os.path.relpath(paths[feed_format], docs_dir))}>{FORMAT_NAMES[feed_format]}</a>'
+            for feed_format in EXTENSIONS if feed_format in paths
+        ]
+        items.append(f'  <li>{escape_xml(title)}: {", ".join(links)}</li>')
+
+    lines = [
+        '<!DOCTYPE html>',
+        '<html lang="en">',
+        '<head>',
+        '    <meta charset="UTF-8">',
+        '    <title>Farerskie Kadry | RSS</title>',
+        '</head>',
+        '<body>',
+        '<h1>Kanały RSS dla <a href="https://farerskiekadry.pl/">farerskiekadry.pl</a></h1>',
+        '<ul>',
+        *items,
+        '</ul>',
+        '</body>',
+        '</html>',
+    ]
+
+    return replace_if_changed(os.path.join(docs_dir, 'index.html'), '\n'.join(lines) + '\n')
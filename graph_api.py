@@ -1,115 +1,391 @@
 # Provides a generic iterator over paged feeds from https://graph.facebook.com API,
 # handling both Facebook and Instagram.
-import dataclasses
+import asyncio
 import logging
 from datetime import datetime
+from email.utils import formatdate
+from itertools import count
 from time import strptime, sleep
-from typing import Iterable
+from typing import AsyncIterator, Callable, Iterable, Optional, TypeVar, Union
 
 from requests import Session
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 
+from checkpoint import Checkpoint
+from http_cache import default_response_cache
+from metrics import metrics, timed
+from rate_limiter import RateLimiter, app_scope
+from retry import RetryPolicy, GraphApiError, ErrorKind, PageSize, classify_error
+
+GRAPH_API_URL = 'https://graph.facebook.com'
+
 # keep the HTTP session
 http = Session()
 http.headers['user-agent'] = 'py-facebook-feed'
 
+# the session is shared by all the feeds updated concurrently (see orchestrator.py)
+for _prefix in ('https://', 'http://'):
+    http.mount(_prefix, HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+# avoid hitting API rate limits, shared by all the requests made
+# ERROR:make_request:API response: {"error":{"code":1,"message":"Please reduce the amount of data you're asking for, then retry your request"}}
+rate_limiter = RateLimiter()
+
 
-@dataclasses.dataclass
 class ResponseEntity:
     """
-    Generic entity dataclass for Facebook posts and Instagram media
+    Generic, slotted entity for Facebook posts and Instagram media
+
+    created_time can be passed as datetime or as the raw string (either the API timestamp or the value
+    stored in the NDJSON archive) - it is parsed only when accessed. The RFC-822 date for the RSS feeds is cached.
     """
-    message: str
-    permalink_url: str
-    full_picture: str
-    created_time: datetime
+    __slots__ = ('message', 'permalink_url', 'full_picture', '_created_time', '_raw_created_time', '_rfc822_date')
+
+    # the fields passed to the constructor and stored in the NDJSON archive
+    FIELDS = ('message', 'permalink_url', 'full_picture', 'created_time')
+
+    # the entities are mutable
+    __hash__ = None
+
+    def __init__(self, message: str, permalink_url: str, full_picture: Optional[str],
+                 created_time: Union[datetime, str, None]):
+        self.message = message
+        self.permalink_url = permalink_url
+        self.full_picture = full_picture
+        self.created_time = created_time
+
+    @property
+    def created_time(self) -> Optional[datetime]:
+        if self._created_time is None and self._raw_created_time is not None:
+            self._created_time = created_time_field_to_datetime(self._raw_created_time)
+
+        return self._created_time
+
+    @created_time.setter
+    def created_time(self, value: Union[datetime, str, None]):
+        if isinstance(value, str):
+            self._created_time, self._raw_created_time = None, value
+        else:
+            self._created_time, self._raw_created_time = value, None
+
+        self._rfc822_date = None
+
+    @property
+    def created_time_str(self) -> Optional[str]:
+        """
+        created_time as stored in the NDJSON archive (i.e. str(datetime)), e.g. 2023-02-27 14:31:39
+        """
+        raw = self._raw_created_time
+
+        # both the API timestamps (2023-02-27T14:31:39+0000) and the archived values can be used as they are
+        if raw is not None and len(raw) in (19, 24) and raw[19:] in ('', '+0000'):
+            return raw[0:10] + ' ' + raw[11:19]
+
+        created_time = self.created_time
+        return str(created_time) if created_time is not None else None
+
+    @property
+    def rfc822_date(self) -> Optional[str]:
+        """
+        created_time formatted for the RSS feeds, e.g. Mon, 17 Aug 2026 11:16:50 -0000
+        """
+        if self._rfc822_date is None and self.created_time is not None:
+            self._rfc822_date = formatdate(float(self.created_time.strftime('%s')))
+
+        return self._rfc822_date
 
     def __repr__(self) -> str:
         return f'{self.message[0:96]}... ({self.created_time.isoformat()}) <{self.permalink_url}>'
 
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+
+        return all(getattr(self, name) == getattr(other, name) for name in self.FIELDS)
+
     def dict(self) -> dict:
-        return {
-            k: str(v) if v is not None else None
-            for k, v in dataclasses.asdict(self).items()
-        }
+        values = {}
+
+        for name in self.FIELDS:
+            value = self.created_time_str if name == 'created_time' else getattr(self, name)
+            values[name] = str(value) if value is not None else None
+
+        return values
+
+    def replace(self, **changes) -> 'ResponseEntity':
+        """
+        Returns a copy of the entity with the given fields changed (see dataclasses.replace)
+        """
+        values = {name: getattr(self, name) for name in self.FIELDS if name != 'created_time'}
+        values['created_time'] = self._raw_created_time if self._created_time is None else self._created_time
+        values.update(changes)
+
+        return self.__class__(**values)
 
+    @classmethod
+    def from_dict(cls, row: dict):
+        """
+        Creates an entity out of the dict() output (e.g. a line read from the NDJSON archive)
+        """
+        return cls(**{name: row.get(name) for name in cls.FIELDS})
 
-def make_request(endpoint: str, req_params: dict, retries: int = 2) -> dict:
+
+def rate_limit_scope(endpoint: str) -> Optional[str]:
+    """
+    Returns the rate limiter scope (the page or Instagram account) for a given endpoint
+
+    e.g. /v25.0/FarerskieKadry/feed -> FarerskieKadry
+    """
+    parts = endpoint.strip('/').split('/')
+    return parts[1] if len(parts) > 1 else None
+
+
+def make_request(endpoint: str, req_params: dict, retry_policy: Optional[RetryPolicy] = None,
+                 cache_ttl: Optional[float] = None, retries: Optional[int] = None) -> dict:
+    """
+    Makes the API request, retries it when the error is the transient one (or when we were throttled)
+
+    retries= (the total number of attempts) is kept for the backward compatibility, it is a shortcut
+    for retry_policy=RetryPolicy(attempts=retries).
+
+    When the response cache is enabled (see http_cache.py), cache_ttl= overrides its default TTL for this request.
+
+    Raises GraphApiError when the request can not be completed.
+    """
     logger = logging.getLogger('make_request')
-    retry_wait = 1  # seconds
+    retry_policy = retry_policy or (RetryPolicy(attempts=retries) if retries else RetryPolicy())
+    attempt = 0
+
+    response_cache = default_response_cache()
+    if response_cache:
+        cached = response_cache.get(endpoint, req_params, ttl=cache_ttl)
+        if cached is not None:
+            metrics.count('cache_hits')
+            return cached.json()
+
+    object_scope = rate_limit_scope(endpoint)
+    token_scope = app_scope(req_params.get('access_token'))
+    scopes = [scope for scope in (token_scope, object_scope) if scope]
+
+    while True:
+        attempt += 1
 
-    while retries > 0:
         try:
-            resp = http.get(f'https://graph.facebook.com/{endpoint.lstrip("/")}', params=req_params)
+            metrics.count('rate_limit_sleep_seconds', rate_limiter.acquire(scopes))
+
+            with metrics.timer('http_request'):
+                resp = http.get(f'{GRAPH_API_URL}/{endpoint.lstrip("/")}', params=req_params)
+
+            # GET requests carry the URL only
+            metrics.count('requests')
+            metrics.count('request_bytes', len(resp.request.url))
+            metrics.count('response_bytes', len(resp.content))
+
+            rate_limiter.update_from_headers(object_scope, resp.headers, token_scope=token_scope)
+            logger.debug('Rate limiter pacing: %r', rate_limiter.pacing())
+
             resp.raise_for_status()
 
-            # avoid hitting API rate limits
-            # ERROR:make_request:API response: {"error":{"code":1,"message":"Please reduce the amount of data you're asking for, then retry your request"}}
-            sleep(3)
-            return resp.json()
+            if response_cache:
+                response_cache.put(endpoint, req_params, resp, ttl=cache_ttl)
+
+            with metrics.timer('json_decode'):
+                return resp.json()
 
         # Allow Ctrl+C to stop the script immediately, without waiting for retries
         except KeyboardInterrupt:
             raise
 
         except RequestException as ex:
-            retries -= 1
-            if retries == 0:
-                logger.error(f'API request to {endpoint} failed: {ex.response.text}', exc_info=True)
-                raise
+            error = classify_error(ex)
 
-            logger.warning(f'API request to {endpoint} failed, retrying ({retries} retries left) after {retry_wait}s: : {ex.response.text}', exc_info=True)
+            if not retry_policy.should_retry(error, attempt):
+                logger.error(f'API request to {endpoint} failed ({error.kind.value}, code {error.code}): {error}')
+                raise error from ex
 
-            sleep(retry_wait)
-            retry_wait *= 2  # exponential backoff
+            retry_wait = retry_policy.wait_time(error, attempt)
+            logger.warning(f'API request to {endpoint} failed ({error.kind.value}, code {error.code}), '
+                           f'retrying (attempt #{attempt}) after {retry_wait:.1f}s: {error}')
 
+            metrics.count('retries')
+            metrics.count('backoff_seconds', retry_wait)
+
+            sleep(retry_wait)
 
 
-def iterate_api_responses(endpoint: str, req_params: dict, items_limit: int = None) -> Iterable[dict]:
+def iterate_api_responses(endpoint: str, req_params: dict, items_limit: int = None,
+                          stop_at: Optional[Callable[[dict], bool]] = None,
+                          heavy_fields: Optional[list[str]] = None,
+                          checkpoint: Optional[Checkpoint] = None) -> Iterable[dict]:
     """
     Yields data items for all paged response of the given endpoint
+
+    Iterating stops as soon as stop_at callback returns True for an item (e.g. the one that is already archived).
+
+    When the API asks us to reduce the amount of data, the page size is halved (and then heavy_fields are
+    not requested) for the failing page. The page size grows back on the next pages.
+
+    Pass checkpoint= to save the paging cursor after each page has been consumed and to resume
+    the iteration from the saved cursor on the next run.
     """
     logger = logging.getLogger('iterate_api_responses')
     logger.info(f'HTTP request to {endpoint} (with the items limit of {items_limit or "no limit"}) ...')
 
-    items_counter = 0
+    items_counter = checkpoint.resume(endpoint, req_params) if checkpoint else 0
+    page_size = PageSize(req_params, heavy_fields=heavy_fields)
 
     try:
         while True:
-            resp_json = make_request(endpoint, req_params)
+            try:
+                resp_json = make_request(endpoint, req_params)
+            except GraphApiError as ex:
+                if ex.kind is ErrorKind.REDUCE_DATA and page_size.shrink(req_params):
+                    logger.warning(f'API asked to reduce the amount of data, retrying with limit={req_params.get("limit")} '
+                                   f'and fields={req_params.get("fields")}')
+                    continue
+                raise
+
+            page_size.grow(req_params)
             logger.debug('API response: %r', resp_json)
             logger.debug('API paging: %r', resp_json.get('paging'))
 
+            completed = False
+
             for item in resp_json.get('data', []):
+                if stop_at and stop_at(item):
+                    logger.info(f'API returned an already known item after {items_counter} new items, leaving early')
+                    completed = True
+                    break
+
                 items_counter += 1
                 yield item
 
                 if items_limit and items_counter >= items_limit:
                     logger.warning(f'API returned {items_counter} items (limit: {items_limit}), leaving early')
-                    return
+                    completed = True
+                    break
 
             try:
-                req_params['after'] = resp_json['paging']['cursors']['after']
-                logger.debug('API next page (after) cursor: %r', req_params['after'])
+                next_cursor = resp_json['paging']['cursors']['after']
             except KeyError:
+                next_cursor = None
+
+            if completed or next_cursor is None:
                 # no more pages to iterate over
                 logger.info(f'API returned {items_counter} items')
+
+                if checkpoint:
+                    checkpoint.clear()
                 return
 
+            req_params['after'] = next_cursor
+            logger.debug('API next page (after) cursor: %r', req_params['after'])
+
+            # all items from this page have been consumed by now
+            if checkpoint:
+                checkpoint.commit(endpoint, req_params, items_counter)
+
     except RequestException:
         # ERROR:iterate_api_responses:Iterating on /v25.0/FarerskieKadry/feed failed after processing 300 items
         logger.error(f'Iterating on {endpoint} failed after processing {items_counter} items')
         raise
 
 
+def stop_at_known(known: Optional[set[str]], key: str, refresh: int = 0) -> Optional[Callable[[dict], bool]]:
+    """
+    Returns the stop_at callback for the incremental sync: iterating stops on the first item whose key
+    (e.g. permalink_url) is known, but the refresh newest items are always yielded (the known ones as well)
+    """
+    if not known:
+        return None
+
+    listed = count(1)
+    return lambda item: next(listed) > refresh and item.get(key) in known
+
+
+# https://developers.facebook.com/docs/graph-api/guides/field-expansion/#multiple-ids
+MAX_IDS_PER_LOOKUP = 50
+
+
+def lookup_ids(ids: Iterable[str], req_params: dict, batch_size: int = MAX_IDS_PER_LOOKUP) -> Iterable[dict]:
+    """
+    Yields the objects with the given ids (in the same order), fetched with the ?ids=a,b,c multi-object lookup
+
+    When the API asks us to reduce the amount of data, the batch is split in halves.
+    The ids that the API did not return (e.g. deleted posts) are skipped.
+    """
+    logger = logging.getLogger('lookup_ids')
+    ids = list(ids)
+
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+
+        try:
+            resp_json = make_request('/v25.0/', {**req_params, 'ids': ','.join(batch)})
+        except GraphApiError as ex:
+            if ex.kind is ErrorKind.REDUCE_DATA and len(batch) > 1:
+                logger.warning(f'API asked to reduce the amount of data, splitting the batch of {len(batch)} ids')
+                yield from lookup_ids(batch, req_params, batch_size=len(batch) // 2)
+                continue
+            raise
+
+        for object_id in batch:
+            if object_id in resp_json:
+                yield resp_json[object_id]
+            else:
+                logger.warning(f'API did not return the {object_id} object')
+
+
+T = TypeVar('T')
+
+
+async def iterate_in_thread(iterable: Iterable[T]) -> AsyncIterator[T]:
+    """
+    Turns a blocking iterator (e.g. the one making HTTP requests) into an async generator.
+
+    Each next item is fetched in a worker thread, so the event loop can run other
+    coroutines (e.g. the crawl of another feed) while we're waiting for the API.
+    """
+    iterator = iter(iterable)
+    done = object()
+
+    while True:
+        item = await asyncio.to_thread(next, iterator, done)
+
+        if item is done:
+            return
+
+        yield item
+
+
 # e.g. 2023-02-27T14:31:39+0000
 DATE_FORMAT = '%Y-%m-%dT%H:%M:%S+0000'
 
 
+def parse_created_time(value: str) -> datetime:
+    """
+    Parses the fixed-format timestamps without strptime():
+
+    * 2023-02-27T14:31:39+0000 (as returned by Facebook's API)
+    * 2023-02-27 14:31:39 (as stored in the NDJSON archive)
+    """
+    if len(value) in (19, 24) and value[4] == value[7] == '-' and value[10] in 'T ' and value[13] == value[16] == ':' \
+            and value[19:] in ('', '+0000'):
+        return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                        int(value[11:13]), int(value[14:16]), int(value[17:19]))
+
+    if 'T' in value:
+        return datetime(*(strptime(value, DATE_FORMAT)[0:6]))
+
+    return datetime.fromisoformat(value)
+
+
+@timed('parse_created_time')
 def created_time_field_to_datetime(created_time: str) -> datetime:
     """
     Converts strings with times (as returned by Facebook's API) to Python's datatime
 
     e.g.  2023-02-27T14:31:39+0000
     """
-    return datetime(*(strptime(created_time, DATE_FORMAT)[0:6]))
+    return parse_created_time(created_time)
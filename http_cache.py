@@ -0,0 +1,201 @@
+"""
+Record / replay cache of the Graph API responses, used by graph_api.make_request()
+
+Modes:
+
+* record - all requests go to the API, successful responses are stored in the cache
+* replay - responses are served from the cache only, no network requests are made at all
+* ttl - responses are reused for identical requests made within the TTL (e.g. the page metadata lookup),
+  the paged feeds (/feed, /media, ...) are only cached when the request asks for it (cache_ttl=),
+  otherwise the incremental sync would keep reading the stale first page
+
+Responses (status, headers and the compressed body) are kept in a single SQLite file. Access tokens are not
+part of the cache keys. The cache is bounded by the total size and by the age of the entries.
+
+Set GRAPH_API_CACHE_MODE (and optionally GRAPH_API_CACHE_PATH, GRAPH_API_CACHE_TTL) env variables to enable it.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from os import getenv
+from typing import Callable, Optional
+
+from requests import Response
+
+from retry import ErrorKind, GraphApiError
+
+# these request parameters are never a part of the cache key
+SECRET_PARAMS = {'access_token', 'appsecret_proof'}
+
+MODES = ('record', 'replay', 'ttl')
+
+# the edges listing the newest posts first, the default TTL does not apply to them
+PAGED_EDGES = ('feed', 'posts', 'published_posts', 'media')
+
+
+@dataclass
+class CachedResponse:
+    status: int
+    headers: dict[str, str]
+    body: bytes
+    stored_at: float
+
+    def json(self) -> dict:
+        return json.loads(self.body)
+
+
+def is_paged(endpoint: str) -> bool:
+    """
+    /v25.0/FarerskieKadry/feed -> True
+    """
+    return endpoint.rstrip('/').rsplit('/', 1)[-1] in PAGED_EDGES
+
+
+def cache_key(endpoint: str, req_params: dict) -> str:
+    """
+    Returns the cache key for a given endpoint and its parameters (access tokens are skipped)
+    """
+    params = sorted(
+        (key, str(value))
+        for key, value in req_params.items()
+        if key not in SECRET_PARAMS
+    )
+
+    return hashlib.sha1(json.dumps(['/' + endpoint.lstrip('/'), params]).encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Keeps the API responses in the SQLite file
+    """
+    def __init__(self, path: str, mode: str, ttl: float = 0, max_bytes: int = 64 * 1024 * 1024,
+                 max_age: float = 7 * 86400, clock: Callable[[], float] = time.time):
+        if mode not in MODES:
+            raise ValueError(f'Unsupported cache mode: {mode} (use one of: {", ".join(MODES)})')
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.path = path
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, endpoint TEXT, status INTEGER, headers TEXT, body BLOB, '
+            'size INTEGER, stored_at REAL)'
+        )
+
+    @classmethod
+    def from_env(cls) -> Optional['ResponseCache']:
+        mode = getenv('GRAPH_API_CACHE_MODE')
+
+        if not mode:
+            return None
+
+        return cls(
+            path=getenv('GRAPH_API_CACHE_PATH', default='graph_api_cache.sqlite'),
+            mode=mode,
+            ttl=float(getenv('GRAPH_API_CACHE_TTL', default='0')),
+        )
+
+    def ttl_for(self, endpoint: str, ttl: Optional[float] = None) -> float:
+        """
+        Returns the TTL of a given request: the one it asks for, the default one, or zero for the paged feeds
+        """
+        if ttl is not None:
+            return ttl
+
+        return 0 if is_paged(endpoint) else self.ttl
+
+    def get(self, endpoint: str, req_params: dict, ttl: Optional[float] = None) -> Optional[CachedResponse]:
+        """
+        Returns the cached response (None when the request needs to be made)
+
+        Raises GraphApiError in the replay mode when the response is not in the cache.
+        """
+        if self.mode == 'record' or (self.mode == 'ttl' and not self.ttl_for(endpoint, ttl)):
+            return None
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT status, headers, body, stored_at FROM responses WHERE key = ?',
+                (cache_key(endpoint, req_params),)
+            ).fetchone()
+
+        if row is None:
+            if self.mode == 'replay':
+                raise GraphApiError(ErrorKind.FATAL, f'{endpoint} response is not in the {self.path} cache')
+            return None
+
+        cached = CachedResponse(status=row[0], headers=json.loads(row[1]), body=zlib.decompress(row[2]),
+                                stored_at=row[3])
+
+        if self.mode == 'ttl' and self.clock() - cached.stored_at > self.ttl_for(endpoint, ttl):
+            return None
+
+        self.logger.debug(f'Serving {endpoint} response from the cache')
+        return cached
+
+    def put(self, endpoint: str, req_params: dict, resp: Response, ttl: Optional[float] = None):
+        """
+        Stores the response in the cache (in the record and ttl modes only)
+        """
+        if self.mode == 'replay' or (self.mode == 'ttl' and not self.ttl_for(endpoint, ttl)):
+            return
+
+        body = zlib.compress(resp.content)
+
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (cache_key(endpoint, req_params), endpoint, resp.status_code, json.dumps(dict(resp.headers)),
+                 body, len(body), self.clock())
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """
+        Removes the entries older than max_age and then the oldest ones until the cache fits in max_bytes
+        """
+        self._db.execute('DELETE FROM responses WHERE stored_at < ?', (self.clock() - self.max_age,))
+
+        total_size = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+
+        for key, size in self._db.execute('SELECT key, size FROM responses ORDER BY stored_at').fetchall():
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total_size -= size
+
+            if total_size <= self.max_bytes:
+                break
+
+        self.logger.info(f'Cache evicted down to {total_size} bytes')
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_loaded = False
+
+
+def default_response_cache() -> Optional[ResponseCache]:
+    """
+    Returns the cache configured via the env variables (None when caching is disabled)
+    """
+    global _default_cache, _default_cache_loaded
+
+    if not _default_cache_loaded:
+        _default_cache = ResponseCache.from_env()
+        _default_cache_loaded = True
+
+    return _default_cache
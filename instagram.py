@@ -2,28 +2,36 @@
 # Creates an activity feed for a given Instagram account, based on the Facebook Graph API
 #
 # https://developers.facebook.com/docs/instagram-api/reference/ig-media
-import json
+import asyncio
 import logging
-from dataclasses import dataclass
-from itertools import islice
-from typing import TextIO, Optional, Iterable
+from datetime import datetime
+from typing import AsyncIterator, Optional, Iterable, Union
 from os import getenv
 
 from dotenv import load_dotenv
 
-from graph_api import iterate_api_responses, make_request, created_time_field_to_datetime, ResponseEntity
-from rss import RssFeedWriter
-from utils import response_entity_to_rss_item
+from archive import read_archive_state, merge_into_archive, split_new, REFRESH_ITEMS
+from feed_renderer import render_feeds
+from graph_api import iterate_api_responses, iterate_in_thread, make_request, stop_at_known, ResponseEntity
+from metadata_cache import MetadataCache, default_metadata_cache
+from metrics import metrics, instrumented_run
+from retry import ErrorKind, GraphApiError
 
 
-@dataclass
 class InstagramMedia(ResponseEntity):
-    like_count: Optional[int]
+    __slots__ = ('like_count',)
+
+    FIELDS = ResponseEntity.FIELDS + ('like_count',)
+
+    def __init__(self, message: str, permalink_url: str, full_picture: Optional[str],
+                 created_time: Union[datetime, str, None], like_count: Optional[int] = None):
+        super().__init__(message, permalink_url, full_picture, created_time)
+        self.like_count = like_count
 
     @staticmethod
     def from_api_entry(api_entry: dict):
         """
-        Creates a dataclass instance out of Instagram API response
+        Creates an instance out of Instagram API response (created_time is parsed lazily)
 
         https://developers.facebook.com/docs/instagram-api/reference/ig-media#fields
         """
@@ -31,26 +39,68 @@ class InstagramMedia(ResponseEntity):
             message=api_entry.get('caption', ''),  # there can be only an image shared (i.e. with no message at all)
             permalink_url=api_entry.get('permalink'),
             full_picture=api_entry.get('media_url'),
-            created_time=created_time_field_to_datetime(api_entry.get('timestamp')),
+            created_time=api_entry.get('timestamp'),
             like_count=api_entry.get('like_count')
         )
 
 
+def _page_key(fb_page: str) -> str:
+    return f'fb_page:{fb_page}'
+
+
 # # https://developers.facebook.com/docs/instagram-api/getting-started#before-you-start
-def ig_account_id_for_fb_page(fb_page: str, access_token: str) -> Optional[str]:
+def ig_account_id_for_fb_page(fb_page: str, access_token: str,
+                              cache: Optional[MetadataCache] = None) -> Optional[str]:
+    """
+    Returns the id of the Instagram account connected to a given Facebook page
+
+    The id (and the page metadata) is kept in the metadata cache (see METADATA_CACHE_PATH).
+    """
+    cache = cache or default_metadata_cache()
+    cached = cache.get(_page_key(fb_page)) if cache else None
+
+    if cached and cached.get('ig_account_id'):
+        logging.info(f'Using the cached IG account for {fb_page}: {cached["ig_account_id"]}')
+        return cached['ig_account_id']
+
     # https://developers.facebook.com/docs/instagram-api/reference/ig-user/
-    resp = make_request(f'/v24.0/{fb_page}', req_params={
-        'fields': ','.join(
-            ['connected_instagram_account{id,name,biography}', 'instagram_accounts{username,id,followed_by_count,media_count,profile_picture_url}', 'name', 'about']
-        ),
+    resp = make_request(f'/v25.0/{fb_page}', req_params={
+        'fields': 'id,name,connected_instagram_account{id,username}',
         'access_token': access_token,
-    })
-    logging.info(f'Found IG account for {fb_page}: {repr(resp.get("instagram_accounts"))}, connected one: {repr(resp.get("connected_instagram_account"))}')
+    }, cache_ttl=86400)  # the connected account practically never changes
+
+    connected = resp.get('connected_instagram_account', {})
+    logging.info(f'Found IG account for {fb_page}: {repr(connected)}')
+
+    if cache and connected.get('id'):
+        cache.put(_page_key(fb_page), {
+            'page_id': resp.get('id'),
+            'name': resp.get('name'),
+            'ig_account_id': connected['id'],
+            'ig_username': connected.get('username'),
+        })
+
+    return connected.get('id')
+
+
+def forget_ig_account(fb_page: str, cache: Optional[MetadataCache] = None):
+    """
+    Removes the Instagram account connected to a given Facebook page from the metadata cache
+    """
+    cache = cache or default_metadata_cache()
 
-    return resp.get('connected_instagram_account', {}).get('id')
+    if cache:
+        cache.invalidate(_page_key(fb_page))
 
 
-def get_instagram_feed(ig_feed_name: str, access_token: str) -> Iterable[InstagramMedia]:
+def get_instagram_feed(ig_feed_name: str, access_token: str, known_permalinks: Optional[set[str]] = None,
+                       refresh: int = 0) -> Iterable[InstagramMedia]:
+    """
+    Returns all media from a given Instagram account.
+
+    Pass known_permalinks= to stop iterating once an already archived media is reached (incremental sync).
+    Pass refresh= to get that many newest media even when they are archived already (their media_url expires).
+    """
     logger = logging.getLogger('get_instagram_feed')
     logger.info(f'Getting the "{ig_feed_name}" Instagram feed ...')
 
@@ -59,18 +109,76 @@ def get_instagram_feed(ig_feed_name: str, access_token: str) -> Iterable[Instagr
         'fields': ','.join(
             ['caption', 'media_url', 'timestamp', 'thumbnail_url', 'shortcode', 'permalink', 'like_count']),
         'access_token': access_token,
-    })
+    }, stop_at=stop_at_known(known_permalinks, 'permalink', refresh=refresh))
 
     for entry in instagram_feed:
+        metrics.count('items.instagram')
         yield InstagramMedia.from_api_entry(entry)
 
 
-def save_feed_to_ndjson(ig_account: str, access_token: str, output: TextIO):
-    for media in get_instagram_feed(ig_account, access_token):
-        logging.info(f'{repr(media)}')
+def get_instagram_feed_async(*args, **kwargs) -> AsyncIterator[InstagramMedia]:
+    """
+    asyncio variant of get_instagram_feed(), takes the same arguments
+    """
+    return iterate_in_thread(get_instagram_feed(*args, **kwargs))
+
+
+CHANNEL = dict(
+    title='Farerskie Kadry na Instagramie',
+    link='https://www.instagram.com/farerskie.kadry/',
+    description='Suma miliona drobnych, banalnych sytuacji, miejsc, '
+                'ludzi uwiecznionych na cyfrowych kadrach i w nostalgicznych zakamarkach pamięci',
+)
+
+
+def update_feed(ig_account: str, access_token: str, archive_path: str, rss_path: str,
+                channel: Optional[dict] = None) -> int:
+    """
+    Fetches only the media that are not archived yet (and refreshes the newest archived ones), merges them
+    into the NDJSON archive and then renders the RSS feed (last 30 items) out of the archive.
+    Returns the number of new media.
+    """
+    state = read_archive_state(archive_path)
+
+    new_media, refreshed = split_new(get_instagram_feed(
+        ig_account, access_token, known_permalinks=state.permalinks, refresh=REFRESH_ITEMS
+    ), state.permalinks)
+    merge_into_archive(archive_path, new_media, refreshed)
+
+    render_rss_feed(archive_path, rss_path, channel)
+    return len(new_media)
+
+
+async def update_feed_async(fb_page: str, access_token: str, archive_path: str, rss_path: str,
+                            channel: Optional[dict] = None) -> int:
+    """
+    asyncio variant of update_feed(), resolves the Instagram account connected to a given Facebook page first
+    """
+    ig_account = await asyncio.to_thread(ig_account_id_for_fb_page, fb_page=fb_page, access_token=access_token)
+    state = await asyncio.to_thread(read_archive_state, archive_path)
+
+    try:
+        new_media, refreshed = split_new([
+            media async for media in get_instagram_feed_async(ig_account, access_token,
+                                                              known_permalinks=state.permalinks,
+                                                              refresh=REFRESH_ITEMS)
+        ], state.permalinks)
+    except GraphApiError as ex:
+        # e.g. the cached account id is no longer valid, it will be resolved again on the next run
+        if ex.kind is ErrorKind.FATAL:
+            forget_ig_account(fb_page)
+        raise
+    await asyncio.to_thread(merge_into_archive, archive_path, new_media, refreshed)
+
+    await asyncio.to_thread(render_rss_feed, archive_path, rss_path, channel)
+    return len(new_media)
+
 
-        json.dump(media.dict(), sort_keys=True, fp=output)
-        output.write("\n")
+def render_rss_feed(archive_path: str, rss_path: str, channel: Optional[dict] = None):
+    """
+    Renders the feeds out of the archive, channel= overrides the title, link and description of CHANNEL
+    """
+    render_feeds(archive_path, rss_path, InstagramMedia, channel={**CHANNEL, **(channel or {})})
 
 
 if __name__ == "__main__":
@@ -81,25 +189,17 @@ if __name__ == "__main__":
     token = getenv('FB_TOKEN', default='')
     logging.info(f'Using Facebook token: {token[0:3]}***{token[:3]}')
 
-    instagram_account_id = ig_account_id_for_fb_page(fb_page='FarerskieKadry', access_token=token)  # 17841407952879412
-
-    with open('farerskie_kadry_ig.ndjson', 'wt') as fp:
-        save_feed_to_ndjson(ig_account=instagram_account_id, access_token=token, output=fp)
-
-    # save to the RSS feed
-    with open('docs/instagram.xml', 'wt') as fp:
-        with RssFeedWriter(
-                out=fp,
-                title='Farerskie Kadry na Instagramie',
-                link='https://www.instagram.com/farerskie.kadry/',
-                description='Suma miliona drobnych, banalnych sytuacji, miejsc, '
-                            'ludzi uwiecznionych na cyfrowych kadrach i w nostalgicznych zakamarkach pamięci'
-        ) as feed:
-            ig_feed = islice(get_instagram_feed(instagram_account_id, access_token=token), 30)
-
-            for post in ig_feed:
-                feed.add_item(
-                    response_entity_to_rss_item(post)
-                )
+    with instrumented_run():
+        instagram_account_id = ig_account_id_for_fb_page(fb_page='FarerskieKadry', access_token=token)  # 17841407952879412
+
+        try:
+            update_feed(
+                ig_account=instagram_account_id, access_token=token,
+                archive_path='farerskie_kadry_ig.ndjson', rss_path='docs/instagram.xml'
+            )
+        except GraphApiError as api_error:
+            if api_error.kind is ErrorKind.FATAL:
+                forget_ig_account('FarerskieKadry')
+            raise
 
     logging.info('Done')
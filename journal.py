@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Builds the travel journals - HTML posts combining the archived Facebook and Instagram posts
+with a given hashtag (e.g. #FarerskiDziennikZPodróży), published within a given date range
+
+The posts are streamed from any number of indexed NDJSON archives (see archive_index.py),
+merged in the chronological order and written straight to the output file. The same post found in several
+archives (e.g. the overlapping ones, or an Instagram cross-post on Facebook) is included once. A journal with the "query"
+takes the posts matching it via the search index instead (see search_index.py).
+
+Usage: python journal.py journals.json --workers 4 --download
+
+journals.json lists the journals (see JournalConfig), use "years" to build one journal per year:
+
+[
+  {
+    "name": "Dziennik-z-podrozy-{year}",
+    "hashtag": "FarerskiDziennikZPodróży",
+    "archives": ["farerskie_kadry_2017.ndjson"],
+    "output": "journals/{year}.html",
+    "years": [2017]
+  }
+]
+"""
+import argparse
+import functools
+import heapq
+import json
+import logging
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field, replace
+from typing import Iterable, Iterator, Optional, TextIO
+
+from archive_index import IndexedArchive
+from media_mirror import MediaMirror, asset_id
+from merged_feed import caption_hash
+from search_index import SearchIndex
+
+# Polish month names in the genitive case, e.g. "12 kwietnia 2017"
+MONTHS = (
+    'stycznia', 'lutego', 'marca', 'kwietnia', 'maja', 'czerwca',
+    'lipca', 'sierpnia', 'września', 'października', 'listopada', 'grudnia',
+)
+
+# e.g. "Dzień 3." or "Dzień 4 i 5."
+DAY_HEADER_PATTERN = re.compile(r'(dzień [\d+ i/]+.)', flags=re.IGNORECASE)
+PARAGRAPHS_PATTERN = re.compile(r'\n+')
+
+HEADER_TEMPLATE = '<title>{title}</title><meta charset="utf-8"><style>img {{ background: #eee }}</style>'
+
+DAY_HEADER_TEMPLATE = "<h2 style='clear: both'>{day_header}</h2>\n"
+
+IMAGE_TEMPLATE = """
+                <div class="wp-block" data-align="{align}">
+                <figure tabindex="0" class="block-editor-block-list__block is-resized is-multi-selected wp-block-image"
+                <div class="components-resizable-box__container" style="position: relative; user-select: auto; width: 542px; height: 360px;">
+                <img style="max-width: 542px; max-height: 360px;" src="{image}" alt="Dziennik z podróży - {day_header}">
+                </div>
+                </figure></div>
+                """
+
+MESSAGE_TEMPLATE = "<p>{message}</p>\n"
+
+PERMALINK_TEMPLATE = "<p><small><a href='{permalink_url}'>Notka z {published}</a></small></p>\n"
+
+
+@dataclass
+class JournalConfig:
+    """
+    A single journal, posts with created_time within the [since, until) range are included
+    """
+    name: str  # the images are named after it, e.g. Dziennik-z-podrozy-2017_01.jpg
+    hashtag: str
+    archives: list[str]
+    output: str
+    since: Optional[str] = None  # e.g. 2017-04-01
+    until: Optional[str] = None
+    title: str = 'Dziennik z Podróży'
+    # where the images are going to be uploaded to
+    upload_url: str = 'https://farerskiekadry.pl/wp-content/uploads/2026/07/'
+    # where the downloaded images are copied to
+    images_dir: str = '/tmp'
+    # narrows the posts down with the search index query, e.g. "Nólsoy OR Tórshavn" (see search_index.py)
+    query: Optional[str] = None
+    search_index: str = 'search_index.json'
+
+    @classmethod
+    def from_dict(cls, entry: dict) -> list['JournalConfig']:
+        """
+        Returns the journal, or one journal per year when the "years" list is provided
+        """
+        entry = dict(entry)
+        years = entry.pop('years', None)
+        config = cls(**entry)
+
+        return [config.for_year(year) for year in years] if years else [config]
+
+    def for_year(self, year: int) -> 'JournalConfig':
+        """
+        Narrows the journal down to a given year, {year} placeholders in the name, title and output are replaced
+        """
+        return replace(
+            self,
+            name=self.name.format(year=year), title=self.title.format(year=year), output=self.output.format(year=year),
+            since=max(self.since or '', f'{year}-01-01'), until=min(self.until or '9999', f'{year + 1}-01-01'),
+        )
+
+
+@dataclass
+class JournalResult:
+    output: str
+    posts: int = 0
+    # full_picture URL -> the local path the image is to be copied to
+    images: dict[str, str] = field(default_factory=dict)
+
+
+def polish_date(created_time: str) -> str:
+    """
+    2017-04-12 14:31:39 -> 12 kwietnia 2017
+    """
+    return f'{created_time[8:10].lstrip("0")} {MONTHS[int(created_time[5:7]) - 1]} {created_time[0:4]}'
+
+
+def journal_posts(archive_paths: Iterable[str], hashtag: str,
+                  since: Optional[str] = None, until: Optional[str] = None,
+                  query: Optional[str] = None, search_index_path: str = 'search_index.json') -> Iterator[dict]:
+    """
+    Yields the posts with a given hashtag from all the archives, in the chronological order
+
+    Pass query= to only take the posts matching the search index query as well.
+    """
+    if query:
+        archive_paths = list(archive_paths)
+
+        index = SearchIndex(search_index_path)
+        index.update(archive_paths)
+
+        hits = [
+            hit for hit in index.search(f'#{hashtag.lstrip("#")} AND ({query})')
+            if hit.archive in archive_paths
+            and (since is None or hit.created_time >= since) and (until is None or hit.created_time < until)
+        ]
+        hits.sort(key=lambda hit: hit.created_time)
+
+        yield from unique_posts(index.rows(hits))
+        return
+
+    with ExitStack() as stack:
+        archives = [stack.enter_context(IndexedArchive(path)) for path in archive_paths]
+
+        streams = [
+            (
+                row for row in archive.by_hashtag(hashtag)
+                if (since is None or row['created_time'] >= since) and (until is None or row['created_time'] < until)
+            )
+            for archive in archives
+        ]
+
+        yield from unique_posts(heapq.merge(*streams, key=lambda row: row['created_time']))
+
+
+def unique_posts(posts: Iterable[dict]) -> Iterator[dict]:
+    """
+    Skips the posts that were already yielded - by the permalink_url, the image asset id
+    and the caption hash (the cross-post keys of merged_feed.py)
+    """
+    seen = set()
+
+    for post in posts:
+        keys = {post['permalink_url'], asset_id(post.get('full_picture')), caption_hash(post.get('message'))} - {None}
+
+        if keys & seen:
+            logging.getLogger('journal_posts').debug(f'Duplicate: {post["permalink_url"]}')
+            continue
+
+        seen |= keys
+        yield post
+
+
+@functools.lru_cache()
+def hashtag_pattern(hashtag: str) -> re.Pattern:
+    return re.compile(re.escape(f'#{hashtag.lstrip("#")}'), flags=re.IGNORECASE)
+
+
+def sanitize_message(msg: str, hashtag: str = 'FarerskiDziennikZPodróży') -> str:
+    # the archives match the hashtags case-insensitively, e.g. #farerskidziennikzpodróży
+    msg = hashtag_pattern(hashtag).sub('', msg)
+    return msg.strip()
+
+
+def write_journal(posts: Iterable[dict], config: JournalConfig, output: TextIO) -> JournalResult:
+    """
+    Writes the HTML of the journal, returns the images to be downloaded
+    """
+    result = JournalResult(output=config.output)
+
+    output.write(HEADER_TEMPLATE.format(title=config.title))
+
+    for idx, post in enumerate(posts):
+        result.posts += 1
+        image_name = f'{config.name}_{str(idx + 1).zfill(2)}.jpg'
+
+        # e.g. https://farerskiekadry.pl/wp-content/uploads/2023/07/Dziennik-z-podrozy-2018_01.jpg
+        if post['full_picture'] and '/fb.png' not in post['full_picture']:
+            result.images[post['full_picture']] = os.path.join(config.images_dir, image_name)
+            image = config.upload_url + image_name
+        else:
+            image = None
+
+        message = sanitize_message(post['message'], config.hashtag)
+
+        # find the "Dzień N" header
+        day_header = DAY_HEADER_PATTERN.search(message)
+
+        message = message.replace(day_header.group(1), '') if day_header else message
+        day_header = day_header.group(1).capitalize() if day_header else 'Dzień N'
+
+        output.write(DAY_HEADER_TEMPLATE.format(day_header=day_header.rstrip('.')))
+
+        if image:
+            output.write(IMAGE_TEMPLATE.format(align='left' if idx % 2 else 'right', image=image,
+                                               day_header=day_header))
+
+        output.write(MESSAGE_TEMPLATE.format(message=PARAGRAPHS_PATTERN.sub('</p><p>', message)))
+        output.write(PERMALINK_TEMPLATE.format(permalink_url=post['permalink_url'],
+                                               published=polish_date(post['created_time'])))
+
+    return result
+
+
+def build_journal(config: JournalConfig) -> JournalResult:
+    """
+    Builds a given journal, returns the images to be downloaded
+    """
+    output_dir = os.path.dirname(config.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    with open(config.output, 'wt') as output:
+        result = write_journal(
+            journal_posts(config.archives, config.hashtag, since=config.since, until=config.until,
+                          query=config.query, search_index_path=config.search_index),
+            config, output
+        )
+
+    logging.getLogger('build_journal').info(f'{config.output}: {result.posts} posts, {len(result.images)} images')
+    return result
+
+
+def build_journals(configs: list[JournalConfig], workers: int = 1) -> list[JournalResult]:
+    """
+    Builds the journals, using a pool of worker processes when workers > 1
+    """
+    # index the archives up front, the workers are not going to update the same index concurrently then
+    for archive_path in sorted({path for config in configs for path in config.archives}):
+        with IndexedArchive(archive_path):
+            pass
+
+    for search_index_path in sorted({config.search_index for config in configs if config.query}):
+        SearchIndex(search_index_path).update(
+            sorted({path for config in configs if config.search_index == search_index_path for path in config.archives})
+        )
+
+    if workers <= 1 or len(configs) <= 1:
+        return [build_journal(config) for config in configs]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(build_journal, configs))
+
+
+def download_images(images: dict[str, str], mirror_dir: str = 'media'):
+    """
+    Downloads the images (the already mirrored ones are reused) and copies them to the given paths
+    """
+    mirrored = MediaMirror(mirror_dir).fetch_all(images)
+
+    for url, image_path in images.items():
+        if url in mirrored:
+            shutil.copyfile(mirrored[url], image_path)
+            print(image_path)
+        else:
+            logging.warning(f'Could not download {url}')
+
+
+def load_journals(path: str) -> list[JournalConfig]:
+    with open(path, 'rt') as fp:
+        return [config for entry in json.load(fp) for config in JournalConfig.from_dict(entry)]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Builds the travel journals out of the archives')
+    parser.add_argument('config', help='JSON file with the list of journals')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--download', action='store_true', help='download the images of the journals')
+    args = parser.parse_args()
+
+    results = build_journals(load_journals(args.config), workers=args.workers)
+
+    if args.download:
+        download_images({url: path for result in results for url, path in result.images.items()})
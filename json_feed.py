@@ -0,0 +1,85 @@
+"""
+Renders the JSON Feed for a given list of items from Facebook or Instagram
+
+https://www.jsonfeed.org/version/1.1/
+"""
+import io
+import json
+import logging
+from typing import Iterable, Optional, TextIO
+
+from atom import to_rfc3339
+from rss import RssFeedItem, replace_if_changed
+
+JSON_FEED_VERSION = 'https://jsonfeed.org/version/1.1'
+
+
+class JsonFeedWriter:
+    """
+    Class responsible for writing JSON Feeds to a given text stream (can be a file)
+    """
+    def __init__(self, out: TextIO, title: str, link: str, description: Optional[str], path: Optional[str] = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.out = out
+        self.title = title
+        self.link = link
+        self.description = description
+
+        self.path = path
+        self.changed: Optional[bool] = None
+
+        self.items: list[dict] = []
+
+    @classmethod
+    def for_file(cls, path: str, title: str, link: str, description: Optional[str]) -> 'JsonFeedWriter':
+        """
+        Renders the feed to the memory buffer, the file is replaced on close only when its content has changed
+        """
+        return cls(out=io.StringIO(), title=title, link=link, description=description, path=path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.write()
+
+        if self.path and exc_type is None:
+            self.changed = replace_if_changed(self.path, self.out.getvalue())
+            self.logger.info(f'{self.path} ' + ('written' if self.changed else 'is up to date, not rewriting it'))
+
+    def add_item(self, item: RssFeedItem) -> None:
+        entry = {
+            'id': item.link,
+            'url': item.link,
+            'title': item.title,
+            'content_html': item.description,
+        }
+
+        if item.published:
+            entry['date_published'] = to_rfc3339(item.published)
+
+        self.items.append(entry)
+
+    def add_items(self, items: Iterable[RssFeedItem]) -> int:
+        count = len(self.items)
+
+        for item in items:
+            self.add_item(item)
+
+        return len(self.items) - count
+
+    def write(self):
+        feed = {
+            'version': JSON_FEED_VERSION,
+            'title': self.title,
+            'home_page_url': self.link,
+        }
+
+        if self.description:
+            feed['description'] = self.description
+
+        feed['items'] = self.items
+
+        json.dump(feed, self.out, ensure_ascii=False, indent=1)
+        self.out.write("\n")
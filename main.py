@@ -2,25 +2,77 @@
 # Creates an activity feed for a given Facebook page, based on the Facebook Graph API
 #
 # https://developers.facebook.com/tools/accesstoken/
+import asyncio
 import logging
-import json
-from itertools import islice
 from os import getenv
-from typing import TextIO
+from typing import Optional
 
 from dotenv import load_dotenv
 
-from facebook import get_facebook_feed
-from rss import RssFeedWriter
-from utils import response_entity_to_rss_item
+from archive import read_archive_state, merge_into_archive, split_new, REFRESH_ITEMS
+from facebook import get_facebook_feed, get_facebook_feed_async, FacebookPost
+from feed_renderer import render_feeds
+from metrics import instrumented_run
 
-# http://ndjson.org/
-def save_feed_to_ndjson(feed_name: str, access_token: str, output: TextIO):
-    for entry in get_facebook_feed(feed_name, access_token, items_limit=300): #, year=2017):
-        logging.info(f'{repr(entry)}')
 
-        json.dump(entry.dict(), sort_keys=True, fp=output)
-        output.write("\n")
+CHANNEL = dict(
+    title='Farerskie Kadry na Facebooku',
+    link='https://www.facebook.com/FarerskieKadry/',
+    description='Suma miliona drobnych, banalnych sytuacji, miejsc, '
+                'ludzi uwiecznionych na cyfrowych kadrach i w nostalgicznych zakamarkach pamięci',
+)
+
+
+def is_blog_post_share(post: FacebookPost) -> bool:
+    """
+    Do not add posts that share links from the blog
+    """
+    return bool(post.link and 'farerskiekadry.pl' in post.link)
+
+
+def update_feed(feed_name: str, access_token: str, archive_path: str, rss_path: str,
+                channel: Optional[dict] = None) -> int:
+    """
+    Fetches only the posts that are not archived yet (and refreshes the newest archived ones), merges them
+    into the NDJSON archive and then renders the RSS feed (last 30 items) out of the archive.
+    Returns the number of new posts.
+    """
+    state = read_archive_state(archive_path)
+
+    new_posts, refreshed = split_new(get_facebook_feed(
+        feed_name, access_token, items_limit=300,
+        known_permalinks=state.permalinks, hydrate=True, refresh=REFRESH_ITEMS
+    ), state.permalinks)
+    merge_into_archive(archive_path, new_posts, refreshed)
+
+    render_rss_feed(archive_path, rss_path, channel)
+    return len(new_posts)
+
+
+async def update_feed_async(feed_name: str, access_token: str, archive_path: str, rss_path: str,
+                            channel: Optional[dict] = None) -> int:
+    """
+    asyncio variant of update_feed(), the file operations are run in threads as well
+    """
+    state = await asyncio.to_thread(read_archive_state, archive_path)
+
+    new_posts, refreshed = split_new([
+        post async for post in get_facebook_feed_async(
+            feed_name, access_token, items_limit=300,
+            known_permalinks=state.permalinks, hydrate=True, refresh=REFRESH_ITEMS
+        )
+    ], state.permalinks)
+    await asyncio.to_thread(merge_into_archive, archive_path, new_posts, refreshed)
+
+    await asyncio.to_thread(render_rss_feed, archive_path, rss_path, channel)
+    return len(new_posts)
+
+
+def render_rss_feed(archive_path: str, rss_path: str, channel: Optional[dict] = None):
+    """
+    Renders the feeds out of the archive, channel= overrides the title, link and description of CHANNEL
+    """
+    render_feeds(archive_path, rss_path, FacebookPost, channel={**CHANNEL, **(channel or {})}, skip=is_blog_post_share)
 
 
 if __name__ == "__main__":
@@ -33,27 +85,10 @@ if __name__ == "__main__":
     token = getenv('FB_TOKEN', default='')
     logging.info(f'Using Facebook token: {token[0:3]}***{token[:3]}')
 
-    with open('farerskie_kadry.ndjson', 'wt') as fp:
-        save_feed_to_ndjson(feed_name='FarerskieKadry', access_token=token, output=fp)
-
-    # save to the RSS feed (last 30 items)
-    with open('docs/facebook.xml', 'wt') as fp:
-        with RssFeedWriter(
-                out=fp,
-                title='Farerskie Kadry na Facebooku',
-                link='https://www.facebook.com/FarerskieKadry/',
-                description='Suma miliona drobnych, banalnych sytuacji, miejsc, '
-                            'ludzi uwiecznionych na cyfrowych kadrach i w nostalgicznych zakamarkach pamięci'
-        ) as feed:
-            fb_feed = islice(get_facebook_feed(feed_name='FarerskieKadry', token=token), 30)
-
-            for post in fb_feed:
-                # do not add posts that share links from the blog
-                if post.link and 'farerskiekadry.pl' in post.link:
-                    continue
-
-                feed.add_item(
-                    response_entity_to_rss_item(post)
-                )
+    with instrumented_run():
+        update_feed(
+            feed_name='FarerskieKadry', access_token=token,
+            archive_path='farerskie_kadry.ndjson', rss_path='docs/facebook.xml'
+        )
 
     logging.info('Done')
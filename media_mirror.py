@@ -0,0 +1,191 @@
+"""
+Mirrors the images (full_picture) of Facebook posts and Instagram media
+
+The signed fbcdn / cdninstagram URLs expire (see the oe= parameter), so the older RSS items end up with broken
+images. The mirror downloads the images on a bounded thread pool (with keep-alive connections), stores them
+under the stable asset id taken from the URL (e.g. 776222806_1698295838966652_3592327208912520152_n.jpg),
+skips the ones it already has and resumes partial downloads. The expired URLs are not requested at all.
+full_picture can then be rewritten to point to the mirrored copy.
+
+Set MEDIA_MIRROR_DIR (and MEDIA_MIRROR_URL - the public URL of that directory) env variables to enable it.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from os import getenv
+from typing import Iterable, Iterator, Optional
+from urllib.parse import parse_qs, urlparse
+
+from requests import Session
+from requests.exceptions import RequestException
+
+from graph_api import ResponseEntity
+
+CHUNK_SIZE = 64 * 1024
+
+
+def asset_id(url: Optional[str]) -> Optional[str]:
+    """
+    Returns the stable asset id (the file name) of a given image URL
+
+    https://scontent.xx.fbcdn.net/v/t39.30808-6/776222806_..._n.jpg?stp=...&oe=6A8F4EC4 -> 776222806_..._n.jpg
+    """
+    if not url:
+        return None
+
+    name = os.path.basename(urlparse(url).path)
+    return name if '.' in name else None
+
+
+def expires_at(url: Optional[str]) -> Optional[int]:
+    """
+    Returns the expiry timestamp of the signed image URL (its hex-encoded oe= parameter), e.g. oe=6A8F4EC4
+
+    None is returned when the URL is not signed.
+    """
+    values = parse_qs(urlparse(url).query).get('oe') if url else None
+
+    try:
+        return int(values[0], 16) if values else None
+    except ValueError:
+        return None
+
+
+class MediaMirror:
+    """
+    Downloads the images to a local directory
+    """
+    def __init__(self, directory: str, base_url: Optional[str] = None, workers: int = 8):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.directory = directory
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.workers = workers
+
+        # keep one HTTP session (and its keep-alive connections) per worker thread
+        self._local = threading.local()
+
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional['MediaMirror']:
+        directory = getenv('MEDIA_MIRROR_DIR')
+        return cls(directory, base_url=getenv('MEDIA_MIRROR_URL')) if directory else None
+
+    @property
+    def _http(self) -> Session:
+        if not hasattr(self._local, 'http'):
+            self._local.http = Session()
+            self._local.http.headers['user-agent'] = 'py-facebook-feed'
+
+        return self._local.http
+
+    def path_for(self, url: str) -> Optional[str]:
+        name = asset_id(url)
+        return os.path.join(self.directory, name) if name else None
+
+    def has(self, url: str) -> bool:
+        path = self.path_for(url)
+        return path is not None and os.path.exists(path)
+
+    def fetch(self, url: str) -> Optional[str]:
+        """
+        Downloads a given image (resuming the partial download) and returns its local path.
+        None is returned when the image can not be downloaded.
+        """
+        path = self.path_for(url)
+
+        if path is None:
+            return None
+
+        if os.path.exists(path):
+            return path
+
+        # the CDN is going to reject the expired URL anyway (the refreshed one is needed)
+        expiry = expires_at(url)
+        if expiry is not None and expiry < time.time():
+            self.logger.info(f'Not downloading {asset_id(url)}, its URL has expired')
+            return None
+
+        part_path = path + '.part'
+        downloaded = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+        try:
+            with self._http.get(url, stream=True, timeout=30,
+                                headers={'range': f'bytes={downloaded}-'} if downloaded else {}) as resp:
+                # e.g. "bytes */52011" - the partial download may be complete already
+                if resp.status_code == 416 and downloaded:
+                    return self._finish_part(url, path, part_path, downloaded, resp.headers.get('content-range'))
+
+                resp.raise_for_status()
+
+                # the server may ignore the range request and send the whole image
+                mode = 'ab' if resp.status_code == 206 else 'wb'
+
+                with open(part_path, mode) as fp:
+                    for chunk in resp.iter_content(CHUNK_SIZE):
+                        fp.write(chunk)
+
+        except RequestException as ex:
+            self.logger.warning(f'Downloading {asset_id(url)} failed: {ex}')
+            return None
+
+        os.replace(part_path, path)
+        self.logger.info(f'Downloaded {asset_id(url)}')
+
+        return path
+
+    def _finish_part(self, url: str, path: str, part_path: str, downloaded: int,
+                     content_range: Optional[str]) -> Optional[str]:
+        """
+        Handles the 416 response to the range request: the complete partial download is finalised,
+        otherwise it is removed and the image is downloaded again
+        """
+        total = content_range.rsplit('/', 1)[-1] if content_range else None
+
+        if total == str(downloaded):
+            os.replace(part_path, path)
+            self.logger.info(f'Downloaded {asset_id(url)}')
+            return path
+
+        self.logger.warning(f'{asset_id(url)} partial download does not match {content_range!r}, downloading again')
+        os.remove(part_path)
+
+        return self.fetch(url)
+
+    def fetch_all(self, urls: Iterable[Optional[str]]) -> dict[str, str]:
+        """
+        Downloads the images concurrently, returns the URL -> local path map of the mirrored ones
+        """
+        urls = list({url for url in urls if asset_id(url)})
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            paths = executor.map(self.fetch, urls)
+
+        return {url: path for url, path in zip(urls, paths) if path}
+
+    def mirrored_url(self, url: Optional[str]) -> Optional[str]:
+        """
+        Returns the public URL of the mirrored image (or the original URL when it's not mirrored)
+        """
+        if self.base_url and url and self.has(url):
+            return f'{self.base_url}/{asset_id(url)}'
+
+        return url
+
+    def mirror_entities(self, entities: Iterable[ResponseEntity], batch_size: int = 30) -> Iterator[ResponseEntity]:
+        """
+        Downloads the images of the entities (a batch at a time) and yields their copies with full_picture rewritten
+
+        The entities are consumed lazily, so only the images of the items that end up in the feed are downloaded.
+        """
+        entities = iter(entities)
+
+        while batch := list(islice(entities, batch_size)):
+            self.fetch_all(entity.full_picture for entity in batch)
+
+            for entity in batch:
+                yield entity.replace(full_picture=self.mirrored_url(entity.full_picture))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Builds the "all channels" feed out of the Facebook and Instagram archives
+
+Many Facebook posts are the Instagram cross-posts. Both archives are sorted by created_time (the newest first),
+so they are merged in a single streaming pass. The entities that are still within the time window of the
+most recent one are kept in a buffer and indexed by:
+
+* the image asset id (see media_mirror.asset_id)
+* the hash of the normalised caption (a fallback for the cross-posts with a different image)
+
+A duplicate replaces the buffered entity when it is richer (see richness()), so the whole merge is O(n).
+"""
+import hashlib
+import heapq
+import logging
+import os
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Iterable, Iterator, Optional
+
+from archive import read_archive
+from facebook import FacebookPost
+from feed_renderer import FeedRenderer, feed_outputs, write_index
+from graph_api import ResponseEntity
+from instagram import InstagramMedia
+from main import is_blog_post_share
+from media_mirror import asset_id
+from pipeline import fan_out
+
+# cross-posts can be published on Facebook up to a day after they showed up on Instagram
+DEFAULT_WINDOW = timedelta(hours=48)
+
+# shorter captions are too generic to tell the duplicates
+MIN_CAPTION_LENGTH = 20
+
+
+def caption_hash(message: Optional[str]) -> Optional[str]:
+    """
+    Returns the hash of the normalised caption (case, punctuation and white spaces are ignored)
+    """
+    normalised = re.sub(r'\W+', ' ', (message or '').lower()).strip()
+
+    if len(normalised) < MIN_CAPTION_LENGTH:
+        return None
+
+    return hashlib.sha1(normalised.encode()).hexdigest()
+
+
+def richness(entity: ResponseEntity) -> tuple:
+    """
+    Entities with the image, the longer caption and the link are preferred
+    """
+    return bool(entity.full_picture), len(entity.message or ''), bool(getattr(entity, 'link', None))
+
+
+@dataclass
+class BufferedEntity:
+    entity: ResponseEntity
+    keys: list[str] = field(default_factory=list)
+    sources: set[type] = field(default_factory=set)
+
+
+def merge_feeds(*feeds: Iterable[ResponseEntity], window: timedelta = DEFAULT_WINDOW) -> Iterator[ResponseEntity]:
+    """
+    Merges the feeds sorted by created_time (the newest first) and yields the entities without the duplicates
+    """
+    logger = logging.getLogger('merge_feeds')
+
+    # the buffered entities, the newest first
+    buffer: deque[BufferedEntity] = deque()
+    by_key: dict[str, BufferedEntity] = {}
+    duplicates = 0
+
+    def flush(until=None) -> Iterator[ResponseEntity]:
+        while buffer and (until is None or buffer[0].entity.created_time - until > window):
+            buffered = buffer.popleft()
+
+            for key in buffered.keys:
+                if by_key.get(key) is buffered:
+                    del by_key[key]
+
+            yield buffered.entity
+
+    for entity in heapq.merge(*feeds, key=lambda item: item.created_time, reverse=True):
+        yield from flush(until=entity.created_time)
+
+        keys = [key for key in (asset_id(entity.full_picture), caption_hash(entity.message)) if key]
+
+        # only the entities coming from the other feed are the duplicates
+        buffered = next(
+            (by_key[key] for key in keys if key in by_key and type(entity) not in by_key[key].sources),
+            None
+        )
+
+        if buffered is None:
+            buffered = BufferedEntity(entity)
+            buffer.append(buffered)
+        else:
+            duplicates += 1
+            logger.debug(f'Duplicate: {entity.permalink_url} of {buffered.entity.permalink_url}')
+
+            if richness(entity) > richness(buffered.entity):
+                buffered.entity = entity
+
+        buffered.sources.add(type(entity))
+
+        for key in keys:
+            buffered.keys.append(key)
+            by_key.setdefault(key, buffered)
+
+    yield from flush()
+
+    logger.info(f'Skipped {duplicates} duplicates')
+
+
+CHANNEL = dict(
+    title='Farerskie Kadry',
+    link='https://farerskiekadry.pl/',
+    description='Suma miliona drobnych, banalnych sytuacji, miejsc, '
+                'ludzi uwiecznionych na cyfrowych kadrach i w nostalgicznych zakamarkach pamięci',
+)
+
+
+def render_merged_feed(fb_archive_path: str, ig_archive_path: str, rss_path: str, channel: Optional[dict] = None):
+    """
+    Renders the merged feeds (last 30 items) out of the archives, channel= overrides the fields of CHANNEL
+    """
+    entities = merge_feeds(
+        (post for post in read_archive(fb_archive_path, FacebookPost) if not is_blog_post_share(post)),
+        read_archive(ig_archive_path, InstagramMedia),
+    )
+
+    with FeedRenderer(
+            outputs=feed_outputs(rss_path, items_limit=30, **{**CHANNEL, **(channel or {})})
+    ) as renderer:
+        fan_out(entities, sinks=[renderer])
+
+    write_index(os.path.dirname(rss_path))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    render_merged_feed('farerskie_kadry.ndjson', 'farerskie_kadry_ig.ndjson', 'docs/all.xml')
@@ -0,0 +1,112 @@
+"""
+Persistent cache of the resolved ids and the page / account metadata (e.g. the Instagram account
+connected to a Facebook page), so that the routine runs do not need to look them up every time
+
+Entries are kept in a small JSON file (no access tokens are stored there) and expire after the TTL.
+Invalidate an entry when the cached id starts returning errors, it will be resolved again.
+
+Set METADATA_CACHE_PATH (and optionally METADATA_CACHE_TTL, in seconds) env variables to enable it.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from os import getenv
+from typing import Callable, Optional
+
+from metrics import metrics
+
+DEFAULT_TTL = 7 * 86400
+
+
+class MetadataCache:
+    """
+    Keeps the key -> metadata dict entries in the JSON file
+    """
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, clock: Callable[[], float] = time.time):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._entries: Optional[dict[str, dict]] = None
+
+    @classmethod
+    def from_env(cls) -> Optional['MetadataCache']:
+        path = getenv('METADATA_CACHE_PATH')
+
+        if not path:
+            return None
+
+        return cls(path=path, ttl=float(getenv('METADATA_CACHE_TTL', default=str(DEFAULT_TTL))))
+
+    def _load(self) -> dict[str, dict]:
+        if self._entries is None:
+            try:
+                with open(self.path, 'rt') as fp:
+                    self._entries = json.load(fp)
+            except FileNotFoundError:
+                self._entries = {}
+            except ValueError:
+                self.logger.warning(f'{self.path} can not be parsed, starting with an empty cache')
+                self._entries = {}
+
+        return self._entries
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+
+        with open(tmp_path, 'wt') as fp:
+            json.dump(self._entries, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Returns the cached metadata, None when there is no entry or it has expired
+        """
+        with self._lock:
+            entry = self._load().get(key)
+
+        if entry is None or self.clock() - entry['stored_at'] > self.ttl:
+            return None
+
+        metrics.count('metadata_cache_hits')
+        return entry['value']
+
+    def put(self, key: str, value: dict):
+        with self._lock:
+            self._load()[key] = {'value': value, 'stored_at': int(self.clock())}
+            self._save()
+
+    def invalidate(self, key: str):
+        """
+        Removes the entry, e.g. when the cached id is no longer valid
+        """
+        with self._lock:
+            if self._load().pop(key, None) is None:
+                return
+            self._save()
+
+        self.logger.info(f'{key} removed from the cache')
+
+
+_default_cache: Optional[MetadataCache] = None
+_default_cache_loaded = False
+
+
+def default_metadata_cache() -> Optional[MetadataCache]:
+    """
+    Returns the cache configured via the env variables (None when caching is disabled)
+    """
+    global _default_cache, _default_cache_loaded
+
+    if not _default_cache_loaded:
+        _default_cache = MetadataCache.from_env()
+        _default_cache_loaded = True
+
+    return _default_cache
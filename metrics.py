@@ -0,0 +1,241 @@
+"""
+Instrumentation of the feeds update pipeline
+
+Collects per-stage wall and CPU timers (http_request, json_decode, parse_created_time, rss_item, rss_render,
+file_write, ...) and counters (requests, request / response bytes, retries, seconds spent on the backoff and
+on the rate limiter waits, items). At the end of the run a JSON summary and a Prometheus textfile are written.
+
+Set FEED_METRICS (the JSON summary path) and / or FEED_METRICS_TEXTFILE (the Prometheus textfile path)
+env variables to enable it. When disabled, timers and counters do nothing but check a single flag.
+
+Set FEED_PROFILE=cprofile (or tracemalloc) to profile the run, the results are logged
+(and the cProfile stats are saved to FEED_PROFILE_PATH, feed.prof by default).
+
+https://prometheus.io/docs/instrumenting/exposition_formats/
+https://github.com/prometheus/node_exporter#textfile-collector
+"""
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from os import getenv
+from typing import Callable, Iterator, Optional, TypeVar
+
+
+class _Timer:
+    """
+    Measures the wall and CPU (of the current thread) time of a given stage
+    """
+    __slots__ = ('metrics', 'stage', 'wall', 'cpu')
+
+    def __init__(self, metrics: 'Metrics', stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.metrics.add_time(self.stage, time.perf_counter() - self.wall, time.thread_time() - self.cpu)
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+NOOP_TIMER = _NoopTimer()
+
+
+class Metrics:
+    """
+    Keeps the timers and counters of the run
+    """
+    def __init__(self, enabled: bool = False):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_env(cls) -> 'Metrics':
+        return cls(enabled=bool(getenv('FEED_METRICS') or getenv('FEED_METRICS_TEXTFILE')))
+
+    def reset(self):
+        self.started = time.perf_counter()
+        # stage -> [calls, wall seconds, CPU seconds]
+        self.stages: dict[str, list] = {}
+        self.counters: dict[str, float] = {}
+
+    def timer(self, stage: str):
+        """
+        Use it as a context manager: with metrics.timer('http_request'): ...
+        """
+        return _Timer(self, stage) if self.enabled else NOOP_TIMER
+
+    def add_time(self, stage: str, wall: float, cpu: float):
+        with self._lock:
+            totals = self.stages.setdefault(stage, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += wall
+            totals[2] += cpu
+
+    def count(self, name: str, value: float = 1):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> dict:
+        wall_time = time.perf_counter() - self.started
+        items = sum(value for name, value in self.counters.items() if name.startswith('items.'))
+
+        with self._lock:
+            return {
+                'wall_time': round(wall_time, 6),
+                'items_per_sec': round(items / wall_time, 3) if wall_time else 0,
+                'stages': {
+                    stage: {'calls': calls, 'wall': round(wall, 6), 'cpu': round(cpu, 6)}
+                    for stage, (calls, wall, cpu) in sorted(self.stages.items())
+                },
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def prometheus_text(self) -> str:
+        summary = self.summary()
+
+        lines = [
+            '# HELP feed_run_seconds Wall time of the feeds update run',
+            '# TYPE feed_run_seconds gauge',
+            f'feed_run_seconds {summary["wall_time"]}',
+            '# HELP feed_items_per_second Items fetched per second',
+            '# TYPE feed_items_per_second gauge',
+            f'feed_items_per_second {summary["items_per_sec"]}',
+            '# HELP feed_stage_calls_total Number of times a given stage was run',
+            '# TYPE feed_stage_calls_total counter',
+            *(f'feed_stage_calls_total{{stage="{stage}"}} {totals["calls"]}'
+              for stage, totals in summary['stages'].items()),
+            '# HELP feed_stage_seconds_total Time spent in a given stage',
+            '# TYPE feed_stage_seconds_total counter',
+            *(f'feed_stage_seconds_total{{stage="{stage}",clock="{clock}"}} {totals[clock]}'
+              for stage, totals in summary['stages'].items() for clock in ('wall', 'cpu')),
+            '# HELP feed_events_total Pipeline counters (requests, bytes, retries, sleeps, items)',
+            '# TYPE feed_events_total counter',
+            *(f'feed_events_total{{name="{name}"}} {value}' for name, value in summary['counters'].items()),
+        ]
+
+        return '\n'.join(lines) + '\n'
+
+    def write_reports(self, json_path: Optional[str] = None, textfile_path: Optional[str] = None):
+        """
+        Writes the JSON summary and the Prometheus textfile (paths default to the env variables)
+        """
+        json_path = json_path or getenv('FEED_METRICS')
+        textfile_path = textfile_path or getenv('FEED_METRICS_TEXTFILE')
+
+        if json_path:
+            with open(json_path, 'wt') as fp:
+                json.dump(self.summary(), fp, indent=2)
+            self.logger.info(f'Metrics summary written to {json_path}')
+
+        if textfile_path:
+            # the textfile collector must not read a partially written file
+            with open(textfile_path + '.tmp', 'wt') as fp:
+                fp.write(self.prometheus_text())
+            os.replace(textfile_path + '.tmp', textfile_path)
+            self.logger.info(f'Metrics textfile written to {textfile_path}')
+
+
+metrics = Metrics.from_env()
+
+T = TypeVar('T', bound=Callable)
+
+
+def timed(stage: str) -> Callable[[T], T]:
+    """
+    Decorates a function with the stage timer
+    """
+    def decorator(func: T) -> T:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+
+            with metrics.timer(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def profiling(mode: Optional[str] = None) -> Iterator[None]:
+    """
+    Profiles the code run within the context with cProfile or tracemalloc (see FEED_PROFILE)
+    """
+    logger = logging.getLogger('profiling')
+    mode = mode or getenv('FEED_PROFILE')
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+
+            path = getenv('FEED_PROFILE_PATH', default='feed.prof')
+            profiler.dump_stats(path)
+
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(20)
+            logger.info(f'cProfile stats saved to {path}:\n{out.getvalue()}')
+
+    elif mode == 'tracemalloc':
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            top = '\n'.join(str(stat) for stat in snapshot.statistics('lineno')[:20])
+            logger.info(f'tracemalloc: peak of {peak / 1024:.1f} kB, top allocations:\n{top}')
+
+    else:
+        if mode:
+            logger.warning(f'Unsupported FEED_PROFILE mode: {mode} (use cprofile or tracemalloc)')
+        yield
+
+
+@contextmanager
+def instrumented_run() -> Iterator[Metrics]:
+    """
+    Wraps the whole run - profiles it (when asked to) and writes the metrics reports at the end
+    """
+    metrics.reset()
+
+    with profiling():
+        try:
+            yield metrics
+        finally:
+            if metrics.enabled:
+                metrics.write_reports()
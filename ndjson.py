@@ -0,0 +1,174 @@
+"""
+Streaming NDJSON writer and reader for the archives and their exports
+
+http://ndjson.org/
+
+The lines are encoded with a single, reusable encoder and are byte-compatible with
+json.dump(row, sort_keys=True) followed by a new line (the format of the NDJSON archives).
+The writer collects the lines and writes them in large batches.
+
+The output can be compressed (gzip or zstd, picked by the file extension or by the compression argument).
+Each batch is written as a separate, complete frame (a gzip member or a zstd frame), so a file can be appended to
+and the truncated file can still be read up to its last complete frame. The reader decodes all the frames.
+
+zstd support requires the zstandard package (it is optional).
+"""
+import gzip
+import io
+import json
+import logging
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from graph_api import ResponseEntity
+
+# the same output as json.dumps(row, sort_keys=True)
+ENCODER = json.JSONEncoder(sort_keys=True)
+
+COMPRESSIONS = ('gzip', 'zstd')
+EXTENSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+
+# flush the buffered lines once they take this many characters
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+def encode_line(row: dict) -> str:
+    """
+    Returns the NDJSON line (with the trailing new line) for a given row
+    """
+    return ENCODER.encode(row) + '\n'
+
+
+def compression_for_path(path: str) -> Optional[str]:
+    for extension, compression in EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+
+    return None
+
+
+def _check_compression(compression: Optional[str]):
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError(f'Unsupported compression: {compression} (use one of: {", ".join(COMPRESSIONS)})')
+
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError('zstd compression requires the zstandard package')
+
+
+class NdjsonWriter:
+    """
+    Writes the NDJSON lines to a binary stream, in large (optionally compressed) batches. Use it as a context manager.
+    """
+    def __init__(self, out: BinaryIO, compression: Optional[str] = None, level: Optional[int] = None,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE):
+        _check_compression(compression)
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.out = out
+        self.compression = compression
+        self.level = level
+        self.buffer_size = buffer_size
+
+        self._lines: list[str] = []
+        self._buffered = 0
+
+        self.lines_count = 0
+        self.bytes_written = 0  # before the compression
+
+        self._zstd = zstandard.ZstdCompressor(level=level or 3) if compression == 'zstd' else None
+
+    @classmethod
+    def open(cls, path: str, mode: str = 'wb', compression: Optional[str] = None, **kwargs) -> 'NdjsonWriter':
+        """
+        Opens a given file for writing (or appending with mode="ab"), the compression is picked by the extension
+        """
+        return cls(open(path, mode), compression=compression or compression_for_path(path), **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, row: dict):
+        line = ENCODER.encode(row) + '\n'
+
+        self._lines.append(line)
+        self._buffered += len(line)
+        self.lines_count += 1
+
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def write_rows(self, rows: Iterable[dict]) -> int:
+        lines_count = self.lines_count
+
+        for row in rows:
+            self.write(row)
+
+        return self.lines_count - lines_count
+
+    def write_entities(self, entities: Iterable[ResponseEntity]) -> int:
+        return self.write_rows(entity.dict() for entity in entities)
+
+    def flush(self):
+        """
+        Writes the buffered lines as a single batch (a single compressed frame)
+        """
+        if not self._lines:
+            return
+
+        data = ''.join(self._lines).encode()
+        self._lines, self._buffered = [], 0
+        self.bytes_written += len(data)
+
+        if self.compression == 'gzip':
+            # mtime=0 keeps the output reproducible
+            data = gzip.compress(data, compresslevel=self.level or 6, mtime=0)
+        elif self.compression == 'zstd':
+            data = self._zstd.compress(data)
+
+        self.out.write(data)
+
+    def close(self):
+        self.flush()
+        self.out.close()
+
+
+def read_lines(path: str, compression: Optional[str] = None) -> Iterator[str]:
+    """
+    Yields the lines of a given (optionally compressed) NDJSON file, all the frames are decoded
+    """
+    compression = compression or compression_for_path(path)
+    _check_compression(compression)
+
+    if compression == 'gzip':
+        # multi-member gzip files are handled by the gzip module
+        with gzip.open(path, 'rt') as fp:
+            yield from fp
+
+    elif compression == 'zstd':
+        with open(path, 'rb') as raw:
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+
+            with io.TextIOWrapper(io.BufferedReader(reader)) as fp:
+                yield from fp
+
+    else:
+        with open(path, 'rt') as fp:
+            yield from fp
+
+
+def read_rows(path: str, compression: Optional[str] = None) -> Iterator[dict]:
+    """
+    Yields the decoded rows of a given (optionally compressed) NDJSON file
+    """
+    decode = json.JSONDecoder().decode
+
+    for line in read_lines(path, compression):
+        yield decode(line)
@@ -0,0 +1,206 @@
+"""
+Runs the feeds listed in the config file (see feeds.json) on a bounded pool of workers
+
+All the feeds share the HTTP session (and its connection pool) of graph_api and the rate limiter
+which keeps a separate budget for each access token. A failing feed is logged and reported
+in the run summary, but it does not stop the others.
+
+{
+  "workers": 8,
+  "summary": "feeds_run.json",
+  "feeds": [
+    {"name": "facebook", "type": "facebook", "page": "FarerskieKadry",
+     "archive": "farerskie_kadry.ndjson", "rss": "docs/facebook.xml"},
+    {"name": "instagram", "type": "instagram", "page": "FarerskieKadry", "token_env": "FB_TOKEN",
+     "archive": "farerskie_kadry_ig.ndjson", "rss": "docs/instagram.xml", "title": "..."}
+  ],
+  "merged": [
+    {"rss": "docs/all.xml", "facebook": "facebook", "instagram": "instagram"}
+  ]
+}
+"""
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field, asdict
+from os import getenv
+from typing import Callable, Optional
+
+import instagram
+import main
+from merged_feed import render_merged_feed
+
+FEED_TYPES = ('facebook', 'instagram')
+DEFAULT_WORKERS = 8
+
+
+@dataclass
+class FeedConfig:
+    """
+    A single Facebook page or Instagram account (given by the Facebook page it is connected to)
+    """
+    name: str
+    type: str
+    page: str
+    archive: str
+    rss: str
+    token_env: str = 'FB_TOKEN'
+    # overrides the RSS channel fields (title, link and description)
+    channel: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, entry: dict) -> 'FeedConfig':
+        if entry.get('type') not in FEED_TYPES:
+            raise ValueError(f'Unsupported feed type of {entry.get("name")}: {entry.get("type")}')
+
+        return cls(
+            name=entry['name'], type=entry['type'], page=entry['page'],
+            archive=entry['archive'], rss=entry['rss'], token_env=entry.get('token_env', 'FB_TOKEN'),
+            channel={key: entry[key] for key in ('title', 'link', 'description') if key in entry},
+        )
+
+
+@dataclass
+class MergedFeedConfig:
+    """
+    The Facebook and Instagram feeds (referred to by their names) merged into a single one
+    """
+    rss: str
+    facebook: str
+    instagram: str
+    channel: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, entry: dict) -> 'MergedFeedConfig':
+        return cls(
+            rss=entry['rss'], facebook=entry['facebook'], instagram=entry['instagram'],
+            channel={key: entry[key] for key in ('title', 'link', 'description') if key in entry},
+        )
+
+
+@dataclass
+class OrchestratorConfig:
+    feeds: list[FeedConfig]
+    merged: list[MergedFeedConfig] = field(default_factory=list)
+    workers: int = DEFAULT_WORKERS
+    summary: Optional[str] = None
+
+
+@dataclass
+class FeedResult:
+    """
+    The outcome of a single feed update, it goes to the run summary
+    """
+    name: str
+    ok: bool
+    new_items: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def load_config(path: str) -> OrchestratorConfig:
+    """
+    Reads and validates the JSON config file
+    """
+    with open(path, 'rt') as fp:
+        raw = json.load(fp)
+
+    feeds = [FeedConfig.from_dict(entry) for entry in raw['feeds']]
+    merged = [MergedFeedConfig.from_dict(entry) for entry in raw.get('merged', [])]
+
+    names = [feed.name for feed in feeds]
+    if len(set(names)) != len(names):
+        raise ValueError(f'Feed names in {path} are not unique: {names}')
+
+    for entry in merged:
+        for name in (entry.facebook, entry.instagram):
+            if name not in names:
+                raise ValueError(f'{entry.rss} merges an unknown feed: {name}')
+
+    return OrchestratorConfig(
+        feeds=feeds, merged=merged,
+        workers=int(raw.get('workers', DEFAULT_WORKERS)),
+        summary=raw.get('summary'),
+    )
+
+
+def token_from_env(feed: FeedConfig) -> str:
+    return getenv(feed.token_env, default='')
+
+
+async def update_feed(feed: FeedConfig, access_token: str) -> int:
+    """
+    Updates a given feed, returns the number of new items
+    """
+    update = main.update_feed_async if feed.type == 'facebook' else instagram.update_feed_async
+
+    return await update(feed.page, access_token, archive_path=feed.archive, rss_path=feed.rss,
+                        channel=feed.channel or None)
+
+
+async def run_feeds(config: OrchestratorConfig,
+                    token_for: Callable[[FeedConfig], str] = token_from_env) -> list[FeedResult]:
+    """
+    Updates all the feeds (at most config.workers at a time) and then renders the merged feeds.
+    Returns the results in the config order.
+    """
+    logger = logging.getLogger('run_feeds')
+    semaphore = asyncio.Semaphore(max(1, config.workers))
+
+    async def run_one(feed: FeedConfig) -> FeedResult:
+        async with semaphore:
+            started = time.perf_counter()
+
+            try:
+                new_items = await update_feed(feed, token_for(feed))
+            except Exception as ex:  # keep the other feeds going
+                logger.error(f'{feed.name}: update failed - {ex!r}', exc_info=True)
+                return FeedResult(name=feed.name, ok=False, seconds=round(time.perf_counter() - started, 3),
+                                  error=repr(ex))
+
+            logger.info(f'{feed.name}: {new_items} new item(s)')
+            return FeedResult(name=feed.name, ok=True, new_items=new_items,
+                              seconds=round(time.perf_counter() - started, 3))
+
+    results = list(await asyncio.gather(*[run_one(feed) for feed in config.feeds]))
+
+    # the archives are up to date now (or left untouched by the failed feeds)
+    feeds = {feed.name: feed for feed in config.feeds}
+
+    for entry in config.merged:
+        started = time.perf_counter()
+
+        try:
+            await asyncio.to_thread(render_merged_feed, feeds[entry.facebook].archive, feeds[entry.instagram].archive,
+                                    entry.rss, entry.channel or None)
+        except Exception as ex:
+            logger.error(f'{entry.rss}: rendering failed - {ex!r}', exc_info=True)
+            results.append(FeedResult(name=entry.rss, ok=False, seconds=round(time.perf_counter() - started, 3),
+                                      error=repr(ex)))
+        else:
+            results.append(FeedResult(name=entry.rss, ok=True, seconds=round(time.perf_counter() - started, 3)))
+
+    return results
+
+
+def write_summary(path: str, results: list[FeedResult], wall_time: float) -> dict:
+    """
+    Writes the JSON summary of the run
+    """
+    summary = {
+        'wall_time': round(wall_time, 3),
+        'ok': sum(1 for result in results if result.ok),
+        'failed': sum(1 for result in results if not result.ok),
+        'new_items': sum(result.new_items for result in results),
+        'feeds': [asdict(result) for result in results],
+    }
+
+    with open(path, 'wt') as fp:
+        json.dump(summary, fp, indent=2)
+
+    logging.getLogger('write_summary').info(
+        f'{path}: {summary["ok"]} feed(s) updated, {summary["failed"]} failed, '
+        f'{summary["new_items"]} new item(s) in {summary["wall_time"]} s'
+    )
+    return summary
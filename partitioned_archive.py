@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Year-partitioned, append-only storage of the archived entities (e.g. archive/facebook/2017.ndjson)
+
+Each segment keeps the entities created in a given year, one JSON-encoded entity per line, in the same
+format as the single-file NDJSON archives. New entities are appended to the segment of their year only:
+
+* an entity that is already stored as it is (the same permalink_url and the same content) is skipped
+* an updated entity (e.g. the changed like_count, an edited message or the refreshed image URL - see
+  archive.merge_into_archive) is appended as the record superseding the previous one - the last record
+  of a given permalink_url wins
+
+Superseded records are dead. compact() rewrites the segments with the dead records ratio above the threshold.
+
+archive.py uses this storage when the archive path is a directory (or ends with a slash).
+
+Usage:
+
+python partitioned_archive.py import archive/facebook farerskie_kadry_2017.ndjson farerskie_kadry.ndjson
+python partitioned_archive.py compact archive/facebook --threshold 0.2
+python partitioned_archive.py export archive/facebook farerskie_kadry_all.ndjson.gz
+"""
+import argparse
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from graph_api import ResponseEntity
+from ndjson import ENCODER, NdjsonWriter
+
+# rewrite the segment when more than this ratio of its records are dead
+COMPACTION_THRESHOLD = 0.2
+
+
+class Segment:
+    """
+    A single year of the archive, the newest record of each permalink_url is kept in the memory
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.records: dict[str, tuple[str, str]] = {}  # permalink_url -> (created_time, line)
+        self.total = 0  # including the dead records
+
+        if os.path.exists(path):
+            with open(path, 'rt') as fp:
+                for line in fp:
+                    self._add(json.loads(line), line.rstrip('\n'))
+
+    def _add(self, row: dict, line: str):
+        self.records[row['permalink_url']] = (row['created_time'], line)
+        self.total += 1
+
+    @property
+    def dead(self) -> int:
+        return self.total - len(self.records)
+
+    @property
+    def dead_ratio(self) -> float:
+        return self.dead / self.total if self.total else 0.0
+
+    def append(self, rows: list[tuple[dict, str]]) -> int:
+        """
+        Appends the new and the updated records, returns how many were written
+        """
+        lines = []
+
+        for row, line in rows:
+            current = self.records.get(row['permalink_url'])
+
+            if current is not None and current[1] == line:
+                continue
+
+            self._add(row, line)
+            lines.append(line + '\n')
+
+        if lines:
+            with open(self.path, 'at') as fp:
+                fp.writelines(lines)
+
+        return len(lines)
+
+    def compact(self):
+        """
+        Rewrites the segment with the live records only (the oldest first)
+        """
+        tmp_path = self.path + '.tmp'
+
+        with open(tmp_path, 'wt') as fp:
+            fp.writelines(line + '\n' for _, line in sorted(self.records.values(), key=lambda record: record[0]))
+
+        os.replace(tmp_path, self.path)
+        self.total = len(self.records)
+
+
+class PartitionedArchive:
+    """
+    The archive split into the per-year segments stored in a given directory. The segments are loaded lazily.
+    """
+    def __init__(self, directory: str):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.directory = directory
+        self._segments: dict[str, Segment] = {}
+
+    def years(self) -> list[str]:
+        """
+        Returns the years of the existing segments, the newest first
+        """
+        if not os.path.isdir(self.directory):
+            return []
+
+        return sorted((name[:-len('.ndjson')] for name in os.listdir(self.directory)
+                       if name.endswith('.ndjson') and name[:-len('.ndjson')].isdigit()), reverse=True)
+
+    def segment(self, year: str) -> Segment:
+        if year not in self._segments:
+            self._segments[year] = Segment(os.path.join(self.directory, f'{year}.ndjson'))
+
+        return self._segments[year]
+
+    def append(self, entities: Iterable[ResponseEntity]) -> int:
+        """
+        Stores the new and the updated entities in the segments of their years. Returns the number of records written.
+        """
+        return self.append_rows(entity.dict() for entity in entities)
+
+    def append_rows(self, rows: Iterable[dict]) -> int:
+        """
+        append() variant taking the rows of the NDJSON archive
+        """
+        by_year: dict[str, list[tuple[dict, str]]] = {}
+
+        for row in rows:
+            by_year.setdefault(row['created_time'][0:4], []).append((row, ENCODER.encode(row)))
+
+        os.makedirs(self.directory, exist_ok=True)
+        written = 0
+
+        for year, year_rows in sorted(by_year.items()):
+            written += self.segment(year).append(year_rows)
+
+        self.logger.info(f'Appended {written} records to {self.directory} (years: {", ".join(sorted(by_year))})')
+        return written
+
+    def lines(self) -> Iterator[str]:
+        """
+        Yields the live records (JSON-encoded), from the newest to the oldest one
+
+        A permalink_url stored in several segments (e.g. its created_time has moved to another year) is yielded
+        once, from the newest segment.
+        """
+        seen = set()
+
+        for year in self.years():
+            segment = self.segment(year)
+            records = sorted(segment.records.items(), key=lambda record: record[1][0], reverse=True)
+
+            for permalink_url, (_, line) in records:
+                if permalink_url not in seen:
+                    yield line
+
+            seen.update(segment.records)
+
+    def rows(self) -> Iterator[dict]:
+        for line in self.lines():
+            yield json.loads(line)
+
+    def permalinks(self) -> set[str]:
+        return {permalink for year in self.years() for permalink in self.segment(year).records}
+
+    def newest_created_time(self) -> Optional[datetime]:
+        for year in self.years():
+            records = self.segment(year).records.values()
+
+            if records:
+                return datetime.fromisoformat(max(created_time for created_time, _ in records))
+
+        return None
+
+    def compact(self, threshold: float = COMPACTION_THRESHOLD) -> list[str]:
+        """
+        Rewrites the segments with the dead records ratio above the threshold, returns their years
+        """
+        compacted = []
+
+        for year in self.years():
+            segment = self.segment(year)
+
+            if segment.dead_ratio > threshold:
+                self.logger.info(f'Compacting {segment.path} ({segment.dead} of {segment.total} records are dead)')
+                segment.compact()
+                compacted.append(year)
+
+        return compacted
+
+    def export(self, path: str):
+        """
+        Writes all the live records to the single-file NDJSON archive (the newest first),
+        compressed when the path ends with .gz or .zst (see ndjson.py)
+        """
+        with NdjsonWriter.open(path) as writer:
+            writer.write_rows(self.rows())
+
+
+def is_partitioned(archive_path: str) -> bool:
+    return archive_path.endswith(('/', os.sep)) or os.path.isdir(archive_path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Manages the year-partitioned archives')
+    parser.add_argument('command', choices=['import', 'compact', 'export'])
+    parser.add_argument('directory')
+    parser.add_argument('files', nargs='*', help='NDJSON archives to import (or the file to export to)')
+    parser.add_argument('--threshold', type=float, default=COMPACTION_THRESHOLD)
+    args = parser.parse_args()
+
+    archive = PartitionedArchive(args.directory)
+
+    if args.command == 'import':
+        for file_path in args.files:
+            with open(file_path, 'rt') as source:
+                archive.append_rows(json.loads(line) for line in source)
+    elif args.command == 'compact':
+        archive.compact(args.threshold)
+    else:
+        archive.export(args.files[0])
@@ -0,0 +1,66 @@
+"""
+A single-pass pipeline stage that sends each entity from the Graph API feed to several sinks.
+
+Iterating over get_facebook_feed() / get_instagram_feed() costs HTTP requests,
+so the feed is consumed only once and each entity is handed over to all the sinks
+(NDJSON dump, RSS feed, ...).
+"""
+import logging
+from typing import Iterable, TextIO
+
+from graph_api import ResponseEntity
+from ndjson import encode_line
+
+
+class Sink:
+    """
+    Base class for the pipeline sinks
+    """
+    def add(self, entity: ResponseEntity) -> None:
+        raise NotImplementedError
+
+    @property
+    def is_full(self) -> bool:
+        """
+        Sinks that are bounded return True once they do not accept any more entities
+        """
+        return False
+
+
+class NdjsonSink(Sink):
+    """
+    Writes entities as NDJSON lines to a given text stream
+
+    http://ndjson.org/
+    """
+    def __init__(self, out: TextIO):
+        self.out = out
+
+    def add(self, entity: ResponseEntity) -> None:
+        logging.info(f'{repr(entity)}')
+
+        # a single write per entity (the checkpointed crawls flush the stream after each page)
+        self.out.write(encode_line(entity.dict()))
+
+
+def fan_out(entities: Iterable[ResponseEntity], sinks: list[Sink]) -> int:
+    """
+    Iterates over the entities once and passes each of them to all the sinks.
+
+    Returns the number of entities processed.
+    """
+    logger = logging.getLogger('fan_out')
+    items_counter = 0
+
+    for entity in entities:
+        items_counter += 1
+
+        for sink in sinks:
+            sink.add(entity)
+
+        # all the sinks are bounded and do not want any more entities
+        if all(sink.is_full for sink in sinks):
+            break
+
+    logger.info(f'Passed {items_counter} entities to {len(sinks)} sinks')
+    return items_counter
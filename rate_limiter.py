@@ -0,0 +1,218 @@
+"""
+Adaptive rate limiter for the Graph API requests
+
+Instead of sleeping for a fixed amount of time after each request, the pace is driven by the usage headers
+that the Graph API returns with each response:
+
+* X-App-Usage - {"call_count": 28, "total_time": 25, "total_cputime": 25}
+* X-Page-Usage - {"call_count": 8, "total_time": 2, "total_cputime": 4, "estimated_time_to_regain_access": 0}
+* X-Business-Use-Case-Usage - {"1234": [{"type": "pages", "call_count": 8, ..., "estimated_time_to_regain_access": 0}]}
+
+The values are percentages of the quota being used. A token bucket is kept for the app and for each
+object (Facebook page / Instagram account) that we make requests for. The buckets refill at the full speed
+when the usage is low and slow down smoothly as the usage nears the limit.
+
+https://developers.facebook.com/docs/graph-api/overview/rate-limiting/
+"""
+import hashlib
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from time import monotonic, sleep
+from typing import Callable, Mapping, Optional
+
+# requests per second when the usage is low
+MAX_RATE = 10.0
+# requests per second when the usage nears 100%
+MIN_RATE = 1 / 30
+# start slowing down when the usage reaches this percentage
+SLOWDOWN_THRESHOLD = 50.0
+# how many requests can be made in a burst
+BUCKET_CAPACITY = 5.0
+
+APP_SCOPE = 'app'
+
+
+def app_scope(access_token: Optional[str]) -> str:
+    """
+    Returns the app scope for a given access token, so that the feeds using different tokens are paced separately
+
+    e.g. app:1a2b3c4d (the access token itself is never a part of the scope name)
+    """
+    if not access_token:
+        return APP_SCOPE
+
+    return f'{APP_SCOPE}:{hashlib.sha1(access_token.encode()).hexdigest()[0:8]}'
+
+
+def rate_for_usage(usage: float) -> float:
+    """
+    Returns the requests per second rate for a given usage percentage (0 - 100)
+    """
+    if usage <= SLOWDOWN_THRESHOLD:
+        return MAX_RATE
+
+    # slow down smoothly (quadratically) as the usage nears the limit
+    headroom = max(0.0, (100.0 - usage) / (100.0 - SLOWDOWN_THRESHOLD))
+    return max(MIN_RATE, MAX_RATE * headroom ** 2)
+
+
+def parse_usage_header(value: Optional[str]) -> tuple[float, int]:
+    """
+    Returns the highest usage percentage and the estimated time to regain access (in minutes)
+    taken from the X-App-Usage / X-Page-Usage / X-Business-Use-Case-Usage header value
+    """
+    if not value:
+        return 0.0, 0
+
+    try:
+        decoded = json.loads(value)
+    except ValueError:
+        logging.getLogger('parse_usage_header').warning(f'Unexpected usage header value: {value!r}')
+        return 0.0, 0
+
+    # X-Business-Use-Case-Usage has the list of entries for each business object
+    if all(isinstance(entries, list) for entries in decoded.values()):
+        entries = [entry for object_entries in decoded.values() for entry in object_entries]
+    else:
+        entries = [decoded]
+
+    usage, regain_access = 0.0, 0
+
+    for entry in entries:
+        usage = max(usage, *[
+            float(entry.get(key) or 0)
+            for key in ('call_count', 'total_time', 'total_cputime')
+        ])
+        regain_access = max(regain_access, int(entry.get('estimated_time_to_regain_access') or 0))
+
+    return usage, regain_access
+
+
+class TokenBucket:
+    """
+    The bucket refills with the given rate (tokens per second), each request takes a single token
+    """
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float]):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated_at = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def set_rate(self, rate: float):
+        self._refill()
+        self.rate = rate
+
+    def reserve(self) -> float:
+        """
+        Takes a token and returns how long (in seconds) the caller needs to wait before making the request
+        """
+        self._refill()
+        self.tokens -= 1
+
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+@dataclass
+class ScopePacing:
+    """
+    The current pacing decision for a given scope (the app, a page or an Instagram account)
+    """
+    usage: float = 0.0
+    rate: float = MAX_RATE
+    blocked_until: float = 0.0
+    last_wait: float = 0.0
+
+
+class RateLimiter:
+    """
+    Keeps the token buckets per scope and paces the requests according to the reported API usage
+    """
+    def __init__(self, clock: Callable[[], float] = monotonic, sleep_func: Callable[[float], None] = sleep):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.clock = clock
+        self.sleep = sleep_func
+
+        self._lock = threading.Lock()
+        self._buckets: dict[str, TokenBucket] = {}
+        self._pacing: dict[str, ScopePacing] = {}
+
+    def _scope(self, scope: str) -> tuple[TokenBucket, ScopePacing]:
+        if scope not in self._buckets:
+            self._buckets[scope] = TokenBucket(rate=MAX_RATE, capacity=BUCKET_CAPACITY, clock=self.clock)
+            self._pacing[scope] = ScopePacing()
+
+        return self._buckets[scope], self._pacing[scope]
+
+    def reserve(self, scopes: list[str]) -> float:
+        """
+        Takes a token from the bucket of each scope and returns how long the caller needs to wait
+        """
+        with self._lock:
+            now = self.clock()
+            wait = 0.0
+
+            for scope in scopes:
+                bucket, pacing = self._scope(scope)
+                scope_wait = max(bucket.reserve(), pacing.blocked_until - now)
+
+                pacing.last_wait = scope_wait
+                wait = max(wait, scope_wait)
+
+            return wait
+
+    def acquire(self, scopes: list[str]) -> float:
+        """
+        Waits until the request for the given scopes can be made. Returns the time spent waiting.
+        """
+        wait = self.reserve(scopes)
+
+        if wait > 0:
+            self.logger.info(f'Waiting {wait:.2f}s before making the request for {", ".join(scopes)}')
+            self.sleep(wait)
+
+        return wait
+
+    def update(self, scope: str, usage: float, regain_access: int = 0):
+        """
+        Sets the usage reported for a given scope (and the minutes to wait until the access is regained)
+        """
+        with self._lock:
+            bucket, pacing = self._scope(scope)
+
+            pacing.usage = usage
+            pacing.rate = rate_for_usage(usage)
+            bucket.set_rate(pacing.rate)
+
+            if regain_access > 0:
+                pacing.blocked_until = self.clock() + regain_access * 60
+            elif usage >= 100:
+                pacing.blocked_until = self.clock() + 1 / MIN_RATE
+
+    def update_from_headers(self, object_scope: Optional[str], headers: Mapping[str, str],
+                            token_scope: str = APP_SCOPE):
+        """
+        Updates the pacing using the usage headers returned by the API (the app usage is kept in token_scope)
+        """
+        self.update(token_scope, *parse_usage_header(headers.get('x-app-usage')))
+
+        if object_scope:
+            page_usage, page_regain = parse_usage_header(headers.get('x-page-usage'))
+            buc_usage, buc_regain = parse_usage_header(headers.get('x-business-use-case-usage'))
+
+            self.update(object_scope, max(page_usage, buc_usage), max(page_regain, buc_regain))
+
+    def pacing(self) -> dict[str, ScopePacing]:
+        """
+        Returns the current pacing decisions (e.g. for logging)
+        """
+        with self._lock:
+            return {scope: ScopePacing(**vars(pacing)) for scope, pacing in self._pacing.items()}
@@ -0,0 +1,172 @@
+"""
+Classifies Graph API errors and decides how (and whether) failed requests should be retried
+
+https://developers.facebook.com/docs/graph-api/guides/error-handling/
+https://developers.facebook.com/docs/graph-api/overview/rate-limiting/#error-codes
+"""
+import random
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
+
+from requests import Response
+from requests.exceptions import RequestException
+
+# API Too Many Calls, API User Too Many Calls, Page request limit reached, Calls within one hour exceeded
+THROTTLING_ERROR_CODES = {4, 17, 32, 613}
+
+# "Please reduce the amount of data you're asking for, then retry your request"
+REDUCE_DATA_ERROR_CODE = 1
+
+
+class ErrorKind(Enum):
+    REDUCE_DATA = 'reduce_data'  # the response would be too big, ask for less items / fields
+    THROTTLED = 'throttled'  # rate limits were hit
+    TRANSIENT = 'transient'  # 5xx server-side errors
+    CONNECTION = 'connection'  # timeouts, connection resets (no response at all)
+    FATAL = 'fatal'  # e.g. invalid token or parameters, there's no point in retrying
+
+
+class GraphApiError(RequestException):
+    """
+    Raised when the Graph API request fails, carries the classification of the error
+    """
+    def __init__(self, kind: ErrorKind, message: str, code: Optional[int] = None,
+                 retry_after: Optional[float] = None, response: Optional[Response] = None):
+        super().__init__(message, response=response)
+
+        self.kind = kind
+        self.code = code
+        self.retry_after = retry_after
+
+
+def classify_error(ex: RequestException) -> GraphApiError:
+    """
+    Turns the exception raised by the requests library into the GraphApiError
+    """
+    if isinstance(ex, GraphApiError):
+        return ex
+
+    resp = ex.response
+
+    if resp is None:
+        return GraphApiError(ErrorKind.CONNECTION, str(ex))
+
+    try:
+        # {"error":{"code":1,"message":"Please reduce the amount of data you're asking for, then retry your request"}}
+        error = resp.json().get('error', {})
+    except ValueError:
+        error = {}
+
+    code = error.get('code')
+    message = error.get('message') or resp.text
+
+    try:
+        retry_after = float(resp.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        retry_after = None
+
+    if code == REDUCE_DATA_ERROR_CODE:
+        kind = ErrorKind.REDUCE_DATA
+    elif code in THROTTLING_ERROR_CODES or resp.status_code == 429:
+        kind = ErrorKind.THROTTLED
+    elif resp.status_code >= 500 or error.get('is_transient'):
+        kind = ErrorKind.TRANSIENT
+    else:
+        kind = ErrorKind.FATAL
+
+    return GraphApiError(kind, message, code=code, retry_after=retry_after, response=resp)
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Decides which errors are retried and how long to wait before the next attempt
+    """
+    attempts: int = 4
+    base_wait: float = 1.0  # seconds
+    throttled_wait: float = 30.0  # seconds
+    max_wait: float = 600.0  # seconds
+    jitter: float = 0.25  # up to 25% is added to the wait time
+
+    def should_retry(self, error: GraphApiError, attempt: int) -> bool:
+        return attempt < self.attempts and error.kind in (
+            ErrorKind.THROTTLED, ErrorKind.TRANSIENT, ErrorKind.CONNECTION
+        )
+
+    def wait_time(self, error: GraphApiError, attempt: int) -> float:
+        """
+        Honours the Retry-After header, uses exponential backoff otherwise (with some jitter)
+        """
+        if error.retry_after is not None:
+            wait = error.retry_after
+        else:
+            base_wait = self.throttled_wait if error.kind is ErrorKind.THROTTLED else self.base_wait
+            wait = base_wait * 2 ** (attempt - 1)
+
+        return min(self.max_wait, wait) * (1 + random.uniform(0, self.jitter))
+
+
+def split_fields(fields: str) -> list[str]:
+    """
+    Splits the fields parameter value, takes nested fields into account
+
+    'message,attachments{url,title}' -> ['message', 'attachments{url,title}']
+    """
+    parts, depth, current = [], 0, ''
+
+    for char in fields:
+        if char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+
+        depth += {'{': 1, '}': -1}.get(char, 0)
+        current += char
+
+    return parts + [current] if current else parts
+
+
+class PageSize:
+    """
+    Shrinks the size of the requested page when the API asks us to reduce the amount of data
+    and then grows it back on the next pages.
+    """
+    # the default page size of the Graph API
+    DEFAULT_LIMIT = 25
+    MIN_LIMIT = 5
+
+    def __init__(self, req_params: dict, heavy_fields: Optional[list[str]] = None):
+        self.limit = int(req_params.get('limit', self.DEFAULT_LIMIT))
+        self.fields = req_params.get('fields')
+        self.heavy_fields = heavy_fields or []
+
+    def shrink(self, req_params: dict) -> bool:
+        """
+        Halves the limit and then drops the heavy fields. Returns False when there's nothing more to shrink.
+        """
+        limit = int(req_params.get('limit', self.DEFAULT_LIMIT))
+
+        if limit > self.MIN_LIMIT:
+            req_params['limit'] = max(self.MIN_LIMIT, limit // 2)
+            return True
+
+        fields = split_fields(req_params.get('fields') or '')
+        light_fields = [field for field in fields if field not in self.heavy_fields]
+
+        if light_fields != fields:
+            req_params['fields'] = ','.join(light_fields)
+            return True
+
+        return False
+
+    def grow(self, req_params: dict):
+        """
+        Doubles the limit (up to the original one) and brings back the dropped fields
+        """
+        if self.fields is not None:
+            req_params['fields'] = self.fields
+
+        limit = int(req_params.get('limit', self.DEFAULT_LIMIT))
+        if limit < self.limit:
+            req_params['limit'] = min(self.limit, limit * 2)
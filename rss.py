@@ -28,15 +28,108 @@ https://validator.w3.org/feed/
 </channel>
 </rss>
 """
+import functools
+import hashlib
+import io
 import logging
+import os
+import re
+import threading
+import xml.etree.ElementTree as ElementTree
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional, TextIO
+from typing import Iterable, Optional, TextIO
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from xml.sax.saxutils import escape as escape_xml
 from email.utils import formatdate
 
+from metrics import timed
+
 RSS_GENERATOR = 'py-facebook-feed'
 
+# per-request parameters of the signed fbcdn / cdninstagram URLs, they change even when the image did not
+# (oe - the expiry time - and its oh signature are meaningful, the feed has to get the refreshed image URL)
+VOLATILE_URL_PARAMS = {
+    '_nc_gid', '_nc_tpa', '_nc_ohc', '_nc_oc', '_nc_zt', '_nc_ht', '_nc_cat', '_nc_sid', '_nc_ad',
+    'edm', 'efg', 'ccb',
+}
+
+URL_PATTERN = re.compile(r'https?://[^\s"\'<>]+')
+
+# a single item as written by RssFeedWriter.add_item(), the fields are escaped
+ITEM_TEMPLATE = (
+    '  <item>\n'
+    '    <title>{}</title>\n'
+    '    <guid isPermaLink="false">{}</guid>\n'
+    '    <link>{}</link>\n'
+    '    <description>{}</description>\n'
+    '{}'
+    '  </item>\n'
+)
+
+
+# the same items (and their image URLs) end up in several feeds
+@functools.lru_cache(maxsize=4096)
+def canonicalize_url(url: str) -> str:
+    """
+    Removes the volatile query parameters from a given URL
+
+    https://scontent.xx.fbcdn.net/v/t39.30808-6/1_n.jpg?stp=dst-jpg&_nc_gid=Ab&oh=00_AQ&oe=6A8F4EC4
+    -> https://scontent.xx.fbcdn.net/v/t39.30808-6/1_n.jpg?stp=dst-jpg&oh=00_AQ&oe=6A8F4EC4
+    """
+    parts = urlsplit(url)
+
+    if not parts.query:
+        return url
+
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key not in VOLATILE_URL_PARAMS]
+
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def escape_text(text: str) -> str:
+    """
+    The same as xml.sax.saxutils.escape() without the extra entities, the special characters are rare in the feeds
+    """
+    if '&' in text or '<' in text or '>' in text:
+        return text.replace('&', '&amp;').replace('>', '&gt;').replace('<', '&lt;')
+
+    return text
+
+
+def item_digest(title: str, link: str, description: str, pub_date: Optional[str]) -> str:
+    """
+    Returns the hash of the meaningful fields of the RSS item (the volatile URL parameters are skipped)
+    """
+    description = URL_PATTERN.sub(lambda match: canonicalize_url(match.group(0)), description or '')
+    return hashlib.sha1('\n'.join([title or '', link or '', description, pub_date or '']).encode()).hexdigest()
+
+
+def read_feed_digests(path: str) -> Optional[dict]:
+    """
+    Returns the channel fields and guid -> item digest map (in the feed order) of a given RSS file
+
+    None is returned when the file does not exist or can not be parsed.
+    """
+    try:
+        channel = ElementTree.parse(path).getroot().find('channel')
+    except (OSError, ElementTree.ParseError):
+        return None
+
+    if channel is None:
+        return None
+
+    return {
+        'channel': [channel.findtext(name) for name in ('title', 'link', 'description')],
+        'items': {
+            item.findtext('guid'): item_digest(
+                item.findtext('title'), item.findtext('link'), item.findtext('description'), item.findtext('pubDate')
+            )
+            for item in channel.iter('item')
+        }
+    }
+
 
 @dataclass
 class RssFeedItem:
@@ -47,16 +140,51 @@ class RssFeedItem:
     link: str
     description: str
     published: Optional[datetime]
+    # the RFC-822 formatted published date, computed from published when not provided
+    pub_date: Optional[str] = None
 
     def __repr__(self) -> str:
         return f'{self.title} <{self.link}>'
 
 
+def write_atomically(path: str, content: str):
+    """
+    Writes the content to the temporary file and moves it in place of a given file
+    """
+    # the feeds updated concurrently share some files (e.g. docs/index.html), each writer needs its own temporary file
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    with open(tmp_path, 'wt') as fp:
+        fp.write(content)
+
+    os.replace(tmp_path, path)
+
+
+@timed('file_write')
+def replace_if_changed(path: str, content: str) -> bool:
+    """
+    Atomically replaces a given file with the content, unless it differs in the volatile URL parameters only.
+    Returns True when the file was written.
+    """
+    def canonicalize(text: str) -> str:
+        return URL_PATTERN.sub(lambda match: canonicalize_url(match.group(0)), text)
+
+    if os.path.exists(path):
+        with open(path, 'rt') as fp:
+            if canonicalize(fp.read()) == canonicalize(content):
+                return False
+
+    write_atomically(path, content)
+    return True
+
+
 class RssFeedWriter:
     """
     Class responsible for writing RSS files to a given text stream (can be a file)
+
+    Use RssFeedWriter.for_file() to only replace the RSS file when its content has actually changed.
     """
-    def __init__(self, out: TextIO, title: str, link: str, description: Optional[str]):
+    def __init__(self, out: TextIO, title: str, link: str, description: Optional[str], path: Optional[str] = None):
         self.logger = logging.getLogger(self.__class__.__name__)
 
         self.out = out
@@ -64,6 +192,19 @@ class RssFeedWriter:
         self.link = link
         self.description = description
 
+        # the change-aware mode, see for_file()
+        self.path = path
+        self.digests: dict[str, str] = {}
+        self.changed: Optional[bool] = None
+
+    @classmethod
+    def for_file(cls, path: str, title: str, link: str, description: Optional[str]) -> 'RssFeedWriter':
+        """
+        Renders the feed to the memory buffer. When the writer is closed the meaningful fields of the feed
+        are compared with the existing file which is (atomically) replaced only when something has changed.
+        """
+        return cls(out=io.StringIO(), title=title, link=link, description=description, path=path)
+
     # https://book.pythontips.com/en/latest/context_managers.html#implementing-a-context-manager-as-a-class
     def __enter__(self):
         self.write_header()
@@ -71,7 +212,38 @@ class RssFeedWriter:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.write_footer()
-        pass
+
+        if self.path and exc_type is None:
+            self.save()
+
+    @timed('file_write')
+    def save(self):
+        """
+        Replaces the RSS file with the rendered feed, unless nothing has changed
+        """
+        existing = read_feed_digests(self.path)
+
+        if existing is not None:
+            old_items = existing['items']
+
+            for guid in self.digests.keys() - old_items.keys():
+                self.logger.info(f'Item added: {guid}')
+            for guid in old_items.keys() - self.digests.keys():
+                self.logger.info(f'Item removed: {guid}')
+            for guid in self.digests.keys() & old_items.keys():
+                if self.digests[guid] != old_items[guid]:
+                    self.logger.info(f'Item changed: {guid}')
+
+        self.changed = existing is None \
+            or existing['channel'] != [self.title, self.link, self.description] \
+            or list(existing['items'].items()) != list(self.digests.items())
+
+        if not self.changed:
+            self.logger.info(f'{self.path} is up to date, not rewriting it')
+            return
+
+        write_atomically(self.path, self.out.getvalue())
+        self.logger.info(f'{self.path} written ({len(self.digests)} items)')
 
     def _writelines(self, lines: list[str]):
         self.out.writelines([
@@ -96,12 +268,13 @@ class RssFeedWriter:
             '</rss>'
         ])
 
+    @timed('rss_render')
     def add_item(self, item: RssFeedItem) -> None:
         """
         Adds the provided item to the RSS XML stream
         """
         # https://stackoverflow.com/a/3453266
-        pub_date = float(item.published.strftime('%s')) if item.published else None
+        pub_date = item.pub_date or (formatdate(float(item.published.strftime('%s'))) if item.published else None)
 
         # https://validator.w3.org/feed/docs/warning/MissingGuid.html
         # e.g. <guid isPermaLink="false">https://farerskiekadry.pl/?p=3541</guid>
@@ -109,12 +282,49 @@ class RssFeedWriter:
 
         self.logger.info(f'add_item(): {repr(item)}')
 
+        if self.path:
+            self.digests[guid] = item_digest(
+                item.title, item.link, item.description, pub_date
+            )
+
         self._writelines([
             '  <item>',
             f'    <title>{escape_xml(item.title)}</title>',
             f'    <guid isPermaLink="false">{escape_xml(guid)}</guid>',
             f'    <link>{escape_xml(item.link)}</link>',
             f'    <description>{escape_xml(item.description)}</description>',
-            f'    <pubDate>{escape_xml(formatdate(pub_date))}</pubDate>' if pub_date else '',
+            f'    <pubDate>{escape_xml(pub_date)}</pubDate>' if pub_date else '',
             '  </item>',
         ])
+
+    @timed('rss_render')
+    def add_items(self, items: Iterable[RssFeedItem]) -> int:
+        """
+        Batch variant of add_item(), the items are rendered to a single buffer written at once (the very same output).
+        Returns the number of items added.
+        """
+        render_item = ITEM_TEMPLATE.format
+        digests = self.digests if self.path else None
+        log_items = self.logger.isEnabledFor(logging.DEBUG)
+
+        buffer = []
+
+        for item in items:
+            pub_date = item.pub_date or (formatdate(float(item.published.strftime('%s'))) if item.published else None)
+            link = escape_text(item.link)
+
+            if log_items:
+                self.logger.debug(f'add_items(): {repr(item)}')
+
+            if digests is not None:
+                digests[item.link] = item_digest(item.title, item.link, item.description, pub_date)
+
+            buffer.append(render_item(
+                escape_text(item.title), link, link, escape_text(item.description),
+                f'    <pubDate>{escape_text(pub_date)}</pubDate>\n' if pub_date else '\n'
+            ))
+
+        self.out.write(''.join(buffer))
+        self.logger.info(f'add_items(): {len(buffer)} items')
+
+        return len(buffer)
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Full-text search over the archived Facebook posts and Instagram media
+
+The inverted index (kept in a single JSON file) maps the terms to the posts:
+
+* words of the message, lowercased and with the Polish / Faroese diacritics folded (Nólsoy -> nolsoy, ð -> d)
+* hashtags, e.g. #selatrad
+* the year the post was published in, e.g. 2017
+
+The index is updated incrementally - the sidecar indices of the archives (see archive_index.py) tell which
+posts are new, only these are read (via mmap) and tokenized. The posts themselves stay in the archives.
+
+Queries:
+
+* boolean - Nólsoy AND 2017, #Selatrað OR #Gjógv, Tórshavn NOT 2017, (a OR b) AND c (AND is implied)
+* ranked - the terms are OR-ed and the hits are ordered by the BM25 score (instead of the newest first)
+
+Usage: python search_index.py "Nólsoy AND 2017" [--ranked] [--limit 10]
+
+Set SEARCH_INDEX_PATH env variable to have the index updated when the feeds are rendered (the per-hashtag feeds
+then read the hashtag posts via the index instead of decoding the whole archive).
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from os import getenv
+from typing import Iterable, Iterator, Optional, Type
+
+from archive_index import IndexedArchive
+from graph_api import ResponseEntity
+from utils import get_hashtags
+
+INDEX_VERSION = 1
+
+DEFAULT_ARCHIVES = ['farerskie_kadry.ndjson', 'farerskie_kadry_ig.ndjson', 'farerskie_kadry_2017.ndjson']
+
+# letters that unicodedata does not decompose into the base letter and the diacritic
+FOLD_TABLE = str.maketrans({'ł': 'l', 'ð': 'd', 'đ': 'd', 'ø': 'o', 'æ': 'ae', 'þ': 'th', 'ß': 'ss'})
+
+TOKEN_PATTERN = re.compile(r'\w+')
+QUERY_TOKEN_PATTERN = re.compile(r'\(|\)|[^\s()]+')
+
+OPERATORS = ('AND', 'OR', 'NOT')
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def fold(text: str) -> str:
+    """
+    Nólsoy Selatrað Łódź -> nolsoy selatrad lodz
+    """
+    decomposed = unicodedata.normalize('NFKD', text.lower().translate(FOLD_TABLE))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(fold(text))
+
+
+def hashtag_term(hashtag: str) -> str:
+    """
+    #Selatrað -> #selatrad
+    """
+    return '#' + ''.join(tokenize(hashtag))
+
+
+def row_terms(row: dict) -> list[str]:
+    """
+    Returns the terms of a given archived post (with repetitions, the term frequency matters for the ranking)
+    """
+    message = row.get('message') or ''
+    hashtags = [hashtag_term(hashtag) for hashtag in get_hashtags(message)]
+
+    return tokenize(message) + [term for term in hashtags if term != '#'] + [row['created_time'][0:4]]
+
+
+@dataclass
+class SearchHit:
+    permalink_url: str
+    created_time: str
+    archive: str
+    score: float = 0.0
+
+
+class SearchIndex:
+    """
+    The inverted index of the archives, kept in a given JSON file
+    """
+    def __init__(self, path: str):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.path = path
+
+        # doc id -> [permalink_url, created_time, archive path, terms count, the first hashtag]
+        self.docs: list[list] = []
+        self.postings: dict[str, dict[int, int]] = {}  # term -> {doc id: term frequency}
+
+        # archive path -> the indexed permalinks (the same post can be kept in several archives)
+        self._permalinks: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+
+        with open(self.path, 'rt') as fp:
+            data = json.load(fp)
+
+        if data.get('version') != INDEX_VERSION:
+            return False
+
+        self.docs = data['docs']
+        self.postings = {term: {int(doc_id): tf for doc_id, tf in postings.items()}
+                         for term, postings in data['postings'].items()}
+        self._permalinks = {}
+        for doc in self.docs:
+            self._permalinks.setdefault(doc[2], set()).add(doc[0])
+        return True
+
+    def save(self):
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+
+        with open(tmp_path, 'wt') as fp:
+            json.dump({'version': INDEX_VERSION, 'docs': self.docs, 'postings': self.postings}, fp, ensure_ascii=False)
+
+        os.replace(tmp_path, self.path)
+
+    def add(self, row: dict, archive_path: str):
+        terms = row_terms(row)
+        hashtags = get_hashtags(row.get('message') or '')
+
+        doc_id = len(self.docs)
+        self.docs.append([row['permalink_url'], row['created_time'], archive_path, len(terms),
+                          hashtags[0] if hashtags else None])
+        self._permalinks.setdefault(archive_path, set()).add(row['permalink_url'])
+
+        for term in terms:
+            postings = self.postings.setdefault(term, {})
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+
+    def update(self, archive_paths: Iterable[str]) -> int:
+        """
+        Indexes the posts that were added to the archives since the last update, returns their number
+        """
+        with self._lock:
+            if not self.docs:
+                self.load()
+
+            added = 0
+
+            for archive_path in archive_paths:
+                with IndexedArchive(archive_path) as archive:
+                    indexed = self._permalinks.get(archive_path, set())
+
+                    for permalink_url in archive.index.permalinks.keys() - indexed:
+                        self.add(archive.get(permalink_url), archive_path)
+                        added += 1
+
+            if added:
+                self.save()
+                self.logger.info(f'Indexed {added} new posts ({len(self.docs)} in total)')
+
+            return added
+
+    def _term_docs(self, word: str) -> set[int]:
+        """
+        Returns the docs matching a given query word (all of its tokens)
+        """
+        terms = [hashtag_term(word)] if word.startswith('#') else tokenize(word)
+        docs = None
+
+        for term in terms:
+            term_docs = set(self.postings.get(term, {}))
+            docs = term_docs if docs is None else docs & term_docs
+
+        return docs or set()
+
+    def _parse(self, tokens: list[str], implicit: str) -> tuple[set[int], list[str]]:
+        """
+        Evaluates the boolean query, returns the matching docs and the positive terms (for the ranking)
+        """
+        all_docs = set(range(len(self.docs)))
+        terms = []
+        pos = 0
+
+        def peek() -> Optional[str]:
+            return tokens[pos] if pos < len(tokens) else None
+
+        def or_expr() -> set[int]:
+            nonlocal pos
+            docs = and_expr()
+
+            while peek() == 'OR' or (implicit == 'OR' and peek() not in (None, ')', 'AND', 'NOT')):
+                if peek() == 'OR':
+                    pos += 1
+                docs = docs | and_expr()
+
+            return docs
+
+        def and_expr() -> set[int]:
+            nonlocal pos
+            docs = not_expr()
+
+            # "a NOT b" always excludes b
+            while peek() in ('AND', 'NOT') or (implicit == 'AND' and peek() not in (None, ')', 'OR')):
+                if peek() == 'AND':
+                    pos += 1
+                docs = docs & not_expr()
+
+            return docs
+
+        def not_expr(negated: bool = False) -> set[int]:
+            nonlocal pos
+
+            if peek() == 'NOT':
+                pos += 1
+                return all_docs - not_expr(negated=not negated)
+
+            return atom(negated)
+
+        def atom(negated: bool) -> set[int]:
+            nonlocal pos
+            token = peek()
+
+            if token is None:
+                raise ValueError('Unexpected end of the query')
+
+            pos += 1
+
+            if token == '(':
+                docs = or_expr()
+
+                if peek() != ')':
+                    raise ValueError('Missing closing parenthesis')
+                pos += 1
+                return docs
+
+            if token in (')',) + OPERATORS:
+                raise ValueError(f'Unexpected {token} in the query')
+
+            if not negated:
+                terms.extend([hashtag_term(token)] if token.startswith('#') else tokenize(token))
+
+            return self._term_docs(token)
+
+        docs = or_expr()
+
+        if pos < len(tokens):
+            raise ValueError(f'Unexpected {tokens[pos]} in the query')
+
+        return docs, terms
+
+    def _score(self, doc_id: int, terms: list[str], avg_length: float) -> float:
+        length = self.docs[doc_id][3]
+        score = 0.0
+
+        for term in terms:
+            postings = self.postings.get(term, {})
+            tf = postings.get(doc_id)
+
+            if not tf:
+                continue
+
+            idf = math.log(1 + (len(self.docs) - len(postings) + 0.5) / (len(postings) + 0.5))
+            score += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+
+        return score
+
+    def search(self, query: str, ranked: bool = False, limit: Optional[int] = None) -> list[SearchHit]:
+        """
+        Returns the posts matching the query, the newest first (or the best matching first when ranked=True)
+
+        Raises ValueError when the query can not be parsed.
+        """
+        tokens = QUERY_TOKEN_PATTERN.findall(query)
+
+        if not tokens:
+            return []
+
+        docs, terms = self._parse(tokens, implicit='OR' if ranked else 'AND')
+
+        if ranked:
+            avg_length = sum(doc[3] for doc in self.docs) / len(self.docs) if self.docs else 1
+            scored = [(self._score(doc_id, terms, avg_length), doc_id) for doc_id in docs]
+            scored.sort(key=lambda entry: (entry[0], self.docs[entry[1]][1]), reverse=True)
+        else:
+            scored = sorted(((0.0, doc_id) for doc_id in docs), key=lambda entry: self.docs[entry[1]][1],
+                            reverse=True)
+
+        return [
+            SearchHit(permalink_url=self.docs[doc_id][0], created_time=self.docs[doc_id][1],
+                      archive=self.docs[doc_id][2], score=round(score, 4))
+            for score, doc_id in scored[:limit]
+        ]
+
+    def rows(self, hits: Iterable[SearchHit]) -> Iterator[dict]:
+        """
+        Yields the archived posts of the hits (read from the archives via their sidecar indices)
+        """
+        for _, row in self.hit_rows(hits):
+            yield row
+
+    def hit_rows(self, hits: Iterable[SearchHit]) -> Iterator[tuple[SearchHit, dict]]:
+        """
+        Yields (hit, archived post) pairs, the hits that are no longer in their archives are skipped
+        """
+        archives: dict[str, IndexedArchive] = {}
+
+        try:
+            for hit in hits:
+                if hit.archive not in archives:
+                    archives[hit.archive] = IndexedArchive(hit.archive).__enter__()
+
+                row = archives[hit.archive].get(hit.permalink_url)
+                if row is not None:
+                    yield hit, row
+        finally:
+            for archive in archives.values():
+                archive.close()
+
+    def hashtag_entities(self, archive_path: str, entity_class: Type[ResponseEntity]) -> Iterator[ResponseEntity]:
+        """
+        Yields the posts with hashtags from a given archive, the newest first (see HashtagFeeds.entities)
+        """
+        hits = [
+            SearchHit(permalink_url=doc[0], created_time=doc[1], archive=doc[2])
+            for doc in self.docs if doc[2] == archive_path and doc[4]
+        ]
+        hits.sort(key=lambda hit: hit.created_time, reverse=True)
+
+        for row in self.rows(hits):
+            yield entity_class.from_dict(row)
+
+
+_default_index: Optional[SearchIndex] = None
+_default_index_loaded = False
+
+
+def default_search_index() -> Optional[SearchIndex]:
+    """
+    Returns the index configured via the env variables (None when it is disabled)
+    """
+    global _default_index, _default_index_loaded
+
+    if not _default_index_loaded:
+        path = getenv('SEARCH_INDEX_PATH')
+        _default_index = SearchIndex(path) if path else None
+        _default_index_loaded = True
+
+    return _default_index
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Searches the archived posts')
+    parser.add_argument('query')
+    parser.add_argument('--index', default=getenv('SEARCH_INDEX_PATH', default='search_index.json'))
+    parser.add_argument('--archive', action='append', help='archives to index (the default ones when not provided)')
+    parser.add_argument('--ranked', action='store_true', help='order by the relevance instead of the newest first')
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    index = SearchIndex(args.index)
+    index.update([path for path in (args.archive or DEFAULT_ARCHIVES) if os.path.exists(path)])
+
+    started = time.perf_counter()
+    search_hits = index.search(args.query, ranked=args.ranked, limit=args.limit)
+    logging.info(f'{len(search_hits)} hits in {(time.perf_counter() - started) * 1000:.2f} ms')
+
+    for search_hit, search_row in index.hit_rows(search_hits):
+        first_line = (search_row.get('message') or '').split('\n')[0][0:100]
+        print(f'{search_hit.created_time}  {search_hit.score or "":>7}  {search_hit.permalink_url}\n    {first_line}')
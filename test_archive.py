@@ -0,0 +1,64 @@
+import os
+from datetime import datetime
+
+from archive import read_archive_state, read_archive, merge_into_archive, split_new
+from instagram import InstagramMedia
+
+
+def test_incremental_archive(tmp_path, make_media):
+    archive_path = str(tmp_path / 'feed.ndjson')
+
+    def media(idx: int, **kwargs) -> InstagramMedia:
+        return make_media(datetime(2023, 2, 27, 14, 31, idx), f'Media #{idx}', like_count=idx, **kwargs)
+
+    assert read_archive_state(archive_path).newest_created_time is None
+
+    assert merge_into_archive(archive_path, [media(2), media(1)]) == 2
+    archived_lines = open(archive_path).read()
+
+    state = read_archive_state(archive_path)
+    assert state.newest_created_time == datetime(2023, 2, 27, 14, 31, 2)
+    assert state.permalinks == {'https://www.instagram.com/p/20230227143101/',
+                                'https://www.instagram.com/p/20230227143102/'}
+
+    # new entities go on top, the existing lines are kept as they are
+    assert merge_into_archive(archive_path, [media(4), media(3)]) == 2
+    assert open(archive_path).read().endswith(archived_lines)
+
+    # nothing new - the archive is not rewritten
+    modified = os.stat(archive_path).st_mtime_ns
+    assert merge_into_archive(archive_path, iter([]), refreshed=[media(4), media(3)]) == 0
+    assert os.stat(archive_path).st_mtime_ns == modified
+
+    entities = list(read_archive(archive_path, InstagramMedia))
+    assert [entity.message for entity in entities] == ['Media #4', 'Media #3', 'Media #2', 'Media #1']
+    assert entities[0].created_time == datetime(2023, 2, 27, 14, 31, 4)
+    assert entities[0].like_count == '4'
+
+
+def test_refreshed_entities(tmp_path, make_media):
+    archive_path = str(tmp_path / 'feed.ndjson')
+
+    def media(idx: int, expires: str) -> InstagramMedia:
+        return make_media(datetime(2023, 2, 27, 14, 31, idx),
+                          full_picture=f'https://scontent.cdninstagram.com/v/{idx}_n.jpg?oe={expires}', like_count=idx)
+
+    merge_into_archive(archive_path, [media(idx, '63FC5F00') for idx in range(5, 0, -1)])
+    state = read_archive_state(archive_path)
+
+    # the two newest media are listed again, with the new signed image URLs
+    new, refreshed = split_new([media(6, '6A8F4EC4'), media(5, '6A8F4EC4'), media(4, '6A8F4EC4')], state.permalinks)
+    assert [entity.created_time.second for entity in new] == [6]
+
+    assert merge_into_archive(archive_path, new, refreshed) == 1
+
+    assert [entity.full_picture[-8:] for entity in read_archive(archive_path, InstagramMedia)] == \
+        ['6A8F4EC4', '6A8F4EC4', '6A8F4EC4', '63FC5F00', '63FC5F00', '63FC5F00']
+
+    # only the changed image URLs cause the rewrite
+    modified = os.stat(archive_path).st_mtime_ns
+    assert merge_into_archive(archive_path, [], refreshed=[media(5, '6A8F4EC4')]) == 0
+    assert os.stat(archive_path).st_mtime_ns == modified
+
+    assert merge_into_archive(archive_path, [], refreshed=[media(3, '6A8F4EC4')]) == 0
+    assert [entity.full_picture[-8:] for entity in read_archive(archive_path, InstagramMedia)][3] == '6A8F4EC4'
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from archive import merge_into_archive
+from archive_index import IndexedArchive
+
+
+def test_indexed_archive(tmp_path, make_post):
+    archive_path = str(tmp_path / 'feed.ndjson')
+
+    def post(day: int, message: str):
+        return make_post(datetime(2017, 4, day, 12, 0, 0), message,
+                         permalink_url=f'https://www.facebook.com/FarerskieKadry/posts/{day}')
+
+    merge_into_archive(archive_path, [
+        post(3, 'Dzień 3. #Gjógv #FarerskiDziennikZPodróży'),
+        post(2, 'Dzień 2. #Tórshavn'),
+        post(1, 'Dzień 1. #FarerskiDziennikZPodróży, #Vágar'),
+    ])
+
+    with IndexedArchive(archive_path) as archive:
+        assert len(archive) == 3
+        assert [row['message'][0:8] for row in archive.rows()] == ['Dzień 1.', 'Dzień 2.', 'Dzień 3.']
+        assert [row['message'][0:8] for row in archive.rows(since='2017-04-02', reverse=True)] == \
+               ['Dzień 3.', 'Dzień 2.']
+        assert [row['message'][0:8] for row in archive.rows(until='2017-04-02')] == ['Dzień 1.']
+
+        assert [row['message'][0:8] for row in archive.by_hashtag('#farerskidziennikzpodróży')] == \
+               ['Dzień 1.', 'Dzień 3.']
+        assert archive.get('https://www.facebook.com/FarerskieKadry/posts/2')['message'] == 'Dzień 2. #Tórshavn'
+        assert archive.get('https://www.facebook.com/FarerskieKadry/posts/5') is None
+
+    # new posts are put on top of the archive - only them are indexed
+    merge_into_archive(archive_path, [post(5, 'Dzień 5. #Vágar'), post(4, 'Dzień 4. #FarerskiDziennikZPodróży')])
+
+    with IndexedArchive(archive_path) as archive:
+        assert archive.index.update(archive._data) == 0
+        assert len(archive) == 5
+
+        assert [row['message'][0:8] for row in archive.by_hashtag('FarerskiDziennikZPodróży')] == \
+               ['Dzień 1.', 'Dzień 3.', 'Dzień 4.']
+        assert [row['message'][0:8] for row in archive.by_hashtag('Vágar', reverse=True)] == \
+               ['Dzień 5.', 'Dzień 1.']
+        assert archive.get('https://www.facebook.com/FarerskieKadry/posts/2')['message'] == 'Dzień 2. #Tórshavn'
+
+    # lines appended to the archive are indexed too
+    with open(archive_path, 'at') as fp:
+        fp.write('{"created_time": "2017-03-31 10:00:00", "message": "Dzień 0. #Vágar", '
+                 '"permalink_url": "https://www.facebook.com/FarerskieKadry/posts/0"}\n')
+
+    with IndexedArchive(archive_path) as archive:
+        assert len(archive) == 6
+        assert next(archive.rows())['message'] == 'Dzień 0. #Vágar'
+        assert len(list(archive.by_hashtag('Vágar'))) == 3
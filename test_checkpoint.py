@@ -0,0 +1,87 @@
+import pytest
+
+import graph_api
+from checkpoint import Checkpoint
+from retry import ErrorKind, GraphApiError
+
+
+def _fake_api(fail_after: str = None):
+    requested_cursors = []
+
+    def make_request(_, req_params):
+        after = int(req_params.get('after', 0))
+        requested_cursors.append(after)
+
+        if str(after) == fail_after:
+            raise GraphApiError(ErrorKind.TRANSIENT, 'Server error')
+
+        return {
+            'data': [{'id': after + idx} for idx in range(10)],
+            'paging': {'cursors': {'after': str(after + 10)}} if after < 30 else {},
+        }
+
+    return make_request, requested_cursors
+
+
+def test_resumable_crawl(tmp_path, monkeypatch):
+    output_path = tmp_path / 'output.txt'
+    checkpoint_path = str(tmp_path / 'output.checkpoint')
+
+    # the crawl fails when fetching the third page
+    make_request, requested_cursors = _fake_api(fail_after='20')
+    monkeypatch.setattr(graph_api, 'make_request', make_request)
+
+    with open(output_path, 'wt') as fp:
+        with pytest.raises(GraphApiError):
+            for item in graph_api.iterate_api_responses('/v25.0/FarerskieKadry/feed', req_params={'since': 1},
+                                                        checkpoint=Checkpoint(checkpoint_path, output=fp)):
+                fp.write(f'{item["id"]}\n')
+
+        # something was written after the checkpoint was saved
+        fp.write('garbage\n')
+
+    assert requested_cursors == [0, 10, 20]
+    assert Checkpoint(checkpoint_path).load()['items_emitted'] == 20
+
+    # now resume the crawl
+    make_request, requested_cursors = _fake_api()
+    monkeypatch.setattr(graph_api, 'make_request', make_request)
+
+    with open(output_path, 'at') as fp:
+        for item in graph_api.iterate_api_responses('/v25.0/FarerskieKadry/feed', req_params={'since': 1},
+                                                    checkpoint=Checkpoint(checkpoint_path, output=fp)):
+            fp.write(f'{item["id"]}\n')
+
+    assert requested_cursors == [20, 30]
+    assert open(output_path).read().splitlines() == [str(idx) for idx in range(40)]
+
+    # the crawl is completed, the checkpoint is removed
+    assert Checkpoint(checkpoint_path).load() is None
+
+
+def test_checkpoint_for_different_crawl_is_ignored(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / 'output.checkpoint'))
+    checkpoint.commit('/v25.0/FarerskieKadry/feed', {'since': 1, 'after': 'abc'}, items_emitted=10)
+
+    params = {'since': 2}
+    assert checkpoint.resume('/v25.0/FarerskieKadry/feed', params) == 0
+    assert 'after' not in params
+
+    params = {'since': 1, 'access_token': 'foo'}
+    assert checkpoint.resume('/v25.0/FarerskieKadry/feed', params) == 10
+    assert params['after'] == 'abc'
+
+
+def test_checkpoint_for_different_crawl_truncates_the_output(tmp_path):
+    output_path = tmp_path / 'output.txt'
+    output_path.write_text('1\n2\n')
+
+    with open(output_path, 'at') as fp:
+        checkpoint = Checkpoint(str(tmp_path / 'output.checkpoint'), output=fp)
+        checkpoint.commit('/v25.0/FarerskieKadry/feed', {'since': 1, 'after': 'abc'}, items_emitted=2)
+
+        # the partial output of the other crawl is not appended to
+        assert checkpoint.resume('/v25.0/FarerskieKadry/feed', {'since': 2}) == 0
+        fp.write('3\n')
+
+    assert output_path.read_text() == '3\n'
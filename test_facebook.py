@@ -0,0 +1,36 @@
+from datetime import datetime, timezone
+
+import graph_api
+from facebook import get_facebook_feed_sharded
+
+
+def test_get_facebook_feed_sharded(monkeypatch):
+    # one post per each month of 2016 - 2017
+    posts = [
+        {
+            'message': f'Post from {year}-{month}',
+            'permalink_url': f'https://www.facebook.com/FarerskieKadry/posts/{year}{month}',
+            'created_time': f'{year}-{month:02}-01T00:00:00+0000',
+        }
+        for year in (2016, 2017)
+        for month in range(1, 13)
+    ]
+
+    def make_request(_, req_params):
+        return {'data': [
+            post for post in posts
+            # until is inclusive, so posts on the windows boundaries are returned twice
+            if req_params['since'] <=
+               datetime.strptime(post['created_time'], graph_api.DATE_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+               <= req_params['until']
+        ]}
+
+    monkeypatch.setattr(graph_api, 'make_request', make_request)
+
+    feed = list(get_facebook_feed_sharded('FarerskieKadry', token='foo', granularity='month',
+                                          since=datetime(2016, 1, 1), until=datetime(2018, 1, 1)))
+
+    assert len(feed) == 24
+    assert feed[0].message == 'Post from 2017-12'
+    assert feed[-1].message == 'Post from 2016-1'
+    assert feed == sorted(feed, key=lambda post: post.created_time, reverse=True)
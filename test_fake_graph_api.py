@@ -0,0 +1,61 @@
+import graph_api
+import instagram
+import main
+from fake_graph_api import FakeGraphApi, FakeGraphApiConfig
+
+
+def _count_lines(file_path) -> int:
+    with open(file_path, 'rt') as fp:
+        return sum(1 for _ in fp)
+
+
+def test_update_feeds(tmp_path, monkeypatch, no_waiting):
+    # the first request asks to reduce the amount of data
+    with FakeGraphApi(FakeGraphApiConfig(pages=4, errors={1: 1})) as fake_api:
+        monkeypatch.setattr(graph_api, 'GRAPH_API_URL', fake_api.url)
+
+        main.update_feed(feed_name='FarerskieKadry', access_token='fake',
+                         archive_path=str(tmp_path / 'fb.ndjson'), rss_path=str(tmp_path / 'fb.xml'))
+
+        ig_account = instagram.ig_account_id_for_fb_page(fb_page='FarerskieKadry', access_token='fake')
+        instagram.update_feed(ig_account=ig_account, access_token='fake',
+                              archive_path=str(tmp_path / 'ig.ndjson'), rss_path=str(tmp_path / 'ig.xml'))
+
+        # 100 items: limit=100 failed, then limit=50 (x2) and two ids lookups for FB; IG page lookup + 4 pages
+        assert fake_api.requests_count == 1 + 2 + 2 + 1 + 4
+        assert _count_lines(tmp_path / 'fb.ndjson') == 100
+        assert _count_lines(tmp_path / 'ig.ndjson') == 100
+
+        assert open(tmp_path / 'fb.xml').read().count('<item>') == 30
+        assert open(tmp_path / 'ig.xml').read().count('<item>') == 30
+
+        # the next run only lists the 30 newest items again (to refresh their image URLs): a single page and
+        # an ids lookup for FB, two pages of 25 media for IG
+        main.update_feed(feed_name='FarerskieKadry', access_token='fake',
+                         archive_path=str(tmp_path / 'fb.ndjson'), rss_path=str(tmp_path / 'fb.xml'))
+        instagram.update_feed(ig_account=ig_account, access_token='fake',
+                              archive_path=str(tmp_path / 'ig.ndjson'), rss_path=str(tmp_path / 'ig.xml'))
+
+        assert fake_api.requests_count == 10 + 2 + 2
+        assert _count_lines(tmp_path / 'fb.ndjson') == 100
+
+
+def test_get_facebook_feed_hydrate(monkeypatch, no_waiting):
+    with FakeGraphApi(FakeGraphApiConfig(pages=4)) as fake_api:
+        monkeypatch.setattr(graph_api, 'GRAPH_API_URL', fake_api.url)
+
+        # the five newest posts are not archived yet
+        known_permalinks = {f'https://www.example.com/fb/{idx}' for idx in range(5, 100)}
+
+        posts = list(main.get_facebook_feed('FarerskieKadry', 'fake', known_permalinks=known_permalinks))
+        requests_count, bytes_sent = fake_api.requests_count, fake_api.bytes_sent
+
+        hydrated = list(main.get_facebook_feed('FarerskieKadry', 'fake', known_permalinks=known_permalinks,
+                                               hydrate=True))
+
+        assert hydrated == posts
+        assert len(posts) == 5
+
+        # the list of posts and a single ids lookup
+        assert fake_api.requests_count - requests_count == 2
+        assert fake_api.bytes_sent - bytes_sent < bytes_sent / 2
@@ -0,0 +1,83 @@
+import json
+import os
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import utils
+from feed_renderer import FeedRenderer, HashtagFeeds, feed_outputs, hashtag_slug, write_index
+from pipeline import fan_out
+
+NOW = datetime(2026, 8, 17, 11, 16, 50)
+
+
+class RecordingMirror:
+    def __init__(self):
+        self.mirrored = []
+
+    def mirror_entities(self, entities):
+        for entity in entities:
+            self.mirrored.append(entity.permalink_url)
+            yield entity.replace(full_picture=f'https://example.com/media/{len(self.mirrored)}_n.jpg')
+
+
+def test_hashtag_slug():
+    assert hashtag_slug('FarerskiDziennikZPodróży') == 'farerskidziennikzpodrozy'
+    assert hashtag_slug('Tórshavn') == 'torshavn'
+    assert hashtag_slug('Gjógv,Łąka') == 'gjogvlaka'
+    assert hashtag_slug('🐑') == ''
+
+
+def test_feed_renderer(tmp_path, make_post):
+    posts = [
+        make_post(NOW - timedelta(hours=idx), f'#{"FarerskiDziennikZPodróży" if idx % 2 else "Tórshavn"} Post {idx}',
+                  full_picture=f'https://scontent.xx.fbcdn.net/v/{idx}_n.jpg',
+                  link='https://farerskiekadry.pl/' if idx == 0 else None)
+        for idx in range(12)
+    ]
+    media_mirror = RecordingMirror()
+
+    outputs = feed_outputs(str(tmp_path / 'facebook.xml'), title='Feed', link='https://example.com',
+                           description=None, items_limit=5, skip=lambda post: post.link is not None)
+    hashtag_feeds = HashtagFeeds(directory=str(tmp_path / 'tags'), prefix='facebook', title='Feed',
+                                 link='https://example.com', items_limit=3, min_items=5)
+
+    with patch('feed_renderer.response_entity_to_rss_item', wraps=utils.response_entity_to_rss_item) as convert:
+        with FeedRenderer(outputs, hashtag_feeds, media_mirror=media_mirror) as renderer:
+            assert fan_out(posts, sinks=[renderer]) == 12
+
+    # only the six entities that end up in any of the feeds are converted (and mirrored), each of them once
+    assert convert.call_count == 6
+    assert len(media_mirror.mirrored) == 6
+    assert 'https://example.com/media/' in open(tmp_path / 'facebook.xml').read()
+
+    assert open(tmp_path / 'facebook.xml').read().count('<item>') == 4
+    assert open(tmp_path / 'facebook.atom').read().count('<entry>') == 4
+    assert len(json.load(open(tmp_path / 'facebook.json'))['items']) == 4
+
+    for name in ('facebook-farerskidziennikzpodrozy.xml', 'facebook-torshavn.xml'):
+        assert open(tmp_path / 'tags' / name).read().count('<item>') == 3
+
+    assert len(renderer.written) == 5
+
+    assert write_index(str(tmp_path)) is True
+    index = open(tmp_path / 'index.html').read()
+    assert '<a href="./facebook.atom">Atom</a>' in index
+    assert 'Feed: #FarerskiDziennikZPodróży: <a href="./tags/facebook-farerskidziennikzpodrozy.xml">RSS</a>' in index
+
+    # nothing has changed
+    assert write_index(str(tmp_path)) is False
+
+
+def test_hashtag_feeds_are_keyed_by_the_slug(tmp_path, make_post):
+    posts = [make_post(NOW - timedelta(hours=idx), f'#{"Tórshavn" if idx % 2 else "Torshavn"} Post {idx}')
+             for idx in range(5)]
+    posts += [make_post(NOW - timedelta(days=1, hours=idx), f'#🐑 Post {idx}') for idx in range(5)]
+
+    hashtag_feeds = HashtagFeeds(directory=str(tmp_path / 'tags'), prefix='facebook', title='Feed',
+                                 link='https://example.com', min_items=5)
+
+    with FeedRenderer([], hashtag_feeds) as renderer:
+        fan_out(posts, sinks=[renderer])
+
+    assert os.listdir(tmp_path / 'tags') == ['facebook-torshavn.xml']
+    assert open(tmp_path / 'tags' / 'facebook-torshavn.xml').read().count('<item>') == 5
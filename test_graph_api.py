@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from datetime import datetime
+
+import pytest
+
+from facebook import FacebookPost
+from graph_api import iterate_in_thread, rate_limit_scope, parse_created_time
+
+
+def test_rate_limit_scope():
+    assert rate_limit_scope('/v25.0/FarerskieKadry/feed') == 'FarerskieKadry'
+    assert rate_limit_scope('/v24.0/FarerskieKadry') == 'FarerskieKadry'
+    assert rate_limit_scope('/v25.0') is None
+
+
+def test_iterate_in_thread():
+    both_started = threading.Barrier(2, timeout=5)
+
+    def blocking_feed(name: str):
+        # each feed blocks until the other one has started, so they have to be iterated concurrently
+        both_started.wait()
+
+        for idx in range(3):
+            yield f'{name} #{idx}'
+
+    async def consume(name: str) -> list[str]:
+        return [item async for item in iterate_in_thread(blocking_feed(name))]
+
+    async def consume_both():
+        return await asyncio.gather(consume('fb'), consume('ig'))
+
+    assert asyncio.run(consume_both()) == [
+        ['fb #0', 'fb #1', 'fb #2'],
+        ['ig #0', 'ig #1', 'ig #2'],
+    ]
+
+
+def test_parse_created_time():
+    assert parse_created_time('2023-02-27T14:31:39+0000') == datetime(2023, 2, 27, 14, 31, 39)
+    assert parse_created_time('2023-02-27 14:31:39') == datetime(2023, 2, 27, 14, 31, 39)
+    assert parse_created_time('2023-02-27 14:31:39.123000') == datetime(2023, 2, 27, 14, 31, 39, 123000)
+
+    with pytest.raises(ValueError):
+        parse_created_time('2023-02-27T14:31:39+0200')
+
+
+def test_response_entity():
+    post = FacebookPost.from_api_entry({
+        'message': 'Foo', 'permalink_url': 'https://example.com/1', 'created_time': '2026-08-17T11:16:50+0000',
+    })
+
+    # slotted, created_time is parsed lazily
+    assert not hasattr(post, '__dict__')
+    assert post._created_time is None
+
+    assert post.dict() == {
+        'message': 'Foo', 'permalink_url': 'https://example.com/1', 'full_picture': None,
+        'created_time': '2026-08-17 11:16:50', 'link': None,
+    }
+    assert FacebookPost.from_dict(post.dict()) == post
+
+    assert post.created_time == datetime(2026, 8, 17, 11, 16, 50)
+    assert post.rfc822_date.startswith('Mon, 17 Aug 2026')
+
+    changed = post.replace(full_picture='https://example.com/1.jpg')
+    assert changed.full_picture == 'https://example.com/1.jpg'
+    assert changed.created_time == post.created_time
+    assert changed != post
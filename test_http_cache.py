@@ -0,0 +1,83 @@
+import os
+
+import pytest
+from requests import Response
+
+import graph_api
+from fake_graph_api import FakeGraphApi
+from http_cache import ResponseCache, cache_key
+from retry import GraphApiError
+
+
+def _response(body: bytes) -> Response:
+    resp = Response()
+    resp.status_code = 200
+    resp._content = body
+    resp.headers['Content-Type'] = 'application/json'
+
+    return resp
+
+
+def test_cache_key_skips_access_token():
+    assert cache_key('/v25.0/FarerskieKadry', {'fields': 'name', 'access_token': 'foo'}) == \
+           cache_key('v25.0/FarerskieKadry', {'access_token': 'bar', 'fields': 'name'})
+
+    assert cache_key('/v25.0/FarerskieKadry', {'fields': 'name'}) != \
+           cache_key('/v25.0/FarerskieKadry', {'fields': 'about'})
+
+
+def test_record_and_replay(tmp_path, monkeypatch):
+    monkeypatch.setattr(graph_api, 'default_response_cache',
+                        lambda: ResponseCache(str(tmp_path / 'cache.sqlite'), mode='record'))
+
+    with FakeGraphApi() as fake_api:
+        monkeypatch.setattr(graph_api, 'GRAPH_API_URL', fake_api.url)
+        recorded = graph_api.make_request('/v25.0/FarerskieKadry', {'access_token': 'foo'})
+
+    # the fake API is gone by now, no network requests are made
+    replay_cache = ResponseCache(str(tmp_path / 'cache.sqlite'), mode='replay')
+    monkeypatch.setattr(graph_api, 'default_response_cache', lambda: replay_cache)
+
+    assert graph_api.make_request('/v25.0/FarerskieKadry', {'access_token': 'bar'}) == recorded
+
+    with pytest.raises(GraphApiError):
+        graph_api.make_request('/v25.0/FarerskieKadry/feed', {'access_token': 'bar'})
+
+
+def test_ttl_and_eviction(tmp_path):
+    now = [1000.0]
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), mode='ttl', ttl=60, max_bytes=100, max_age=3600,
+                          clock=lambda: now[0])
+
+    cache.put('/v25.0/FarerskieKadry', {}, _response(b'{"id": 1}'))
+    assert cache.get('/v25.0/FarerskieKadry', {}).json() == {'id': 1}
+
+    now[0] += 120
+    assert cache.get('/v25.0/FarerskieKadry', {}) is None
+    assert cache.get('/v25.0/FarerskieKadry', {}, ttl=3600).json() == {'id': 1}
+
+    # the older entry is evicted to keep the cache within max_bytes
+    cache.put('/v25.0/FarerskieKadry/feed', {}, _response(b'{"data": ["%s"]}' % os.urandom(200).hex().encode()),
+              ttl=60)
+    assert cache.get('/v25.0/FarerskieKadry', {}, ttl=3600) is None
+
+    # and the entry older than max_age too
+    cache.put('/v25.0/FarerskieKadry', {}, _response(b'{"id": 1}'))
+    now[0] += 7200
+    cache.put('/v25.0/FarerskieKadry/media', {}, _response(b'{}'), ttl=60)
+    assert cache.get('/v25.0/FarerskieKadry', {}, ttl=10 ** 6) is None
+
+
+def test_ttl_skips_the_paged_feeds(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), mode='ttl', ttl=3600)
+
+    # the newest posts are always fetched, unless the request asks for the cache
+    cache.put('/v25.0/FarerskieKadry/feed', {}, _response(b'{"data": []}'))
+    assert cache.get('/v25.0/FarerskieKadry/feed', {}) is None
+
+    cache.put('/v25.0/17841407952879412/media', {}, _response(b'{"data": []}'), ttl=60)
+    assert cache.get('/v25.0/17841407952879412/media', {}) is None
+    assert cache.get('/v25.0/17841407952879412/media', {}, ttl=60).json() == {'data': []}
+
+    cache.put('/v25.0/FarerskieKadry', {}, _response(b'{"id": 1}'))
+    assert cache.get('/v25.0/FarerskieKadry', {}).json() == {'id': 1}
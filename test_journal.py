@@ -0,0 +1,68 @@
+from datetime import datetime
+
+from archive import merge_into_archive
+from journal import JournalConfig, build_journals, journal_posts, polish_date
+
+
+def picture(month: int, day: int) -> str:
+    return f'https://scontent.example.com/{month}_{day}_n.jpg'
+
+
+def test_polish_date():
+    assert polish_date('2017-04-02 12:00:00') == '2 kwietnia 2017'
+    assert polish_date('2026-09-15 12:00:00') == '15 września 2026'
+
+
+def test_journal_config_for_years():
+    configs = JournalConfig.from_dict({
+        'name': 'Dziennik-{year}', 'hashtag': 'Foo', 'archives': [], 'output': '{year}.html',
+        'since': '2017-04-01', 'years': [2017, 2018],
+    })
+
+    assert [(config.name, config.output, config.since, config.until) for config in configs] == [
+        ('Dziennik-2017', '2017.html', '2017-04-01', '2018-01-01'),
+        ('Dziennik-2018', '2018.html', '2018-01-01', '2019-01-01'),
+    ]
+
+
+def test_build_journals(tmp_path, make_post, make_media):
+    fb_archive, ig_archive = str(tmp_path / 'fb.ndjson'), str(tmp_path / 'ig.ndjson')
+
+    merge_into_archive(fb_archive, [
+        make_post(datetime(2017, 6, 1, 12), 'Dzień 5. Out of range #FarerskiDziennikZPodróży',
+                  full_picture=picture(6, 1)),
+        make_post(datetime(2017, 5, 3, 12), 'Dzień 3. Gjógv\n\nSecond paragraph #FarerskiDziennikZPodróży',
+                  full_picture=picture(5, 3)),
+        make_post(datetime(2017, 4, 1, 12), 'Dzień 1. Vágar #FarerskiDziennikZPodróży', full_picture=picture(4, 1)),
+    ])
+    merge_into_archive(ig_archive, [
+        # cross-posted to Facebook a day later
+        make_media(datetime(2017, 5, 2, 12), 'Dzień 3. Gjógv\n\nSecond paragraph #FarerskiDziennikZPodróży',
+                   full_picture=picture(5, 2)),
+        make_media(datetime(2017, 4, 20, 12), 'Dzień 2. Tórshavn #farerskidziennikzpodróży',
+                   full_picture=picture(4, 20)),
+        make_media(datetime(2017, 4, 21, 12), 'Not a part of the journal #Tórshavn', full_picture=picture(4, 21)),
+    ])
+
+    posts = journal_posts([fb_archive, ig_archive], 'FarerskiDziennikZPodróży', until='2017-06-01')
+    assert [post['message'][0:8] for post in posts] == ['Dzień 1.', 'Dzień 2.', 'Dzień 3.']
+
+    # the overlapping archives
+    posts = journal_posts([fb_archive, fb_archive], 'FarerskiDziennikZPodróży', until='2017-06-01')
+    assert [post['message'][0:8] for post in posts] == ['Dzień 1.', 'Dzień 3.']
+
+    config = JournalConfig(name='Dziennik', hashtag='FarerskiDziennikZPodróży', archives=[fb_archive, ig_archive],
+                           output=str(tmp_path / 'journal.html'), until='2017-06-01', images_dir='/images')
+    results = build_journals([config, JournalConfig(**{**config.__dict__, 'output': str(tmp_path / 'copy.html')})],
+                             workers=2)
+
+    assert [result.posts for result in results] == [3, 3]
+    assert results[0].images['https://scontent.example.com/5_2_n.jpg'] == '/images/Dziennik_03.jpg'
+
+    html = (tmp_path / 'journal.html').read_text()
+
+    assert html == (tmp_path / 'copy.html').read_text()
+    assert "<h2 style='clear: both'>Dzień 3</h2>" in html
+    assert 'Gjógv</p><p>Second paragraph</p>' in html
+    assert 'Notka z 2 maja 2017' in html
+    assert 'farerskidziennikzpodróży' not in html.lower()
@@ -0,0 +1,132 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from facebook import FacebookPost
+from media_mirror import MediaMirror, asset_id, expires_at
+
+IMAGE = os.urandom(1000)
+
+
+class StubCdnHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('range')))
+
+        if 'missing' in self.path:
+            self.send_error(404)
+            return
+
+        start = int(self.headers['range'][6:-1]) if self.headers.get('range') else 0
+
+        if start >= len(IMAGE):
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(IMAGE)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(206 if start else 200)
+        self.send_header('Content-Length', str(len(IMAGE) - start))
+        self.end_headers()
+        self.wfile.write(IMAGE[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def cdn_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubCdnHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    StubCdnHandler.requests = []
+
+    yield f'http://127.0.0.1:{server.server_port}/v/t39.30808-6'
+    server.shutdown()
+
+
+def test_asset_id():
+    assert asset_id('https://scontent.xx.fbcdn.net/v/t39.30808-6/776222806_1698_3592_n.jpg?stp=dst-jpg&oe=6A8F4EC4') \
+        == '776222806_1698_3592_n.jpg'
+    assert asset_id('https://scontent.xx.fbcdn.net/v/') is None
+    assert asset_id(None) is None
+
+
+def test_fetch_all(tmp_path, cdn_url):
+    mirror = MediaMirror(str(tmp_path))
+    urls = [f'{cdn_url}/{idx}_n.jpg?oe=7FFFFFF{idx}' for idx in range(5)]
+
+    mirrored = mirror.fetch_all(urls + [f'{cdn_url}/missing_n.jpg'])
+
+    assert sorted(mirrored) == sorted(urls)
+    assert open(mirrored[urls[0]], 'rb').read() == IMAGE
+    assert len(StubCdnHandler.requests) == 6
+
+    # the images are already there - the URLs are signed differently now
+    mirror.fetch_all(f'{cdn_url}/{idx}_n.jpg?oe=8FFFFFF{idx}' for idx in range(5))
+    assert len(StubCdnHandler.requests) == 6
+
+
+def test_fetch_resumes_partial_download(tmp_path, cdn_url):
+    mirror = MediaMirror(str(tmp_path))
+
+    with open(tmp_path / '1_n.jpg.part', 'wb') as fp:
+        fp.write(IMAGE[:300])
+
+    path = mirror.fetch(f'{cdn_url}/1_n.jpg')
+
+    assert StubCdnHandler.requests == [('/v/t39.30808-6/1_n.jpg', 'bytes=300-')]
+    assert open(path, 'rb').read() == IMAGE
+    assert not os.path.exists(tmp_path / '1_n.jpg.part')
+
+
+@pytest.mark.parametrize('part', [IMAGE, IMAGE + b'garbage'])
+def test_fetch_finishes_complete_partial_download(tmp_path, cdn_url, part):
+    mirror = MediaMirror(str(tmp_path))
+
+    with open(tmp_path / '1_n.jpg.part', 'wb') as fp:
+        fp.write(part)
+
+    # 416 Range Not Satisfiable - the complete part is finalised, the mismatching one is downloaded again
+    path = mirror.fetch(f'{cdn_url}/1_n.jpg')
+
+    assert StubCdnHandler.requests[0] == ('/v/t39.30808-6/1_n.jpg', f'bytes={len(part)}-')
+    assert len(StubCdnHandler.requests) == (1 if part == IMAGE else 2)
+    assert open(path, 'rb').read() == IMAGE
+    assert not os.path.exists(tmp_path / '1_n.jpg.part')
+
+
+def test_mirror_entities(tmp_path, cdn_url):
+    mirror = MediaMirror(str(tmp_path), base_url='https://example.com/media/')
+
+    posts = [
+        FacebookPost(message='foo', permalink_url='https://example.com/1', full_picture=f'{cdn_url}/1_n.jpg?oe=7FFFFFFF',
+                     created_time=None, link=None),
+        FacebookPost(message='bar', permalink_url='https://example.com/2', full_picture=f'{cdn_url}/missing_n.jpg',
+                     created_time=None, link=None),
+    ]
+
+    mirrored = list(mirror.mirror_entities(posts))
+
+    assert mirrored[0].full_picture == 'https://example.com/media/1_n.jpg'
+    assert mirrored[0].message == 'foo'
+    assert mirrored[1].full_picture == f'{cdn_url}/missing_n.jpg'
+
+
+def test_expired_urls_are_not_requested(tmp_path, cdn_url):
+    assert expires_at('https://scontent.xx.fbcdn.net/v/t39.30808-6/1_n.jpg?stp=dst-jpg&oe=6A8F4EC4') == 1787776708
+    assert expires_at('https://scontent.xx.fbcdn.net/v/t39.30808-6/1_n.jpg?oe=foo') is None
+    assert expires_at(None) is None
+
+    mirror = MediaMirror(str(tmp_path))
+
+    assert mirror.fetch(f'{cdn_url}/1_n.jpg?oe=5F5E0FF') is None
+    assert StubCdnHandler.requests == []
+
+    assert mirror.fetch(f'{cdn_url}/1_n.jpg?oe=7FFFFFFF') == str(tmp_path / '1_n.jpg')
+
+    # the mirrored copy is still there
+    assert mirror.fetch(f'{cdn_url}/1_n.jpg?oe=5F5E0FF') == str(tmp_path / '1_n.jpg')
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+from merged_feed import caption_hash, merge_feeds
+
+NOW = datetime(2026, 8, 17, 11, 16, 50)
+
+
+def test_caption_hash():
+    assert caption_hash('Farerski Okręg Przemysłowy!') == caption_hash('farerski  okręg przemysłowy')
+    assert caption_hash('Tórshavn') is None
+    assert caption_hash(None) is None
+
+
+def test_merge_feeds(make_post, make_media):
+    def fb_post(idx: int, hours: int, message: str, picture: str):
+        return make_post(NOW - timedelta(hours=hours), message, permalink_url=f'https://facebook.com/{idx}',
+                         full_picture=f'https://scontent.xx.fbcdn.net/v/{picture}?oe=1')
+
+    def ig_media(idx: int, hours: int, message: str, picture: str):
+        return make_media(NOW - timedelta(hours=hours), message, permalink_url=f'https://instagram.com/{idx}',
+                          full_picture=f'https://scontent.cdninstagram.com/v/{picture}?oe=2', like_count=5)
+
+    fb_feed = [
+        fb_post(1, hours=1, message='A cross-post of the Instagram photo', picture='1_n.jpg'),
+        fb_post(2, hours=2, message='Facebook only', picture='2_n.jpg'),
+        fb_post(3, hours=3, message='Same caption, but a different image', picture='3_n.jpg'),
+        fb_post(4, hours=100, message='Old photo posted again', picture='4_n.jpg'),
+    ]
+    ig_feed = [
+        ig_media(11, hours=5, message='A cross-post of the Instagram photo\n\n#WyspyOwcze', picture='1_n.jpg'),
+        ig_media(13, hours=6, message='same caption but a different image', picture='13_n.jpg'),
+        ig_media(14, hours=7, message='Old photo', picture='4_n.jpg'),
+    ]
+
+    merged = list(merge_feeds(fb_feed, ig_feed, window=timedelta(hours=48)))
+
+    assert [entity.permalink_url for entity in merged] == [
+        # the richer (with a longer caption) Instagram entry is kept
+        'https://instagram.com/11',
+        'https://facebook.com/2',
+        'https://facebook.com/3',
+        'https://instagram.com/14',
+        # outside of the time window
+        'https://facebook.com/4',
+    ]
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+import graph_api
+import instagram
+from fake_graph_api import FakeGraphApi, FakeGraphApiConfig, IG_ACCOUNT_ID
+from metadata_cache import MetadataCache
+from retry import GraphApiError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_metadata_cache(tmp_path):
+    clock = FakeClock()
+    cache = MetadataCache(str(tmp_path / 'metadata.json'), ttl=3600, clock=clock)
+
+    assert cache.get('fb_page:foo') is None
+
+    cache.put('fb_page:foo', {'ig_account_id': '123'})
+    assert cache.get('fb_page:foo') == {'ig_account_id': '123'}
+
+    # the entries are persisted
+    assert MetadataCache(str(tmp_path / 'metadata.json'), clock=clock).get('fb_page:foo') == {'ig_account_id': '123'}
+
+    clock.now += 3601
+    assert cache.get('fb_page:foo') is None
+
+    cache.put('fb_page:foo', {'ig_account_id': '456'})
+    cache.invalidate('fb_page:foo')
+    cache.invalidate('fb_page:bar')
+
+    assert cache.get('fb_page:foo') is None
+    assert MetadataCache(str(tmp_path / 'metadata.json'), clock=clock).get('fb_page:foo') is None
+
+
+def test_ig_account_id_for_fb_page(tmp_path, monkeypatch, no_waiting):
+    cache = MetadataCache(str(tmp_path / 'metadata.json'))
+    monkeypatch.setattr(instagram, 'default_metadata_cache', lambda: cache)
+
+    with FakeGraphApi(FakeGraphApiConfig(pages=1)) as fake_api:
+        monkeypatch.setattr(graph_api, 'GRAPH_API_URL', fake_api.url)
+
+        assert instagram.ig_account_id_for_fb_page('FarerskieKadry', 'fake') == IG_ACCOUNT_ID
+        assert instagram.ig_account_id_for_fb_page('FarerskieKadry', 'fake') == IG_ACCOUNT_ID
+        assert fake_api.requests_count == 1
+
+    # the cached id is no longer valid
+    cache.put('fb_page:FarerskieKadry', {'ig_account_id': 'stale'})
+
+    with FakeGraphApi(FakeGraphApiConfig(pages=1, errors={1: 100})) as fake_api:
+        monkeypatch.setattr(graph_api, 'GRAPH_API_URL', fake_api.url)
+
+        with pytest.raises(GraphApiError):
+            asyncio.run(instagram.update_feed_async('FarerskieKadry', 'fake', archive_path=str(tmp_path / 'ig.ndjson'),
+                                                    rss_path=str(tmp_path / 'ig.xml')))
+
+        # it goes straight to the media endpoint
+        assert fake_api.requests_count == 1
+        assert cache.get('fb_page:FarerskieKadry') is None
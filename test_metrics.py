@@ -0,0 +1,60 @@
+import json
+
+import graph_api
+import main
+from fake_graph_api import FakeGraphApi
+from metrics import Metrics, metrics, NOOP_TIMER
+
+
+def test_metrics_disabled():
+    disabled = Metrics(enabled=False)
+
+    assert disabled.timer('http_request') is NOOP_TIMER
+    disabled.count('requests')
+
+    assert disabled.summary()['counters'] == {}
+    assert disabled.summary()['stages'] == {}
+
+
+def test_metrics_reports(tmp_path):
+    enabled = Metrics(enabled=True)
+
+    for _ in range(3):
+        with enabled.timer('json_decode'):
+            json.loads('{"data": []}')
+
+    enabled.count('response_bytes', 512)
+    enabled.count('items.facebook', 10)
+
+    summary = enabled.summary()
+    assert summary['stages']['json_decode']['calls'] == 3
+    assert summary['counters'] == {'items.facebook': 10, 'response_bytes': 512}
+    assert summary['items_per_sec'] > 0
+
+    enabled.write_reports(json_path=str(tmp_path / 'metrics.json'), textfile_path=str(tmp_path / 'metrics.prom'))
+
+    assert json.load(open(tmp_path / 'metrics.json'))['counters']['response_bytes'] == 512
+
+    textfile = open(tmp_path / 'metrics.prom').read()
+    assert 'feed_stage_calls_total{stage="json_decode"} 3' in textfile
+    assert 'feed_events_total{name="response_bytes"} 512' in textfile
+
+
+def test_pipeline_metrics(tmp_path, monkeypatch, no_waiting):
+    monkeypatch.setattr(metrics, 'enabled', True)
+    metrics.reset()
+
+    with FakeGraphApi() as fake_api:
+        monkeypatch.setattr(graph_api, 'GRAPH_API_URL', fake_api.url)
+
+        main.update_feed(feed_name='FarerskieKadry', access_token='fake',
+                         archive_path=str(tmp_path / 'fb.ndjson'), rss_path=str(tmp_path / 'fb.xml'))
+
+        summary = metrics.summary()
+
+        assert summary['counters']['requests'] == fake_api.requests_count
+        assert summary['counters']['response_bytes'] == fake_api.bytes_sent
+        assert summary['counters']['items.facebook'] == 75
+
+        for stage in ('http_request', 'json_decode', 'parse_created_time', 'rss_item', 'rss_render', 'file_write'):
+            assert summary['stages'][stage]['calls'] > 0, stage
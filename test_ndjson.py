@@ -0,0 +1,60 @@
+import gzip
+import io
+import json
+
+import pytest
+
+from ndjson import NdjsonWriter, encode_line, read_rows
+
+ROWS = [
+    {'message': f'Zażółć gęślą jaźń #{idx} "quoted" <b>', 'permalink_url': f'https://www.example.com/{idx}',
+     'full_picture': None, 'created_time': '2026-08-17 11:16:50', 'like_count': str(idx)}
+    for idx in range(100)
+]
+
+
+def _json_dump_lines(rows) -> bytes:
+    return ''.join(json.dumps(row, sort_keys=True) + '\n' for row in rows).encode()
+
+
+def test_encode_line():
+    assert encode_line(ROWS[0]).encode() == _json_dump_lines(ROWS[0:1])
+
+
+def test_writer_is_byte_compatible(tmp_path):
+    path = str(tmp_path / 'archive.ndjson')
+
+    with NdjsonWriter.open(path, buffer_size=1024) as writer:
+        assert writer.write_rows(ROWS) == 100
+
+    assert open(path, 'rb').read() == _json_dump_lines(ROWS)
+    assert list(read_rows(path)) == ROWS
+
+
+def test_gzip_frames(tmp_path):
+    path = str(tmp_path / 'archive.ndjson.gz')
+
+    # each batch is a separate gzip member, appending adds more of them
+    with NdjsonWriter.open(path, buffer_size=1024) as writer:
+        writer.write_rows(ROWS[0:50])
+
+    with NdjsonWriter.open(path, mode='ab') as writer:
+        writer.write_rows(ROWS[50:])
+
+    assert gzip.open(path, 'rb').read() == _json_dump_lines(ROWS)
+    assert list(read_rows(path)) == ROWS
+
+
+def test_zstd_frames(tmp_path):
+    pytest.importorskip('zstandard')
+    path = str(tmp_path / 'archive.ndjson.zst')
+
+    with NdjsonWriter.open(path, buffer_size=1024) as writer:
+        writer.write_rows(ROWS)
+
+    assert list(read_rows(path)) == ROWS
+
+
+def test_unsupported_compression():
+    with pytest.raises(ValueError):
+        NdjsonWriter(io.BytesIO(), compression='lzma')
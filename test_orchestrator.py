@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+import graph_api
+from fake_graph_api import FakeGraphApi, FakeGraphApiConfig
+from orchestrator import load_config, run_feeds, write_summary
+
+
+def _write_config(tmp_path, feeds: list[dict], **kwargs) -> str:
+    path = tmp_path / 'feeds.json'
+    path.write_text(json.dumps({'feeds': feeds, **kwargs}))
+    return str(path)
+
+
+def _feed(tmp_path, name: str, feed_type: str, **kwargs) -> dict:
+    return {'name': name, 'type': feed_type, 'page': 'FarerskieKadry',
+            'archive': str(tmp_path / f'{name}.ndjson'), 'rss': str(tmp_path / f'{name}.xml'), **kwargs}
+
+
+def test_load_config(tmp_path):
+    config = load_config(_write_config(tmp_path, [_feed(tmp_path, 'fb', 'facebook', title='Foo')], workers=2))
+
+    assert config.workers == 2
+    assert config.feeds[0].token_env == 'FB_TOKEN'
+    assert config.feeds[0].channel == {'title': 'Foo'}
+
+    with pytest.raises(ValueError):
+        load_config(_write_config(tmp_path, [_feed(tmp_path, 'fb', 'twitter')]))
+
+    with pytest.raises(ValueError):
+        load_config(_write_config(tmp_path, [_feed(tmp_path, 'fb', 'facebook')],
+                                  merged=[{'rss': 'all.xml', 'facebook': 'fb', 'instagram': 'ig'}]))
+
+
+def test_run_feeds(tmp_path, monkeypatch, no_waiting):
+    feeds = [
+        _feed(tmp_path, 'fb', 'facebook', title='Foo on Facebook'),
+        _feed(tmp_path, 'ig', 'instagram'),
+        # the output directory does not exist
+        {**_feed(tmp_path, 'broken', 'facebook'), 'rss': str(tmp_path / 'missing' / 'broken.xml')},
+    ]
+    config = load_config(_write_config(
+        tmp_path, feeds, workers=2,
+        merged=[{'rss': str(tmp_path / 'all.xml'), 'facebook': 'fb', 'instagram': 'ig'}]
+    ))
+
+    with FakeGraphApi(FakeGraphApiConfig(pages=2)) as fake_api:
+        monkeypatch.setattr(graph_api, 'GRAPH_API_URL', fake_api.url)
+        results = asyncio.run(run_feeds(config, token_for=lambda feed: 'fake'))
+
+    assert [(result.name, result.ok, result.new_items) for result in results] == [
+        ('fb', True, 50), ('ig', True, 50), ('broken', False, 0), (str(tmp_path / 'all.xml'), True, 0),
+    ]
+    assert 'FileNotFoundError' in results[2].error
+
+    assert '<title>Foo on Facebook</title>' in (tmp_path / 'fb.xml').read_text()
+    assert (tmp_path / 'all.xml').read_text().count('<item>') == 30
+
+    summary = write_summary(str(tmp_path / 'summary.json'), results, wall_time=1.0)
+    assert (summary['ok'], summary['failed'], summary['new_items']) == (3, 1, 100)
+    assert json.loads((tmp_path / 'summary.json').read_text()) == summary
@@ -0,0 +1,93 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from archive import merge_into_archive, read_archive, read_archive_state
+from instagram import InstagramMedia
+from journal import journal_posts
+from partitioned_archive import PartitionedArchive
+from search_index import SearchIndex
+
+
+@pytest.fixture
+def media(make_media):
+    def media(year: int, idx: int, like_count: int = 0, message: str = 'Foo', **kwargs) -> InstagramMedia:
+        return make_media(datetime(year, 4, idx, 12, 0, 0), message, like_count=like_count, **kwargs)
+
+    return media
+
+
+def test_append_and_supersede(tmp_path, media):
+    archive = PartitionedArchive(str(tmp_path / 'ig'))
+
+    assert archive.append([media(2017, 2), media(2017, 1), media(2026, 1)]) == 3
+    assert sorted(os.listdir(tmp_path / 'ig')) == ['2017.ndjson', '2026.ndjson']
+
+    segment_2017 = (tmp_path / 'ig' / '2017.ndjson').read_text()
+
+    # the same entities are skipped, the updated ones supersede the stored records of the current year only
+    assert archive.append([media(2026, 2), media(2026, 1, like_count=5), media(2017, 2)]) == 2
+    assert (tmp_path / 'ig' / '2017.ndjson').read_text() == segment_2017
+
+    # a fresh instance reads the segments
+    archive = PartitionedArchive(str(tmp_path / 'ig'))
+    rows = list(archive.rows())
+
+    assert [(row['created_time'], row['like_count']) for row in rows] == [
+        ('2026-04-02 12:00:00', '0'), ('2026-04-01 12:00:00', '5'),
+        ('2017-04-02 12:00:00', '0'), ('2017-04-01 12:00:00', '0'),
+    ]
+    assert archive.newest_created_time() == datetime(2026, 4, 2, 12, 0, 0)
+    assert len(archive.permalinks()) == 4
+
+    # the record that has moved to another year is read from the newest segment only
+    moved = 'https://www.instagram.com/p/moved/'
+    archive.append([media(2017, 3, permalink_url=moved), media(2026, 3, like_count=1, permalink_url=moved)])
+
+    assert [row['like_count'] for row in archive.rows() if row['permalink_url'] == moved] == ['1']
+
+
+def test_compact(tmp_path, media):
+    archive = PartitionedArchive(str(tmp_path / 'ig'))
+    archive.append([media(2017, idx) for idx in range(1, 11)])
+    archive.append([media(2026, 1)])
+
+    # one edit out of 11 records is below the threshold
+    archive.append([media(2017, 1, message='Edited')])
+    assert archive.compact(threshold=0.2) == []
+
+    archive.append([media(2017, 2, message='Edited'), media(2017, 3, message='Edited')])
+    assert archive.segment('2017').dead_ratio == 3 / 13
+
+    assert archive.compact(threshold=0.2) == ['2017']
+    assert (tmp_path / 'ig' / '2017.ndjson').read_text().count('\n') == 10
+
+    rows = list(PartitionedArchive(str(tmp_path / 'ig')).rows())
+    assert [row['message'] for row in rows if row['message'] == 'Edited'] == ['Edited'] * 3
+
+
+def test_archive_functions_use_the_partitions(tmp_path, media):
+    archive_path = str(tmp_path / 'ig') + '/'
+
+    assert read_archive_state(archive_path).newest_created_time is None
+
+    merge_into_archive(archive_path, [media(2026, 2), media(2025, 1)])
+    merge_into_archive(archive_path, [media(2026, 3)])
+
+    state = read_archive_state(archive_path)
+    assert state.newest_created_time == datetime(2026, 4, 3, 12, 0, 0)
+    assert len(state.permalinks) == 3
+
+    assert [entity.created_time.year for entity in read_archive(archive_path, InstagramMedia)] == [2026, 2026, 2025]
+
+    # the refreshed entities supersede the stored records
+    assert merge_into_archive(archive_path, [], refreshed=[media(2026, 3, like_count=7), media(2025, 1)]) == 1
+    assert [entity.like_count for entity in read_archive(archive_path, InstagramMedia)] == ['7', '0', '0']
+
+    # the indexed readers need the single-file archive
+    with pytest.raises(ValueError, match='partitioned archive'):
+        list(journal_posts([archive_path], 'Foo'))
+
+    with pytest.raises(ValueError, match='partitioned archive'):
+        SearchIndex(str(tmp_path / 'search_index.json')).update([archive_path.rstrip('/')])
@@ -0,0 +1,42 @@
+from datetime import datetime
+from io import StringIO
+
+import pytest
+
+from pipeline import fan_out, NdjsonSink, Sink
+
+
+class ListSink(Sink):
+    def __init__(self, items_limit: int):
+        self.items_limit = items_limit
+        self.entities = []
+
+    def add(self, entity):
+        if not self.is_full:
+            self.entities.append(entity)
+
+    @property
+    def is_full(self) -> bool:
+        return len(self.entities) >= self.items_limit
+
+
+@pytest.fixture
+def posts(make_post):
+    def posts(count: int):
+        for idx in range(count):
+            yield make_post(datetime(2023, 2, 27, 14, 31, idx), f'Post #{idx}')
+
+    return posts
+
+
+def test_fan_out(posts):
+    ndjson, bounded = StringIO(), ListSink(items_limit=3)
+
+    assert fan_out(posts(5), sinks=[NdjsonSink(ndjson), bounded]) == 5
+
+    assert len(ndjson.getvalue().splitlines()) == 5
+    assert [post.message for post in bounded.entities] == ['Post #0', 'Post #1', 'Post #2']
+
+
+def test_fan_out_stops_when_sinks_are_full(posts):
+    assert fan_out(posts(50), sinks=[ListSink(items_limit=3)]) == 3
@@ -0,0 +1,101 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import graph_api
+from rate_limiter import RateLimiter, TokenBucket, parse_usage_header, rate_for_usage, MAX_RATE, MIN_RATE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+def test_rate_for_usage():
+    assert rate_for_usage(0) == MAX_RATE
+    assert rate_for_usage(50) == MAX_RATE
+    assert MIN_RATE < rate_for_usage(75) < rate_for_usage(60) < MAX_RATE
+    assert rate_for_usage(100) == MIN_RATE
+
+
+def test_parse_usage_header():
+    assert parse_usage_header(None) == (0, 0)
+    assert parse_usage_header('{"call_count":28,"total_time":25,"total_cputime":5}') == (28, 0)
+    assert parse_usage_header(
+        '{"1234":[{"type":"pages","call_count":8,"total_cputime":95,"total_time":2,'
+        '"estimated_time_to_regain_access":3}]}'
+    ) == (95, 3)
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0.5
+    assert bucket.reserve() == 1.0
+
+    clock.sleep(1.0)
+    assert bucket.reserve() == 0.5
+
+
+class StubGraphApiHandler(BaseHTTPRequestHandler):
+    usage = {}
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-App-Usage', json.dumps({'call_count': 10, 'total_time': 5, 'total_cputime': 5}))
+        self.send_header('X-Page-Usage', json.dumps(self.usage))
+        self.end_headers()
+        self.wfile.write(json.dumps({'data': []}).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_graph_api(monkeypatch):
+    server = HTTPServer(('127.0.0.1', 0), StubGraphApiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    clock = FakeClock()
+    monkeypatch.setattr(graph_api, 'GRAPH_API_URL', f'http://127.0.0.1:{server.server_port}')
+    monkeypatch.setattr(graph_api, 'rate_limiter', RateLimiter(clock=clock, sleep_func=clock.sleep))
+
+    yield clock
+    server.shutdown()
+
+
+def test_make_request_pacing(stub_graph_api):
+    clock = stub_graph_api
+
+    # low usage - full speed
+    StubGraphApiHandler.usage = {'call_count': 5}
+    graph_api.make_request('/v25.0/FarerskieKadry/feed', req_params={})
+    graph_api.make_request('/v25.0/FarerskieKadry/feed', req_params={})
+    assert clock.now == 0
+
+    pacing = graph_api.rate_limiter.pacing()
+    assert pacing['app'].usage == 10
+    assert pacing['FarerskieKadry'].rate == MAX_RATE
+
+    # the page usage nears the limit - slow down
+    StubGraphApiHandler.usage = {'call_count': 90}
+    for _ in range(6):
+        graph_api.make_request('/v25.0/FarerskieKadry/feed', req_params={})
+
+    pacing = graph_api.rate_limiter.pacing()
+    assert pacing['FarerskieKadry'].rate == rate_for_usage(90)
+    assert pacing['FarerskieKadry'].last_wait > 0
+    assert pacing['app'].last_wait == 0
+    assert clock.now > 1
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+from requests import Response
+from requests.exceptions import ConnectTimeout, HTTPError
+
+import graph_api
+from retry import classify_error, split_fields, ErrorKind, GraphApiError, PageSize, RetryPolicy
+
+
+def _http_error(status_code: int, body: dict, headers: dict = None) -> HTTPError:
+    resp = Response()
+    resp.status_code = status_code
+    resp._content = json.dumps(body).encode()
+    resp.headers.update(headers or {})
+
+    return HTTPError(response=resp)
+
+
+def test_classify_error():
+    assert classify_error(ConnectTimeout()).kind is ErrorKind.CONNECTION
+
+    error = classify_error(_http_error(500, {'error': {
+        'code': 1, 'message': "Please reduce the amount of data you're asking for, then retry your request"
+    }}))
+    assert error.kind is ErrorKind.REDUCE_DATA
+    assert error.code == 1
+
+    error = classify_error(_http_error(400, {'error': {'code': 613}}, headers={'Retry-After': '12'}))
+    assert error.kind is ErrorKind.THROTTLED
+    assert error.retry_after == 12
+
+    assert classify_error(_http_error(503, {})).kind is ErrorKind.TRANSIENT
+    assert classify_error(_http_error(400, {'error': {'code': 190}})).kind is ErrorKind.FATAL
+
+
+def test_retry_policy():
+    policy = RetryPolicy(attempts=3, base_wait=1, jitter=0)
+
+    transient = GraphApiError(ErrorKind.TRANSIENT, 'Server error')
+    assert policy.should_retry(transient, attempt=2)
+    assert not policy.should_retry(transient, attempt=3)
+    assert not policy.should_retry(GraphApiError(ErrorKind.FATAL, 'Invalid token'), attempt=1)
+
+    assert policy.wait_time(transient, attempt=1) == 1
+    assert policy.wait_time(transient, attempt=3) == 4
+    assert policy.wait_time(GraphApiError(ErrorKind.THROTTLED, 'Slow down', retry_after=42), attempt=1) == 42
+
+
+def test_page_size():
+    fields = 'full_picture,message,attachments{url}'
+    assert split_fields(fields) == ['full_picture', 'message', 'attachments{url}']
+
+    params = {'limit': 20, 'fields': fields}
+    page_size = PageSize(params, heavy_fields=['attachments{url}'])
+
+    assert page_size.shrink(params) and params['limit'] == 10
+    assert page_size.shrink(params) and params['limit'] == 5
+    assert page_size.shrink(params) and params['fields'] == 'full_picture,message'
+    assert not page_size.shrink(params)
+
+    page_size.grow(params)
+    assert params == {'limit': 10, 'fields': fields}
+    page_size.grow(params)
+    page_size.grow(params)
+    assert params == {'limit': 20, 'fields': fields}
+
+
+def test_iterate_api_responses_reduces_page_size(monkeypatch):
+    requested_limits = []
+
+    def make_request(_, req_params):
+        requested_limits.append(req_params['limit'])
+
+        if req_params['limit'] > 25:
+            raise GraphApiError(ErrorKind.REDUCE_DATA, 'Please reduce the amount of data', code=1)
+
+        after = int(req_params.get('after', 0))
+        return {
+            'data': [{'id': after + idx} for idx in range(req_params['limit'])],
+            'paging': {'cursors': {'after': str(after + req_params['limit'])}} if after < 50 else {},
+        }
+
+    monkeypatch.setattr(graph_api, 'make_request', make_request)
+
+    items = list(graph_api.iterate_api_responses('/v25.0/FarerskieKadry/feed', req_params={'limit': 100}))
+
+    assert [item['id'] for item in items] == list(range(75))
+    assert requested_limits == [100, 50, 25, 50, 25, 50, 25]
+
+
+def test_make_request_raises_classified_error(monkeypatch):
+    attempts = []
+
+    def get(*args, **kwargs):
+        attempts.append(args)
+        raise ConnectTimeout()
+
+    monkeypatch.setattr(graph_api.http, 'get', get)
+    monkeypatch.setattr(graph_api, 'sleep', lambda _: None)
+
+    with pytest.raises(GraphApiError) as ex:
+        graph_api.make_request('/v25.0/FarerskieKadry/feed', req_params={})
+
+    assert ex.value.kind is ErrorKind.CONNECTION
+    assert len(attempts) == RetryPolicy().attempts
+
+    # the number of attempts can still be passed as retries=
+    attempts.clear()
+
+    with pytest.raises(GraphApiError):
+        graph_api.make_request('/v25.0/FarerskieKadry/feed', req_params={}, retries=2)
+
+    assert len(attempts) == 2
@@ -0,0 +1,83 @@
+import io
+import os
+from datetime import datetime
+
+from rss import RssFeedItem, RssFeedWriter, canonicalize_url
+
+IMAGE_URL = 'https://scontent.xx.fbcdn.net/v/t39.30808-6/1_n.jpg?stp=dst-jpg_s960x960_tt6&_nc_cat=110' \
+            '&_nc_gid=Ab{gid}&oh=00_AQ{oe}&oe={oe}'
+
+
+def test_canonicalize_url():
+    assert canonicalize_url(IMAGE_URL.format(gid=1, oe='6A8F4EC4')) == \
+        'https://scontent.xx.fbcdn.net/v/t39.30808-6/1_n.jpg?stp=dst-jpg_s960x960_tt6&oh=00_AQ6A8F4EC4&oe=6A8F4EC4'
+    assert canonicalize_url(IMAGE_URL.format(gid=1, oe='6A8F4EC4')) == \
+        canonicalize_url(IMAGE_URL.format(gid=2, oe='6A8F4EC4'))
+    # the refreshed (signed again) URL
+    assert canonicalize_url(IMAGE_URL.format(gid=1, oe='6A8F4EC4')) != \
+        canonicalize_url(IMAGE_URL.format(gid=1, oe='6A9A7D11'))
+    assert canonicalize_url('https://example.com/foo') == 'https://example.com/foo'
+
+
+def write_feed(path: str, gid: int, message: str = 'Foo & bar', oe: str = '6A8F4EC4') -> RssFeedWriter:
+    with RssFeedWriter.for_file(path=path, title='Feed', link='https://example.com', description='Test') as feed:
+        for idx in range(3):
+            feed.add_item(RssFeedItem(
+                title=f'#Item{idx}',
+                link=f'https://example.com/{idx}',
+                description=f'<p><img src="{IMAGE_URL.format(gid=gid, oe=oe)}"></p>\n<p>{message}</p>',
+                published=datetime(2026, 8, 17, 11, 16, 50),
+            ))
+
+    return feed
+
+
+def test_for_file_skips_no_op_rewrites(tmp_path):
+    path = str(tmp_path / 'feed.xml')
+
+    assert write_feed(path, gid=1).changed is True
+    assert 'Abgid' not in open(path).read()
+    assert '_nc_gid=Ab1' in open(path).read()
+    modified = os.stat(path).st_mtime_ns
+
+    # only the volatile URL parameters have changed
+    assert write_feed(path, gid=2).changed is False
+    assert os.stat(path).st_mtime_ns == modified
+    assert '_nc_gid=Ab1' in open(path).read()
+
+    # the message has changed
+    assert write_feed(path, gid=2, message='Changed').changed is True
+    assert '_nc_gid=Ab2' in open(path).read()
+
+    # the image URL has been refreshed
+    assert write_feed(path, gid=3, message='Changed', oe='6A9A7D11').changed is True
+    assert 'oe=6A9A7D11' in open(path).read()
+
+    assert os.listdir(tmp_path) == ['feed.xml']
+
+
+def test_add_items_renders_the_same_output():
+    items = [
+        RssFeedItem(title='#Nólsoy', link='https://example.com/1?a=1&b=2', description='<p>Foo & <b>bar</b></p>',
+                    published=datetime(2026, 8, 17, 11, 16, 50)),
+        RssFeedItem(title='No date...', link='https://example.com/2', description='\n', published=None),
+        RssFeedItem(title='{braces}', link='https://example.com/3', description='',
+                    published=None, pub_date='Mon, 17 Aug 2026 11:16:50 -0000'),
+    ]
+
+    def render(batch: bool) -> tuple[str, dict]:
+        feed = RssFeedWriter(out=io.StringIO(), title='Feed', link='https://example.com', description=None,
+                             path='unused.xml')
+        feed.write_header()
+
+        if batch:
+            assert feed.add_items(iter(items)) == 3
+        else:
+            for item in items:
+                feed.add_item(item)
+
+        feed.write_footer()
+        return feed.out.getvalue(), feed.digests
+
+    assert render(batch=True) == render(batch=False)
+    assert '<link>https://example.com/1?a=1&amp;b=2</link>' in render(batch=True)[0]
@@ -0,0 +1,90 @@
+from datetime import datetime
+
+import pytest
+
+from archive import merge_into_archive
+from facebook import FacebookPost
+from journal import journal_posts
+from search_index import SearchHit, SearchIndex, fold, row_terms
+
+
+def day(permalink_url: str) -> str:
+    """
+    https://www.facebook.com/FarerskieKadry/posts/20170403120000 -> 20170403
+    """
+    return permalink_url[-14:-6]
+
+
+def test_fold():
+    assert fold('Nólsoy Selatrað Łódź Tórshavn Gøta Æðuvík') == 'nolsoy selatrad lodz torshavn gota aeduvik'
+
+
+def test_row_terms():
+    assert row_terms({'message': 'Dzień 1. #Selatrað, #Gjógv', 'created_time': '2017-04-01 12:00:00'}) == \
+        ['dzien', '1', 'selatrad', 'gjogv', '#selatrad', '#gjogv', '2017']
+
+
+def test_search_index(tmp_path, make_post):
+    archive_path = str(tmp_path / 'fb.ndjson')
+    index_path = str(tmp_path / 'search_index.json')
+
+    merge_into_archive(archive_path, [
+        make_post(datetime(2017, 4, 3, 12), 'Rejs na Nólsoy #FarerskiDziennikZPodróży'),
+        make_post(datetime(2017, 4, 2, 12), 'Widok z Tórshavn na Nolsoy, Nolsoy i jeszcze raz Nolsoy'),
+        make_post(datetime(2017, 4, 1, 12), 'Dzień 1. #Selatrað'),
+    ])
+
+    index = SearchIndex(index_path)
+    assert index.update([archive_path]) == 3
+    assert index.update([archive_path]) == 0
+
+    def permalinks(query: str, **kwargs) -> list[str]:
+        return [day(hit.permalink_url) for hit in index.search(query, **kwargs)]
+
+    assert permalinks('Nólsoy AND 2017') == ['20170403', '20170402']
+    assert permalinks('nolsoy tórshavn') == ['20170402']
+    assert permalinks('#Selatrað OR #farerskidziennikzpodrozy') == ['20170403', '20170401']
+    assert permalinks('2017 NOT (tórshavn OR #selatrad)') == ['20170403']
+    assert permalinks('selatrad') == ['20170401']
+    assert permalinks('#nolsoy') == []
+
+    # the post mentioning Nólsoy three times goes first, the terms are OR-ed
+    assert permalinks('nolsoy', ranked=True) == ['20170402', '20170403']
+    assert permalinks('nolsoy gjogv selatrad', ranked=True, limit=2)[1] == '20170402'
+
+    with pytest.raises(ValueError):
+        index.search('(nolsoy AND')
+
+    # new posts are indexed incrementally, the index is persisted
+    merge_into_archive(archive_path, [
+        make_post(datetime(2026, 4, 1, 12), 'Znowu na Nólsoy #FarerskiDziennikZPodróży'),
+    ])
+
+    index = SearchIndex(index_path)
+    assert index.update([archive_path]) == 1
+    assert permalinks('nolsoy') == ['20260401', '20170403', '20170402']
+
+    assert [row['message'][0:6] for row in index.rows(index.search('#selatrad'))] == ['Dzień ']
+
+    # the hits that are no longer archived are skipped, the rest stay paired with their posts
+    gone = SearchHit(permalink_url='https://www.facebook.com/FarerskieKadry/posts/1',
+                     created_time='2017-04-05 12:00:00', archive=archive_path)
+    assert [(day(hit.permalink_url), row['message'][0:6])
+            for hit, row in index.hit_rows([gone] + index.search('#selatrad'))] == [('20170401', 'Dzień ')]
+
+    assert [day(entity.permalink_url) for entity in index.hashtag_entities(archive_path, FacebookPost)] == \
+        ['20260401', '20170403', '20170401']
+
+    # the same post kept in another archive is indexed for it as well
+    other_archive_path = str(tmp_path / 'fb_2017.ndjson')
+    merge_into_archive(other_archive_path, [make_post(datetime(2017, 4, 1, 12), 'Dzień 1. #Selatrað')])
+
+    assert index.update([archive_path, other_archive_path]) == 1
+    assert [day(entity.permalink_url) for entity in index.hashtag_entities(other_archive_path, FacebookPost)] == \
+        ['20170401']
+    assert SearchIndex(index_path).update([archive_path, other_archive_path]) == 0
+
+    # the journal builder takes the posts via the index
+    posts = journal_posts([archive_path], 'FarerskiDziennikZPodróży', query='nolsoy', until='2020',
+                          search_index_path=index_path)
+    assert [day(post['permalink_url']) for post in posts] == ['20170403']
@@ -1,4 +1,7 @@
-from utils import get_first_hashtag
+from datetime import datetime
+
+from facebook import FacebookPost
+from utils import get_first_hashtag, response_entities_to_rss_items, response_entity_to_rss_item
 
 
 def test_get_first_hashtag():
@@ -10,5 +13,21 @@ def test_get_first_hashtag():
         'Za nie lada wyczyn uchodzi na Wyspach Owczych zgubienie się w leśnej gęstwinie ;)') is None
 
 
+def test_response_entities_to_rss_items():
+    entities = [
+        FacebookPost(message='Dzień 1.\n\n#Selatrað, #Gjógv\n\n\nfoo', permalink_url='https://example.com/1',
+                     full_picture='https://example.com/1.jpg', created_time=datetime(2017, 4, 1, 12, 0, 0), link=None),
+        FacebookPost(message='Za nie lada wyczyn uchodzi na Wyspach Owczych zgubienie się',
+                     permalink_url='https://example.com/2', full_picture=None,
+                     created_time=datetime(2017, 4, 2, 12, 0, 0), link=None),
+        FacebookPost(message='', permalink_url='https://example.com/3', full_picture=None,
+                     created_time=datetime(2017, 4, 3, 12, 0, 0), link=None),
+    ]
+
+    assert list(response_entities_to_rss_items(entities)) == \
+        [response_entity_to_rss_item(entity) for entity in entities]
+
+
 if __name__ == "__main__":
     test_get_first_hashtag()
+    test_response_entities_to_rss_items()
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import graph_api
+import watch
+from fake_graph_api import FakeGraphApi, FakeGraphApiConfig, synthetic_posts, to_fb_entry
+from orchestrator import FeedConfig, OrchestratorConfig
+from retry import ErrorKind, GraphApiError
+from watch import AdaptivePolling, WatchedFeed, Watcher
+
+NOW = datetime(2026, 8, 17, 12, 0, 0)
+
+
+def test_adaptive_polling():
+    polling = AdaptivePolling(min_interval=900, max_interval=43200, polls_per_post=4)
+
+    # the trip is on
+    assert polling.next_interval([(NOW - timedelta(hours=20), True), (NOW - timedelta(days=1, hours=20), True)],
+                                 NOW) == 900
+
+    # posting every few hours
+    assert polling.next_interval([(NOW - timedelta(hours=1), False), (NOW - timedelta(hours=5), False),
+                                  (NOW - timedelta(hours=9), False)], NOW) == 4 * 3600 / 4
+
+    # nothing posted for weeks
+    assert polling.next_interval([(NOW - timedelta(days=30), True), (NOW - timedelta(days=31), True)],
+                                 NOW) == 43200
+
+    assert polling.next_interval([], NOW) == 43200
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = NOW.timestamp()
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_watcher(tmp_path, monkeypatch, no_waiting):
+    renders = []
+    monkeypatch.setattr(watch.main, 'render_rss_feed', lambda *args: renders.append(args[1]))
+
+    config = OrchestratorConfig(feeds=[
+        FeedConfig(name='fb', type='facebook', page='FarerskieKadry',
+                   archive=str(tmp_path / 'fb.ndjson'), rss=str(tmp_path / 'fb.xml')),
+    ])
+    clock = FakeClock()
+
+    with FakeGraphApi(FakeGraphApiConfig(pages=2)) as fake_api:
+        monkeypatch.setattr(graph_api, 'GRAPH_API_URL', fake_api.url)
+
+        watcher = Watcher(config, token_for=lambda _: 'fake', clock=clock, sleep=clock.sleep)
+
+        # the full sync
+        assert watcher.poll_due() == {'fb': 50}
+        assert renders == [str(tmp_path / 'fb.xml')]
+
+        # nothing new - a single request and the feed is not rendered again
+        requests_count = fake_api.requests_count
+        next_poll_in = watcher.feeds[0].next_poll_at - clock.now
+        watcher.run(max_polls=1)
+
+        assert clock.sleeps == [next_poll_in]
+        assert fake_api.requests_count == requests_count + 1
+        assert len(renders) == 1
+
+        # a new post is published
+        new_post = synthetic_posts(1, 'new')[0]
+        new_post['created_time'] = '2026-08-17 13:00:00'
+        fake_api.fb_entries.insert(0, to_fb_entry(new_post))
+
+        watcher.run(max_polls=1)
+
+        assert len(renders) == 2
+        assert watcher.feeds[0].state.newest_created_time == datetime(2026, 8, 17, 13, 0, 0)
+        assert (tmp_path / 'fb.ndjson').read_text().count('\n') == 51
+
+        # every few hours the newest posts are listed again to refresh their image URLs
+        feed = watcher.feeds[0]
+        clock.now = max(feed.next_poll_at, feed.next_refresh_at)
+        requests_count = fake_api.requests_count
+
+        assert watcher.poll_due() == {'fb': 0}
+        # the single page of posts and the ids lookup
+        assert fake_api.requests_count == requests_count + 2
+        assert len(renders) == 3
+
+
+def test_watched_feed_forgets_the_invalid_ig_account(tmp_path, monkeypatch):
+    forgotten = []
+    monkeypatch.setattr(watch, 'forget_ig_account', forgotten.append)
+    monkeypatch.setattr(watch, 'ig_account_id_for_fb_page', lambda fb_page, access_token: 'stale')
+
+    def get_instagram_feed(ig_account, *args, **kwargs):
+        raise GraphApiError(ErrorKind.FATAL, f'Unsupported get request: {ig_account}', code=100)
+
+    monkeypatch.setattr(watch, 'get_instagram_feed', get_instagram_feed)
+
+    feed = WatchedFeed(FeedConfig(name='ig', type='instagram', page='FarerskieKadry',
+                                  archive=str(tmp_path / 'ig.ndjson'), rss=str(tmp_path / 'ig.xml')),
+                       access_token='fake', polling=AdaptivePolling())
+
+    with pytest.raises(GraphApiError):
+        feed.poll()
+
+    # the account id is going to be resolved again
+    assert feed.ig_account is None
+    assert forgotten == ['FarerskieKadry']
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# Updates all the feeds listed in feeds.json concurrently, in a single process
+#
+# The crawls share the HTTP session (and its connection pool) and the rate limiter,
+# see orchestrator.py for the config file format.
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from metrics import instrumented_run
+from orchestrator import FeedResult, load_config, run_feeds, token_from_env, write_summary
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'feeds.json')
+
+
+async def update_all_feeds(access_token: Optional[str] = None, config_path: str = CONFIG_PATH) -> list[FeedResult]:
+    """
+    Updates the feeds from the config file, access_token (when provided) is used instead of the env variables
+    """
+    config = load_config(config_path)
+    started = time.perf_counter()
+
+    results = await run_feeds(
+        config, token_for=(lambda _: access_token) if access_token is not None else token_from_env
+    )
+
+    if config.summary:
+        write_summary(config.summary, results, wall_time=time.perf_counter() - started)
+
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()  # take environment variables from .env.
+
+    with instrumented_run():
+        feed_results = asyncio.run(update_all_feeds(config_path=sys.argv[1] if len(sys.argv) > 1 else CONFIG_PATH))
+
+    logging.info('Done')
+
+    # do not fail the whole workflow because of a single feed
+    if not any(result.ok for result in feed_results):
+        sys.exit(1)
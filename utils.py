@@ -1,9 +1,15 @@
 import re
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
 from graph_api import ResponseEntity
+from metrics import timed
 from rss import RssFeedItem
 
+HASHTAG_PATTERN = re.compile(r'#([^\s]+)')
+PARAGRAPH_BREAK_PATTERN = re.compile(r'\n\n')
+
+IMAGE_TEMPLATE = '<p><img src="{}" style="max-width: 500px; max-height: 500px" class="fb-feed-image"></p>'
+
 
 def get_first_hashtag(text: str) -> Optional[str]:
     """
@@ -11,10 +17,19 @@ def get_first_hashtag(text: str) -> Optional[str]:
 
     'So, #Víkarbyrgi and #Hamrabyrgi' -> Víkarbyrgi
     """
-    matches = re.search(r'#([^\s]+)', text)
+    matches = HASHTAG_PATTERN.search(text)
     return matches.group(1).rstrip(',.') if matches else None
 
 
+def get_hashtags(text: str) -> list[str]:
+    """
+    Returns all hashtags from the text provided
+
+    'So, #Víkarbyrgi and #Hamrabyrgi.' -> ['Víkarbyrgi', 'Hamrabyrgi']
+    """
+    return [hashtag.rstrip(',.') for hashtag in HASHTAG_PATTERN.findall(text)]
+
+
 def paragraphize(text: str) -> str:
     """
     Turns:
@@ -26,9 +41,10 @@ def paragraphize(text: str) -> str:
     into:
     <p>foo</p><p>bar</p>
     """
-    return '<p>' + re.sub(r'\n\n', '</p>\n<p>', text) + '</p>' if text else ''
+    return '<p>' + PARAGRAPH_BREAK_PATTERN.sub('</p>\n<p>', text) + '</p>' if text else ''
 
 
+@timed('rss_item')
 def response_entity_to_rss_item(entity: ResponseEntity) -> RssFeedItem:
     """
     Converts and formats the entity from the Facebook feed (FB post / Instagram media)
@@ -37,7 +53,7 @@ def response_entity_to_rss_item(entity: ResponseEntity) -> RssFeedItem:
     hashtag = get_first_hashtag(entity.message)
     title = ('#' + hashtag) if hashtag else (entity.message[0:32] + '...')
 
-    description = f'<p><img src="{entity.full_picture}" style="max-width: 500px; max-height: 500px" class="fb-feed-image"></p>' if entity.full_picture else ''
+    description = IMAGE_TEMPLATE.format(entity.full_picture) if entity.full_picture else ''
     description += f'\n{paragraphize(entity.message)}'
 
     return RssFeedItem(
@@ -45,4 +61,30 @@ def response_entity_to_rss_item(entity: ResponseEntity) -> RssFeedItem:
         link=entity.permalink_url,
         description=description,
         published=entity.created_time,
+        pub_date=entity.rfc822_date,
     )
+
+
+def response_entities_to_rss_items(entities: Iterable[ResponseEntity]) -> Iterator[RssFeedItem]:
+    """
+    Batch variant of response_entity_to_rss_item() for the bulk rendering (e.g. the whole archive into many feeds),
+    yields the very same items
+    """
+    search_hashtag = HASHTAG_PATTERN.search
+    image_template = IMAGE_TEMPLATE.format
+
+    for entity in entities:
+        message = entity.message
+        matches = search_hashtag(message)
+
+        # the paragraph breaks are plain "\n\n" strings, str.replace() gives the same result as the pattern
+        description = image_template(entity.full_picture) if entity.full_picture else ''
+        description += '\n<p>' + message.replace('\n\n', '</p>\n<p>') + '</p>' if message else '\n'
+
+        yield RssFeedItem(
+            title=('#' + matches.group(1).rstrip(',.')) if matches else (message[0:32] + '...'),
+            link=entity.permalink_url,
+            description=description,
+            published=entity.created_time,
+            pub_date=entity.rfc822_date,
+        )
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Watches the feeds listed in the config file (see feeds.json and orchestrator.py) in a long-running process
+
+Instead of the cold-start cron runs, the HTTP session, the resolved Instagram account ids and the state
+of the archives (the permalinks and the newest posts) are kept in the memory. Each poll asks for the newest
+posts only - the iteration stops on the first already archived post, i.e. usually on the first page.
+Every few hours the newest archived posts are listed again to refresh their expiring image URLs.
+
+The polling interval adapts to the observed posting cadence: it is kept short during a trip
+(when the trip hashtag posts are coming daily) and grows when nothing gets posted for a while.
+The feeds (and the merged ones) are rendered again only when new posts were found (or the posts were refreshed).
+
+Usage: python watch.py [feeds.json]
+"""
+import logging
+import statistics
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+import instagram
+import main
+from archive import read_archive, read_archive_state, merge_into_archive, split_new, REFRESH_ITEMS
+from facebook import FacebookPost, get_facebook_feed
+from graph_api import ResponseEntity
+from instagram import InstagramMedia, forget_ig_account, get_instagram_feed, ig_account_id_for_fb_page
+from merged_feed import render_merged_feed
+from orchestrator import FeedConfig, OrchestratorConfig, load_config, token_from_env
+from retry import ErrorKind, GraphApiError
+from update_feeds import CONFIG_PATH
+from utils import get_hashtags
+
+TRIP_HASHTAG = 'FarerskiDziennikZPodróży'
+
+
+@dataclass
+class AdaptivePolling:
+    """
+    Decides when to poll the feed again, based on the creation times of its recent posts
+    """
+    min_interval: float = 15 * 60
+    max_interval: float = 12 * 3600
+    # poll a few times between the posts, so that a new one shows up soon after it was published
+    polls_per_post: float = 4.0
+    # how many recent posts the cadence is computed from
+    window: int = 10
+    # the trip is on when its hashtag was posted within this period
+    trip_hashtag: str = TRIP_HASHTAG
+    trip_period: timedelta = timedelta(hours=36)
+    # how often the newest archived posts are listed again to refresh their signed image URLs
+    refresh_interval: float = 6 * 3600
+
+    def next_interval(self, recent: list[tuple[datetime, bool]], now: datetime) -> float:
+        """
+        Returns the number of seconds to wait for the next poll. recent lists (created_time, is trip post) tuples,
+        the newest post first.
+        """
+        if any(is_trip_post and now - created_time <= self.trip_period for created_time, is_trip_post in recent):
+            return self.min_interval
+
+        if len(recent) < 2:
+            return self.max_interval
+
+        times = [created_time for created_time, _ in recent[:self.window]]
+        cadence = statistics.median((newer - older).total_seconds() for newer, older in zip(times, times[1:]))
+
+        # the longer nothing was posted, the less often we poll
+        idle = (now - times[0]).total_seconds()
+
+        return min(self.max_interval, max(self.min_interval, max(cadence, idle) / self.polls_per_post))
+
+
+class WatchedFeed:
+    """
+    A single feed with its warm state: the archived permalinks, the newest posts and the resolved ids
+    """
+    def __init__(self, config: FeedConfig, access_token: str, polling: AdaptivePolling):
+        self.logger = logging.getLogger(f'{self.__class__.__name__}:{config.name}')
+
+        self.config = config
+        self.access_token = access_token
+        self.polling = polling
+
+        self.state = read_archive_state(config.archive)
+        self.recent: deque[tuple[datetime, bool]] = deque(
+            (self._recent_entry(entity) for entity in islice(self._read_archive(), polling.window)),
+            maxlen=polling.window
+        )
+
+        self.ig_account: Optional[str] = None
+        self.next_poll_at = 0.0
+        self.next_refresh_at = 0.0
+        self.failures = 0
+
+    def _read_archive(self):
+        try:
+            yield from read_archive(self.config.archive,
+                                    FacebookPost if self.config.type == 'facebook' else InstagramMedia)
+        except FileNotFoundError:
+            return
+
+    def _recent_entry(self, entity: ResponseEntity) -> tuple[datetime, bool]:
+        hashtags = {hashtag.lower() for hashtag in get_hashtags(entity.message or '')}
+        return entity.created_time, self.polling.trip_hashtag.lower() in hashtags
+
+    def fetch(self, refresh: bool = False) -> list[ResponseEntity]:
+        """
+        Returns the posts that are not archived yet (and the newest archived ones with refresh=True), the newest first
+        """
+        if self.config.type == 'facebook':
+            return list(get_facebook_feed(
+                self.config.page, self.access_token, items_limit=300,
+                since=None if refresh else self.state.newest_created_time,
+                known_permalinks=self.state.permalinks, hydrate=True, refresh=REFRESH_ITEMS if refresh else 0
+            ))
+
+        if self.ig_account is None:
+            self.ig_account = ig_account_id_for_fb_page(fb_page=self.config.page, access_token=self.access_token)
+
+        try:
+            return list(get_instagram_feed(self.ig_account, self.access_token, known_permalinks=self.state.permalinks,
+                                           refresh=REFRESH_ITEMS if refresh else 0))
+        except GraphApiError as ex:
+            # e.g. the account id is no longer valid, resolve it again on the next poll
+            if ex.kind is ErrorKind.FATAL:
+                self.ig_account = None
+                forget_ig_account(self.config.page)
+            raise
+
+    def poll(self, refresh: bool = False) -> int:
+        """
+        Fetches the new posts (refreshing the newest archived ones as well with refresh=True) and renders the feed
+        when there are any. Returns the number of new posts.
+        """
+        new_items, refreshed = split_new(self.fetch(refresh), self.state.permalinks)
+
+        if new_items or refreshed:
+            merge_into_archive(self.config.archive, new_items, refreshed)
+
+            for entity in reversed(new_items):
+                self.state.permalinks.add(entity.permalink_url)
+                self.recent.appendleft(self._recent_entry(entity))
+
+            newest = max((entity.created_time for entity in new_items), default=None)
+            if newest and (self.state.newest_created_time is None or newest > self.state.newest_created_time):
+                self.state.newest_created_time = newest
+
+            render = main.render_rss_feed if self.config.type == 'facebook' else instagram.render_rss_feed
+            render(self.config.archive, self.config.rss, self.config.channel or None)
+
+        return len(new_items)
+
+    def schedule(self, now: float):
+        """
+        Sets the time of the next poll, based on the posting cadence
+        """
+        # the created times are in UTC
+        utc_now = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None)
+        interval = self.polling.next_interval(list(self.recent), utc_now)
+
+        # back off on consecutive failures
+        if self.failures:
+            interval = min(self.polling.max_interval, self.polling.min_interval * 2 ** self.failures)
+
+        self.next_poll_at = now + interval
+        self.logger.info(f'Next poll in {interval / 60:.1f} min')
+
+
+class Watcher:
+    """
+    Polls the feeds when they are due, sleeps in between. The clock and sleep functions can be injected (e.g. in tests)
+    """
+    def __init__(self, config: OrchestratorConfig, token_for: Callable[[FeedConfig], str] = token_from_env,
+                 polling: Optional[AdaptivePolling] = None,
+                 clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.config = config
+        self.clock = clock
+        self.sleep = sleep
+
+        polling = polling or AdaptivePolling()
+        self.feeds = [WatchedFeed(feed, token_for(feed), polling) for feed in config.feeds]
+
+    def poll_due(self) -> dict[str, int]:
+        """
+        Polls the feeds that are due and renders the merged feeds of the changed (or refreshed) ones.
+        Returns the number of new posts for each polled feed.
+        """
+        now = self.clock()
+        polled = {}
+        refreshed = set()
+
+        for feed in self.feeds:
+            if feed.next_poll_at > now:
+                continue
+
+            refresh = feed.next_refresh_at <= now
+
+            try:
+                polled[feed.config.name] = feed.poll(refresh)
+                feed.failures = 0
+
+                if refresh:
+                    feed.next_refresh_at = now + feed.polling.refresh_interval
+                    refreshed.add(feed.config.name)
+            except Exception as ex:  # keep watching the other feeds
+                feed.failures += 1
+                self.logger.error(f'{feed.config.name}: poll failed - {ex!r}', exc_info=True)
+
+            feed.schedule(now)
+
+        changed = {name for name, new_items in polled.items() if new_items} | refreshed
+        archives = {feed.config.name: feed.config.archive for feed in self.feeds}
+
+        for entry in self.config.merged:
+            if changed & {entry.facebook, entry.instagram}:
+                render_merged_feed(archives[entry.facebook], archives[entry.instagram], entry.rss,
+                                   entry.channel or None)
+
+        if any(polled.values()):
+            self.logger.info(f'New posts: {polled}')
+
+        return polled
+
+    def run(self, max_polls: Optional[int] = None):
+        """
+        Keeps polling the feeds (max_polls rounds of the due feeds, forever by default)
+        """
+        rounds = 0
+
+        while max_polls is None or rounds < max_polls:
+            wait = min(feed.next_poll_at for feed in self.feeds) - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+
+            self.poll_due()
+            rounds += 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()  # take environment variables from .env.
+
+    Watcher(load_config(sys.argv[1] if len(sys.argv) > 1 else CONFIG_PATH)).run()